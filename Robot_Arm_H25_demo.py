@@ -13,6 +13,10 @@ The program waits for key presses and responds to the following keys:
 Before running the program ensure that you have binded the brick to rfcomm0
 (i.e. 'sudo rfcomm bind /dev/rfcomm0 XX:XX:XX:XX:XX:XX').
 
+Commands are sent from a background executor so holding a key down doesn't
+queue up more moves than the link can send. Each motor has its own key so a
+waiting move is replaced by the newest move for the same motor.
+
 """
 
 
@@ -33,69 +37,69 @@ def getch():
         termios.tcsetattr(fd, termios.TCSADRAIN, old)
 
 
-# Ensures that the claw is firmly closed.
-close_claw_cmd = direct_command.DirectCommand()
-close_claw_cmd.add_output_speed(direct_command.OutputPort.PORT_D, 10)
-close_claw_cmd.add_output_start(direct_command.OutputPort.PORT_D)
-close_claw_cmd.add_timer_wait(1000)
-close_claw_cmd.add_output_stop(direct_command.OutputPort.PORT_D,
-                                            direct_command.StopType.BRAKE)
-
-
-# Opens the claw about half way.
-open_claw_cmd = direct_command.DirectCommand()
-open_claw_cmd.add_output_speed(direct_command.OutputPort.PORT_D, -10)
-open_claw_cmd.add_output_start(direct_command.OutputPort.PORT_D)
-open_claw_cmd.add_timer_wait(600)
-open_claw_cmd.add_output_stop(direct_command.OutputPort.PORT_D,
-                                            direct_command.StopType.BRAKE)
-
-
-raise_claw_cmd = direct_command.DirectCommand()
-raise_claw_cmd.add_output_step_speed(direct_command.OutputPort.PORT_B,
+# The commands are built once (see the command_cache module) and sent as
+# often as needed.
+commands = command_cache.CommandSet('robot_arm_h25', {
+    # Ensures that the claw is firmly closed.
+    'close_claw': [
+        ('output_speed', direct_command.OutputPort.PORT_D, 10),
+        ('output_start', direct_command.OutputPort.PORT_D),
+        ('timer_wait', 1000),
+        ('output_stop', direct_command.OutputPort.PORT_D,
+                                            direct_command.StopType.BRAKE)],
+
+    # Opens the claw about half way.
+    'open_claw': [
+        ('output_speed', direct_command.OutputPort.PORT_D, -10),
+        ('output_start', direct_command.OutputPort.PORT_D),
+        ('timer_wait', 600),
+        ('output_stop', direct_command.OutputPort.PORT_D,
+                                            direct_command.StopType.BRAKE)],
+
+    'raise_claw': [
+        ('output_step_speed', direct_command.OutputPort.PORT_B,
                                             -15,
                                             0,
                                             20,
                                             10,
-                                            direct_command.StopType.BRAKE)
-raise_claw_cmd.add_output_ready(direct_command.OutputPort.PORT_B)
-raise_claw_cmd.add_keep_alive()
+                                            direct_command.StopType.BRAKE),
+        ('output_ready', direct_command.OutputPort.PORT_B),
+        ('keep_alive',)],
 
-
-lower_claw_cmd = direct_command.DirectCommand()
-lower_claw_cmd.add_output_step_speed(direct_command.OutputPort.PORT_B,
+    'lower_claw': [
+        ('output_step_speed', direct_command.OutputPort.PORT_B,
                                             15,
                                             0,
                                             20,
                                             10,
-                                            direct_command.StopType.BRAKE)
-lower_claw_cmd.add_output_ready(direct_command.OutputPort.PORT_B)
-lower_claw_cmd.add_keep_alive()
-
+                                            direct_command.StopType.BRAKE),
+        ('output_ready', direct_command.OutputPort.PORT_B),
+        ('keep_alive',)],
 
-swivel_left_cmd = direct_command.DirectCommand()
-swivel_left_cmd.add_output_step_speed(direct_command.OutputPort.PORT_C,
+    'swivel_left': [
+        ('output_step_speed', direct_command.OutputPort.PORT_C,
                                             -15,
                                             0,
                                             20,
                                             10,
-                                            direct_command.StopType.BRAKE)
-swivel_left_cmd.add_output_ready(direct_command.OutputPort.PORT_C)
-swivel_left_cmd.add_keep_alive()
-
+                                            direct_command.StopType.BRAKE),
+        ('output_ready', direct_command.OutputPort.PORT_C),
+        ('keep_alive',)],
 
-swivel_right_cmd = direct_command.DirectCommand()
-swivel_right_cmd.add_output_step_speed(direct_command.OutputPort.PORT_C,
+    'swivel_right': [
+        ('output_step_speed', direct_command.OutputPort.PORT_C,
                                             15,
                                             0,
                                             20,
                                             10,
-                                            direct_command.StopType.BRAKE)
-swivel_right_cmd.add_output_ready(direct_command.OutputPort.PORT_C)
-swivel_right_cmd.add_keep_alive()
+                                            direct_command.StopType.BRAKE),
+        ('output_ready', direct_command.OutputPort.PORT_C),
+        ('keep_alive',)]})
 
 
 if ("__main__" == __name__):
+    executor = async.PriorityExecutor()
+
     with ev3.EV3() as brick:
         print "Connection opened (press 'q' to quit)."
 
@@ -104,21 +108,41 @@ if ("__main__" == __name__):
 
             if ('c' == c):
                 print 'Opening claw.'
-                open_claw_cmd.send(brick)
+                executor.submit_latest(async.Lane.CONTROL,
+                                        direct_command.OutputPort.PORT_D,
+                                        commands['open_claw'].send,
+                                        brick)
             elif ('v' == c):
                 print 'Closing claw.'
-                close_claw_cmd.send(brick)
+                executor.submit_latest(async.Lane.CONTROL,
+                                        direct_command.OutputPort.PORT_D,
+                                        commands['close_claw'].send,
+                                        brick)
             elif ('w' == c):
                 print 'Raising claw.'
-                raise_claw_cmd.send(brick)
+                executor.submit_latest(async.Lane.CONTROL,
+                                        direct_command.OutputPort.PORT_B,
+                                        commands['raise_claw'].send,
+                                        brick)
             elif ('s' == c):
                 print 'Lowering claw.'
-                lower_claw_cmd.send(brick)
+                executor.submit_latest(async.Lane.CONTROL,
+                                        direct_command.OutputPort.PORT_B,
+                                        commands['lower_claw'].send,
+                                        brick)
             elif ('a' == c):
                 print 'Swivel left.'
-                swivel_left_cmd.send(brick)
+                executor.submit_latest(async.Lane.CONTROL,
+                                        direct_command.OutputPort.PORT_C,
+                                        commands['swivel_left'].send,
+                                        brick)
             elif ('d' == c):
                 print 'Swivel right.'
-                swivel_right_cmd.send(brick)
+                executor.submit_latest(async.Lane.CONTROL,
+                                        direct_command.OutputPort.PORT_C,
+                                        commands['swivel_right'].send,
+                                        brick)
             elif ('q' == c):
                 break
+
+        executor.stop()
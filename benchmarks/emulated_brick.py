@@ -0,0 +1,252 @@
+"""An in-process stand-in for a brick that is used by the benchmarks.
+
+An EmulatedBrick provides the parts of the serial.Serial interface that EV3
+objects use and answers the frames that are written to it right away, so the
+benchmarks measure the library rather than the radio. It keeps an in-memory
+filesystem and answers direct commands with zeroed global variables.
+
+The rtt_s and bytes_per_s parameters add a simple model of the link: each
+frame that expects a reply is delayed by rtt_s plus the time that its bytes
+would take at bytes_per_s.
+
+EXAMPLE USAGE:
+    import emulated_brick
+    from ev3 import system_command
+
+    brick = emulated_brick.connect()
+    brick._port.files['../prjs/log.rdf'] = '\\0' * 1024
+    print system_command.list_files(brick, '../prjs/')
+
+"""
+
+
+import hashlib
+import os
+import posixpath
+import struct
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from ev3 import ev3
+from ev3 import direct_command
+from ev3 import system_command
+
+
+Command = system_command.Command
+ReturnCode = system_command.ReturnCode
+
+
+class EmulatedBrick(object):
+    """Answers frames in the same manner as a brick."""
+
+
+    def __init__(self, rtt_s=0.0, bytes_per_s=None):
+        """Creates a brick with an empty filesystem."""
+        self.files = {}
+        self.dirs = set(['.', '..', '../prjs'])
+
+        self.rtt_s = rtt_s
+        self.bytes_per_s = bytes_per_s
+
+        self._handles = {}
+        self._next_handle = 0
+        self._in_buf = bytearray()
+        self._out_buf = bytearray()
+
+
+    def write(self, data):
+        self._in_buf += data
+
+        while (2 <= len(self._in_buf)):
+            frame_len = struct.unpack_from('<H', bytes(self._in_buf[:2]))[0]
+
+            if (len(self._in_buf) < (2 + frame_len)):
+                break
+
+            frame = self._in_buf[2:(2 + frame_len)]
+            del self._in_buf[:(2 + frame_len)]
+
+            self._handle_frame(frame)
+
+        return len(data)
+
+
+    def read(self, num_bytes):
+        if (len(self._out_buf) < num_bytes):
+            raise IOError('Read of %d bytes with %d buffered.' %
+                                            (num_bytes, len(self._out_buf)))
+
+        data = bytes(self._out_buf[:num_bytes])
+        del self._out_buf[:num_bytes]
+
+        return data
+
+
+    def readinto(self, buf):
+        num_bytes = min(len(buf), len(self._out_buf))
+
+        buf[:num_bytes] = self._out_buf[:num_bytes]
+        del self._out_buf[:num_bytes]
+
+        return num_bytes
+
+
+    def inWaiting(self):
+        return len(self._out_buf)
+
+
+    def close(self):
+        pass
+
+
+    def _handle_frame(self, frame):
+        message_counter = (frame[0] | (frame[1] << 8))
+        command_type = frame[2]
+
+        if (command_type in (direct_command.CommandType.DIRECT_COMMAND_REPLY,
+                        direct_command.CommandType.DIRECT_COMMAND_NO_REPLY)):
+            if (direct_command.CommandType.DIRECT_COMMAND_REPLY ==
+                                                                command_type):
+                global_len = (frame[3] | ((frame[4] & 0x03) << 8))
+                self._reply(message_counter, len(frame),
+                                    bytearray([direct_command.ReplyType.
+                                        DIRECT_REPLY]) + bytearray(global_len))
+            return
+
+        command = frame[3]
+        payload = frame[4:]
+
+        reply = self._handle_system_command(command, payload)
+
+        if (system_command.CommandType.SYSTEM_COMMAND_REPLY == command_type):
+            if (reply is None):
+                reply = (ReturnCode.SUCCESS, bytearray())
+
+            return_code, data = reply
+
+            reply_type = system_command.ReplyType.SYSTEM_REPLY
+            if (return_code not in (ReturnCode.SUCCESS,
+                                                    ReturnCode.END_OF_FILE)):
+                reply_type = system_command.ReplyType.SYSTEM_REPLY_ERROR
+
+            self._reply(message_counter, len(frame),
+                        bytearray([reply_type, command, return_code]) + data)
+
+
+    def _handle_system_command(self, command, payload):
+        if (Command.LIST_FILES == command):
+            max_len = struct.unpack_from('<H', bytes(payload[:2]))[0]
+            listing = self._listing(_path(payload[2:]))
+            return self._begin(listing, max_len)
+        elif (Command.BEGIN_UPLOAD == command):
+            max_len = struct.unpack_from('<H', bytes(payload[:2]))[0]
+            path_str = _path(payload[2:])
+
+            if (path_str not in self.files):
+                return (ReturnCode.UNKNOWN_ERROR, bytearray(5))
+
+            return self._begin(bytearray(self.files[path_str]), max_len)
+        elif (command in (Command.CONTINUE_LIST_FILES,
+                                                Command.CONTINUE_UPLOAD)):
+            handle = payload[0]
+            max_len = struct.unpack_from('<H', bytes(payload[1:3]))[0]
+            return self._continue(handle, max_len)
+        elif (Command.BEGIN_DOWNLOAD == command):
+            size = struct.unpack_from('<I', bytes(payload[:4]))[0]
+            handle = self._new_handle([_path(payload[4:]), size, bytearray()])
+            return (ReturnCode.SUCCESS, bytearray([handle]))
+        elif (Command.CONTINUE_DOWNLOAD == command):
+            handle = payload[0]
+            path_str, size, data = self._handles[handle]
+            data += payload[1:]
+
+            if (size > len(data)):
+                return (ReturnCode.SUCCESS, bytearray([handle]))
+
+            self.files[path_str] = bytes(data)
+            del self._handles[handle]
+
+            return (ReturnCode.END_OF_FILE, bytearray([handle]))
+        elif (Command.CLOSE_FILEHANDLE == command):
+            self._handles.pop(payload[0], None)
+        elif (Command.CREATE_DIR == command):
+            self.dirs.add(_path(payload))
+        elif (Command.DELETE_FILE == command):
+            path_str = _path(payload)
+            self.files.pop(path_str, None)
+            self.dirs.discard(path_str)
+        else:
+            return (ReturnCode.UNKNOWN_ERROR, bytearray())
+
+        return None
+
+
+    def _begin(self, data, max_len):
+        handle = self._new_handle(data[max_len:])
+
+        return_code = ReturnCode.SUCCESS
+        if (len(data) <= max_len):
+            return_code = ReturnCode.END_OF_FILE
+            del self._handles[handle]
+
+        return (return_code, (bytearray(struct.pack('<IB', len(data),
+                                                handle)) + data[:max_len]))
+
+
+    def _continue(self, handle, max_len):
+        data = self._handles[handle]
+        self._handles[handle] = data[max_len:]
+
+        return_code = ReturnCode.SUCCESS
+        if (len(data) <= max_len):
+            return_code = ReturnCode.END_OF_FILE
+            del self._handles[handle]
+
+        return (return_code, (bytearray([handle]) + data[:max_len]))
+
+
+    def _new_handle(self, value):
+        self._next_handle = ((self._next_handle + 1) & 0xFF)
+        self._handles[self._next_handle] = value
+        return self._next_handle
+
+
+    def _listing(self, path_str):
+        lines = ['./', '../']
+
+        for d in sorted(self.dirs):
+            if (d != path_str and posixpath.dirname(d) == path_str):
+                lines.append(posixpath.basename(d) + '/')
+
+        for f in sorted(self.files):
+            if (posixpath.dirname(f) == path_str):
+                data = self.files[f]
+                lines.append('%s %08X %s' % (hashlib.md5(data).hexdigest().
+                                upper(), len(data), posixpath.basename(f)))
+
+        return bytearray('\n'.join(lines) + '\n')
+
+
+    def _reply(self, message_counter, frame_len, reply):
+        if (self.rtt_s or self.bytes_per_s):
+            delay = self.rtt_s
+            if (self.bytes_per_s):
+                delay += ((frame_len + len(reply) + 8) /
+                                                    float(self.bytes_per_s))
+            time.sleep(delay)
+
+        self._out_buf += struct.pack('<HH', (2 + len(reply)), message_counter)
+        self._out_buf += reply
+
+
+def connect(rtt_s=0.0, bytes_per_s=None):
+    """Returns an open EV3 object that is attached to a new EmulatedBrick."""
+    ev3_obj = ev3.EV3()
+    ev3_obj._port = EmulatedBrick(rtt_s, bytes_per_s)
+    return ev3_obj
+
+
+def _path(byte_seq):
+    return posixpath.normpath(str(byte_seq).rstrip('\0'))
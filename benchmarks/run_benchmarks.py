@@ -0,0 +1,451 @@
+"""Measures the performance of the library and compares it with a baseline.
+
+Every benchmark reports a rate (higher is better) that is the median of
+several repeats, each of which runs the benchmark for at least
+DEFAULT_MIN_TIME_S seconds. The baseline file stores the rate of each
+benchmark along with the fraction by which it may drop before it is
+reported as a regression (max_regression). The script exits with a
+non-zero status if any benchmark regressed.
+
+The transfer benchmarks run against an EmulatedBrick so they measure the
+time that the library spends framing, building, and parsing rather than the
+time that the radio takes.
+
+EXAMPLE USAGE:
+    % python benchmarks/run_benchmarks.py
+    % python benchmarks/run_benchmarks.py --only upload --repeat 10
+    % python benchmarks/run_benchmarks.py --processes 3
+    % python benchmarks/run_benchmarks.py --update-baseline
+
+"""
+
+
+import argparse
+import collections
+import gc
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+# The ev3 package is found in the parent directory whether or not it has been
+# installed.
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                                        '..'))
+
+import emulated_brick
+
+from ev3 import direct_command
+from ev3 import message
+from ev3 import system_command
+
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                            'baseline.json')
+DEFAULT_REPEAT = 7
+# Runs of the same tree on a busy machine differ from the median of several
+# runs by up to about 20%.
+DEFAULT_MAX_REGRESSION = 0.3
+
+# The speed of the whole process varies from one run to the next so the
+# baseline is the median of this many separate processes.
+DEFAULT_BASELINE_PROCESSES = 5
+
+# Each repeat calls a benchmark's step until this much time has passed so
+# that short steps aren't dominated by timer resolution and scheduling.
+DEFAULT_MIN_TIME_S = 0.2
+
+# The number of bytes in the transfer benchmarks.
+TRANSFER_BYTES = (256 * 1024)
+
+# The number of files in the listing benchmark.
+LISTING_FILES = 2000
+
+
+class _NullPort(object):
+    """A port that discards everything that is written to it."""
+
+
+    def write(self, data):
+        return len(data)
+
+
+class _ReplayPort(object):
+    """A port that returns the same frame each time that one is read."""
+
+
+    def __init__(self, frame):
+        self._frame = frame
+        self._index = 0
+
+
+    def read(self, num_bytes):
+        data = self._frame[self._index:(self._index + num_bytes)]
+        self._index = ((self._index + num_bytes) % len(self._frame))
+        return data
+
+
+class _BurstPort(object):
+    """A port that has a burst of copies of the same frame waiting whenever
+    it runs dry.
+
+    """
+
+
+    def __init__(self, frame, count):
+        self._data = (frame * count)
+        self._index = 0
+
+
+    def read(self, num_bytes):
+        data = self._data[self._index:(self._index + num_bytes)]
+        self._index += len(data)
+
+        if (len(self._data) == self._index):
+            self._index = 0
+
+        return data
+
+
+    def inWaiting(self):
+        return (len(self._data) - self._index)
+
+
+def bench_dc_build():
+    """DirectCommands with a representative mix of motor, sensor, and UI
+    commands built per second.
+
+    """
+    return _build_commands(direct_command.DirectCommand)
+
+
+def bench_dc_build_compact():
+    """CompactDirectCommands with the same mix of commands as dc_build built
+    per second.
+
+    """
+    return _build_commands(direct_command.CompactDirectCommand)
+
+
+def _build_commands(command_class):
+    def step():
+        cmd = command_class()
+        cmd.add_output_speed(direct_command.OutputPort.PORT_B, 50)
+        cmd.add_output_start(direct_command.OutputPort.PORT_B)
+        cmd.add_input_device_ready_si(direct_command.InputPort.PORT_1)
+        cmd.add_input_device_ready_raw(direct_command.InputPort.PORT_2)
+        cmd.add_ui_read_get_vbatt()
+        cmd.add_ui_draw_text(direct_command.LCDColor.FOREGROUND, (0, 0),
+                                                                'Status: OK')
+        cmd.add_ui_draw_update()
+        return 1
+
+    return step
+
+
+def bench_parse_reply():
+    """Reply values parsed per second."""
+    cmd = direct_command.DirectCommand()
+    for port in range(4):
+        cmd.add_input_device_ready_si(port)
+        cmd.add_input_device_ready_raw(port)
+    cmd.add_ui_read_get_vbatt()
+    cmd.add_ui_read_get_fw_vers()
+
+    reply = bytearray([direct_command.ReplyType.DIRECT_REPLY] +
+                                    ([0] * cmd._global_params_byte_count))
+
+    def step():
+        return len(cmd._parse_reply(reply))
+
+    return step
+
+
+def bench_message_encode():
+    """Bytes framed and written per second."""
+    port = _NullPort()
+    msg = bytearray([system_command.CommandType.SYSTEM_COMMAND_NO_REPLY] +
+                                        ([0x55] * system_command.MAX_TX_BYTES))
+
+    def step():
+        message.write_message(port, msg)
+        return len(msg)
+
+    return step
+
+
+def bench_message_decode():
+    """Bytes read and unframed per second."""
+    msg = ([system_command.ReplyType.SYSTEM_REPLY] +
+                                    ([0x55] * system_command.MAX_REPLY_BYTES))
+
+    port = _ReplayPort(bytes(message.frame_message(msg, 0x1234)))
+
+    def step():
+        message.read_message(port)
+        return len(msg)
+
+    return step
+
+
+def bench_reply_burst():
+    """Replies read per second when the replies to a window of pipelined
+    messages arrive together.
+
+    """
+    reply = bytearray([direct_command.ReplyType.DIRECT_REPLY] + ([0] * 8))
+
+    port = _BurstPort(bytes(message.frame_message(reply, 0x1234)), 16)
+    reader = message.FrameReader(port)
+
+    def step():
+        message.read_reply(port, None, reader)
+        return 1
+
+    return step
+
+
+def bench_list_files():
+    """Entries of a large listing fetched and parsed per second."""
+    ev3_obj = emulated_brick.connect()
+    for i in range(LISTING_FILES):
+        ev3_obj._port.files['../prjs/log_%05d.rdf' % i] = ''
+
+    def step():
+        dirs, files = system_command.list_files(ev3_obj, '../prjs/')
+        return len(files)
+
+    return step
+
+
+def bench_upload():
+    """MB per second uploaded from an emulated brick."""
+    ev3_obj = emulated_brick.connect()
+    ev3_obj._port.files['../prjs/big.rdf'] = ('\x55' * TRANSFER_BYTES)
+
+    def step():
+        system_command.upload_file(ev3_obj, '../prjs/big.rdf')
+        return (TRANSFER_BYTES / (1024.0 * 1024.0))
+
+    return step
+
+
+def bench_download():
+    """MB per second downloaded to an emulated brick."""
+    ev3_obj = emulated_brick.connect()
+    data = bytearray('\x55' * TRANSFER_BYTES)
+
+    def step():
+        system_command.download_file(ev3_obj, '../prjs/big.rdf', data)
+        return (TRANSFER_BYTES / (1024.0 * 1024.0))
+
+    return step
+
+
+# Each benchmark function does its setup and returns a step function that
+# does one unit of work and returns the amount of work in the benchmark's
+# unit.
+BENCHMARKS = collections.OrderedDict([
+    ('dc_build',        (bench_dc_build, 'commands/s')),
+    ('dc_build_compact', (bench_dc_build_compact, 'commands/s')),
+    ('parse_reply',     (bench_parse_reply, 'values/s')),
+    ('message_encode',  (bench_message_encode, 'bytes/s')),
+    ('message_decode',  (bench_message_decode, 'bytes/s')),
+    ('reply_burst',     (bench_reply_burst, 'replies/s')),
+    ('list_files',      (bench_list_files, 'entries/s')),
+    ('upload',          (bench_upload, 'MB/s')),
+    ('download',        (bench_download, 'MB/s')),
+])
+
+
+def run(names, repeat, min_time_s=DEFAULT_MIN_TIME_S):
+    """Returns an OrderedDict of benchmark names to the median of their
+    rates over repeat runs.
+
+    """
+    results = collections.OrderedDict()
+
+    for name in names:
+        fn, unit = BENCHMARKS[name]
+        step = fn()
+
+        # One untimed step warms up caches and lazy imports.
+        step()
+
+        rates = sorted(_measure(step, min_time_s) for i in range(repeat))
+        results[name] = rates[len(rates) // 2]
+
+    return results
+
+
+def run_in_processes(names, repeat, min_time_s, processes):
+    """Runs the benchmarks in the given number of separate processes, one
+    after another. Returns an OrderedDict of benchmark names to the median
+    of their rates over the processes.
+
+    """
+    runs = []
+
+    for i in range(processes):
+        command = [sys.executable, os.path.abspath(__file__), '--json',
+                                            '--repeat', str(repeat),
+                                            '--min-time', str(min_time_s)]
+        for name in names:
+            command.extend(['--only', name])
+
+        runs.append(json.loads(subprocess.check_output(command)))
+
+    results = collections.OrderedDict()
+
+    for name in names:
+        rates = sorted(r[name] for r in runs)
+        middle = (len(rates) // 2)
+
+        if (len(rates) % 2):
+            results[name] = rates[middle]
+        else:
+            results[name] = ((rates[middle - 1] + rates[middle]) / 2.0)
+
+    return results
+
+
+def _measure(step, min_time_s):
+    """Calls step until min_time_s has passed. Returns the amount of work
+    that the calls returned per second.
+
+    """
+    work = 0
+
+    gc_enabled = gc.isenabled()
+    gc.disable()
+
+    try:
+        start = time.time()
+
+        while (True):
+            work += step()
+
+            elapsed_s = (time.time() - start)
+            if (min_time_s <= elapsed_s):
+                return (work / elapsed_s)
+    finally:
+        if (gc_enabled):
+            gc.enable()
+
+
+def compare(results, baseline):
+    """Returns a list of (NAME, RATE, BASELINE_RATE, CHANGE, REGRESSED)
+    tuples. CHANGE is the fractional change from the baseline or None if the
+    benchmark isn't in the baseline.
+
+    """
+    comparison = []
+
+    for name, rate in results.items():
+        entry = baseline.get('benchmarks', {}).get(name)
+
+        if (entry is None):
+            comparison.append((name, rate, None, None, False))
+            continue
+
+        change = ((rate - entry['value']) / entry['value'])
+        max_regression = entry.get('max_regression', DEFAULT_MAX_REGRESSION)
+
+        comparison.append((name, rate, entry['value'], change,
+                                                (change < -max_regression)))
+
+    return comparison
+
+
+def write_baseline(path_str, results, baseline):
+    """Writes the results to the baseline file. The max_regression of each
+    benchmark that is already in the baseline is kept.
+
+    """
+    benchmarks = {}
+
+    for name, rate in results.items():
+        entry = baseline.get('benchmarks', {}).get(name, {})
+
+        benchmarks[name] = {'value': rate,
+                            'unit': BENCHMARKS[name][1],
+                            'max_regression': entry.get('max_regression',
+                                                    DEFAULT_MAX_REGRESSION)}
+
+    for name, entry in baseline.get('benchmarks', {}).items():
+        benchmarks.setdefault(name, entry)
+
+    with open(path_str, 'w') as out_file:
+        json.dump({'python': platform.python_version(),
+                    'platform': platform.platform(),
+                    'benchmarks': benchmarks},
+                    out_file, indent=4, separators=(',', ': '),
+                    sort_keys=True)
+        out_file.write('\n')
+
+
+if ("__main__" == __name__):
+    parser = argparse.ArgumentParser(description='Runs the benchmarks.')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE,
+                                help='the baseline file to compare with')
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT,
+                                help='the number of times to run each one')
+    parser.add_argument('--min-time', type=float, dest='min_time_s',
+                                default=DEFAULT_MIN_TIME_S,
+                                help='the seconds that each repeat runs for')
+    parser.add_argument('--only', action='append', choices=list(BENCHMARKS),
+                                help='a benchmark to run (can be repeated)')
+    parser.add_argument('--processes', type=int,
+                                help=('the number of separate processes to ' +
+                                    'take the median of (default: 1 or %d ' +
+                                    'with --update-baseline)') %
+                                                DEFAULT_BASELINE_PROCESSES)
+    parser.add_argument('--update-baseline', action='store_true',
+                                help='write the results to the baseline file')
+    parser.add_argument('--json', action='store_true',
+                                help='print the results as JSON and exit')
+    args = parser.parse_args()
+
+    names = (args.only or list(BENCHMARKS))
+
+    if (args.json):
+        print json.dumps(run(names, args.repeat, args.min_time_s))
+        sys.exit(0)
+
+    baseline = {}
+    if (os.path.exists(args.baseline)):
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+
+    processes = args.processes
+    if (processes is None):
+        processes = (DEFAULT_BASELINE_PROCESSES if args.update_baseline
+                                                                    else 1)
+
+    if (1 < processes):
+        results = run_in_processes(names, args.repeat, args.min_time_s,
+                                                                processes)
+    else:
+        results = run(names, args.repeat, args.min_time_s)
+
+    regressed = False
+    for name, rate, baseline_rate, change, is_regression in compare(results,
+                                                                    baseline):
+        line = '%-16s %14.1f %-11s' % (name, rate, BENCHMARKS[name][1])
+
+        if (change is not None):
+            line += ' %+7.1f%%' % (change * 100)
+
+        if (is_regression):
+            line += '  REGRESSION'
+            regressed = True
+
+        print line
+
+    if (args.update_baseline):
+        write_baseline(args.baseline, results, baseline)
+        print 'Wrote %s.' % args.baseline
+    elif (regressed):
+        sys.exit(1)
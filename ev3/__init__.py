@@ -1,5 +1,66 @@
-import ev3
-import message
-import direct_command
-import system_command
-import async
+"""Python modules for controlling a Lego Mindstorms EV3 brick.
+
+The submodules are imported the first time that they are used (i.e.
+ev3.direct_command or 'from ev3 import message') so importing the package
+is cheap. 'from ev3 import *' imports all of them.
+
+"""
+
+
+import sys
+import types
+
+
+__all__ = [
+    'ev3',
+    'message',
+    'direct_command',
+    'system_command',
+    'async',
+    'fs_cache',
+    'transfer',
+    'mailbox',
+    'batch',
+    'fleet',
+    'gateway',
+    'trace',
+    'stats',
+    'adaptive',
+    'command_cache',
+    'tables',
+    'query_cache',
+    'inventory',
+    'read_planner',
+]
+
+
+class _LazyPackage(types.ModuleType):
+    """Stands in for the package module and imports a submodule when one of
+    the names in __all__ is looked up for the first time.
+
+    """
+
+
+    def __getattr__(self, name):
+        if (name not in __all__):
+            raise AttributeError("'module' object has no attribute '%s'" %
+                                                                        name)
+
+        # Importing a submodule sets it as an attribute of the package so this
+        # isn't called again for the same name.
+        __import__('%s.%s' % (self.__name__, name))
+        return sys.modules['%s.%s' % (self.__name__, name)]
+
+
+    def __dir__(self):
+        return sorted(set(self.__dict__) | set(__all__))
+
+
+_package = _LazyPackage(__name__, __doc__)
+_package.__dict__.update(sys.modules[__name__].__dict__)
+
+# The functions above use this module's globals, which Python 2 clears when
+# the module is deleted, so the replacement keeps a reference to it.
+_package._module = sys.modules[__name__]
+
+sys.modules[__name__] = _package
@@ -0,0 +1,163 @@
+"""Sizes batches and transfer windows from measurements of the link.
+
+The time that a message takes is modelled as a fixed round trip time plus a
+time per byte (airtime). An AdaptiveController keeps both estimates up to
+date with a least-squares fit over recent messages in which older messages
+count for less. From the model and a latency target it decides:
+
+  - How many bytes a single message may hold before its round trip is
+    expected to miss the target. The CommandBatcher turns this into the
+    number of queued commands that it packs into each DirectCommand.
+  - How long the CommandBatcher waits for other threads' commands.
+  - How many chunks a download keeps in flight: enough to keep the link
+    busy during a round trip, but not so many that a command that is sent
+    behind them would miss the target.
+
+Set an EV3 object's controller attribute to an AdaptiveController to use it
+(it is None by default). Downloads that aren't given a window_size and
+batches that are sent by the EV3 object's CommandBatcher are then sized by
+the controller.
+
+EXAMPLE USAGE:
+    from ev3 import *
+
+    with ev3.EV3(batch_window_s=0.005) as brick:
+        brick.controller = adaptive.AdaptiveController(latency_target_s=0.1)
+
+        system_command.download_file(brick, '../prjs/log.rdf', data)
+
+        print brick.controller.base_rtt_s, brick.controller.s_per_byte
+
+"""
+
+
+import math
+import threading
+
+import direct_command
+
+
+DEFAULT_LATENCY_TARGET_S = 0.1
+
+# Roughly what a brick on a good RFCOMM link manages (115200 baud is about
+# 87us per byte before any framing overhead).
+DEFAULT_BASE_RTT_S = 0.03
+DEFAULT_S_PER_BYTE = (10.0 / 115200)
+
+# How much of the fit each older message keeps.
+DEFAULT_DECAY = 0.95
+
+MAX_WINDOW_SIZE = 16
+
+# The smallest message that the controller will ask for so that a single
+# command always fits.
+MIN_FRAME_BYTES = 64
+
+# Length/message_counter header of the message and of its reply.
+_OVERHEAD_BYTES = 8
+
+
+class AdaptiveController(object):
+    """Fits the link model and derives batch and window sizes from it."""
+
+
+    def __init__(self, latency_target_s=DEFAULT_LATENCY_TARGET_S,
+                                base_rtt_s=DEFAULT_BASE_RTT_S,
+                                s_per_byte=DEFAULT_S_PER_BYTE,
+                                decay=DEFAULT_DECAY):
+        """Creates a controller that starts from the given estimates."""
+        self.latency_target_s = latency_target_s
+        self.base_rtt_s = base_rtt_s
+        self.s_per_byte = s_per_byte
+        self.decay = decay
+
+        self._lock = threading.Lock()
+
+        # Weighted sums for the least-squares fit of elapsed_s on num_bytes.
+        self._w = 0.0
+        self._x = 0.0
+        self._y = 0.0
+        self._xx = 0.0
+        self._xy = 0.0
+
+
+    def record(self, num_bytes, elapsed_s):
+        """Adds a round trip that moved num_bytes (the message and its reply,
+        including their headers) in elapsed_s seconds to the fit.
+
+        """
+        with self._lock:
+            self._w = ((self._w * self.decay) + 1.0)
+            self._x = ((self._x * self.decay) + num_bytes)
+            self._y = ((self._y * self.decay) + elapsed_s)
+            self._xx = ((self._xx * self.decay) + (num_bytes * num_bytes))
+            self._xy = ((self._xy * self.decay) + (num_bytes * elapsed_s))
+
+            mean_x = (self._x / self._w)
+            mean_y = (self._y / self._w)
+            var_x = ((self._xx / self._w) - (mean_x * mean_x))
+
+            if (1.0 < var_x):
+                slope = (((self._xy / self._w) - (mean_x * mean_y)) / var_x)
+
+                if (0 < slope):
+                    self.s_per_byte = slope
+
+            # With messages of similar sizes only the base can be refined.
+            self.base_rtt_s = max(0.0, (mean_y - (self.s_per_byte * mean_x)))
+
+
+    def record_msg(self, msg_len, reply_len, elapsed_s):
+        """Adds a round trip of a message and its reply (neither including
+        the length/message_counter header) to the fit.
+
+        """
+        self.record((msg_len + reply_len + _OVERHEAD_BYTES), elapsed_s)
+
+
+    def predict_s(self, num_bytes):
+        """Returns the expected round trip time of num_bytes."""
+        return (self.base_rtt_s + (self.s_per_byte * num_bytes))
+
+
+    def max_frame_bytes(self):
+        """Returns the largest message (in bytes) that is expected to make the
+        round trip within the latency target.
+
+        """
+        budget_s = (self.latency_target_s - self.base_rtt_s)
+        num_bytes = int(budget_s / self.s_per_byte) - _OVERHEAD_BYTES
+
+        return max(MIN_FRAME_BYTES, min(direct_command.MAX_CMD_LEN,
+                                                                num_bytes))
+
+
+    def batch_size(self, command_bytes):
+        """Returns how many commands of command_bytes bytes each to pack into
+        a single DirectCommand.
+
+        """
+        return max(1, (self.max_frame_bytes() // max(1, command_bytes)))
+
+
+    def batch_window_s(self):
+        """Returns how long a batch should wait for more commands: whatever
+        is left of the latency target after a full message's round trip.
+
+        """
+        return max(0.0, (self.latency_target_s -
+                                    self.predict_s(self.max_frame_bytes())))
+
+
+    def window_size(self, frame_bytes):
+        """Returns how many frames of frame_bytes bytes each to keep in flight.
+        Enough frames are sent to cover a round trip but a message that is
+        queued behind the window must still be able to meet the target.
+
+        """
+        airtime_s = max((self.s_per_byte * frame_bytes), 1e-9)
+
+        fill = int(math.ceil(self.predict_s(frame_bytes) / airtime_s))
+        limit = int(self.latency_target_s / airtime_s)
+
+        return max(1, min(MAX_WINDOW_SIZE, fill, limit))
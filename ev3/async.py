@@ -1,91 +1,299 @@
-"""A simple thread subclass for making ev3 function calls asynchronous.
+"""An executor for making ev3 function calls asynchronous.
 
-EXAMPLE USAGE:
-    import time
-
-    from ev3 import *
+Calls are submitted to one of several priority lanes and executed, one at a
+time, by a single worker thread so that they never interleave on the link.
+The worker always takes the next call from the highest-priority lane that
+isn't empty. Long transfers in the system_command module also check for
+higher-priority calls between chunks (see preemption_point) so an emergency
+stop doesn't have to wait for an upload to finish.
 
+Calls that are superseded by newer ones (i.e. motor speeds from a teleop
+client) can be submitted with submit_latest. A waiting call is replaced by a
+newer call with the same key so the queue never holds more than one call
+per key and the latency stays bounded no matter how fast calls arrive.
 
-    finished = False
+Each call returns a concurrent.futures.Future (on Python 2 this requires
+the 'futures' package). Exceptions that are raised by a call are set on its
+future instead of stopping the worker thread. KeyboardInterrupt and
+SystemExit still propagate.
 
-
-    def keep_alive_finished(result):
-        global finished
-        print 'The keep_alive() function returned: ', result
-        finished = True
+EXAMPLE USAGE:
+    from ev3 import *
 
 
     if ("__main__" == __name__):
-        try:
-            async_thread = async.AsyncThread()
+        executor = async.PriorityExecutor()
 
-            with ev3.EV3() as brick:
-                async_thread.put(brick.keep_alive, keep_alive_finished)
+        with ev3.EV3() as brick:
+            upload = executor.submit(async.Lane.BULK, brick.upload_file,
+                                                        '../prjs/log.rdf')
 
-                while (not finished):
-                    print 'Waiting...'
-                    time.sleep(0.1)
+            executor.submit(async.Lane.SAFETY, brick.output_stop,
+                                        direct_command.OutputPort.ALL,
+                                        direct_command.StopType.BRAKE)
 
-        except ev3.EV3Error as ex:
-            print 'An error occurred: ', ex
+            try:
+                print 'Uploaded %d bytes.' % len(upload.result())
+            except ev3.EV3Error as ex:
+                print 'An error occurred: ', ex
 
-        async_thread.stop()
+        executor.stop()
 
 """
 
 
+import collections
 import threading
-import Queue
 
+from concurrent import futures
+
+
+class Lane(object):
+    """The priority lanes in order from highest to lowest priority."""
+    SAFETY      = 0 # i.e. stopping motors
+    CONTROL     = 1 # i.e. setting motor speeds
+    TELEMETRY   = 2 # i.e. reading sensors
+    BULK        = 3 # i.e. file transfers
+
+    ALL         = (SAFETY, CONTROL, TELEMETRY, BULK)
 
-class AsyncThread(threading.Thread):
-    """A simple thread subclass maintains a queue of functions to call."""
 
+# Tracks the lane of the call that the current thread is executing (if the
+# current thread is a PriorityExecutor worker).
+_worker_state = threading.local()
 
-    _STOP_QUEUE_ITEM = 'STOP'
+
+class PriorityExecutor(object):
+    """Executes functions on a single worker thread in priority order."""
 
 
     def __init__(self):
-        """Creates and starts a new thread."""
-        super(AsyncThread, self).__init__()
+        """Creates and starts a new worker thread."""
+        self._condition = threading.Condition()
+        self._lanes = [collections.deque() for lane in Lane.ALL]
+        self._keyed_items = {}
+        self._stopping = False
 
-        self._daemon = True
-        self._queue = Queue.Queue()
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
 
-        self.start()
 
+    def submit(self, lane, fn, *args, **kwargs):
+        """Queues fn(*args, **kwargs) in the given Lane. Returns a Future that
+        holds its result.
 
-    def run(self):
-        """This function is called automatically by the Thread class."""
-        try:
-            while(True):
-                item = self._queue.get(block=True)
+        """
+        future = futures.Future()
+
+        with self._condition:
+            if (self._stopping):
+                raise RuntimeError('The executor has been stopped.')
+
+            self._lanes[lane].append([future, fn, args, kwargs, None])
+            self._condition.notify()
+
+        return future
+
+
+    def submit_latest(self, lane, key, fn, *args, **kwargs):
+        """Queues fn(*args, **kwargs) in the given Lane unless a call with the
+        same key is still waiting. In that case the waiting call is replaced
+        (it keeps its place in the queue) and its Future is cancelled. The key
+        can be any hashable value that identifies the target of the call,
+        i.e. (OutputPort.PORT_B, 'speed'). Returns a Future that holds the
+        result.
+
+        """
+        future = futures.Future()
+        superseded = None
+
+        with self._condition:
+            if (self._stopping):
+                raise RuntimeError('The executor has been stopped.')
+
+            item = self._keyed_items.get(key)
+
+            if (item is None):
+                item = [future, fn, args, kwargs, key]
+                self._keyed_items[key] = item
+                self._lanes[lane].append(item)
+                self._condition.notify()
+            else:
+                superseded = item[0]
+                item[:4] = [future, fn, args, kwargs]
+
+        if (superseded is not None):
+            superseded.cancel()
+
+        return future
+
+
+    def stop(self, wait=True):
+        """Instructs the worker thread to exit after the current function is
+        finished. Functions that haven't started yet are cancelled. If wait
+        is True then this blocks until the worker thread has exited.
+
+        """
+        with self._condition:
+            self._stopping = True
+
+            cancelled = []
+            for queue in self._lanes:
+                cancelled.extend(queue)
+                queue.clear()
+
+            self._keyed_items.clear()
+
+            self._condition.notify()
+
+        # Cancelling runs the futures' callbacks so don't hold the lock.
+        for item in cancelled:
+            item[0].cancel()
+
+        if (wait and threading.current_thread() is not self._thread):
+            self._thread.join()
+
+
+    def preemption_pending(self, lane):
+        """Returns True if a function is waiting in a lane with a higher
+        priority than the given lane.
+
+        """
+        for queue in self._lanes[:lane]:
+            if (queue):
+                return True
+
+        return False
+
+
+    def run_preempting(self, lane):
+        """Executes, on the calling thread, the functions that are waiting in
+        lanes with a higher priority than the given lane.
+
+        """
+        while (True):
+            with self._condition:
+                item, item_lane = self._pop(lane - 1)
+
+            if (item is None):
+                return
+
+            self._execute(item, item_lane)
 
-                if (self._STOP_QUEUE_ITEM == item):
-                    break
 
-                ev3_func, cb, args, kwargs = item
+    def _run(self):
+        while (True):
+            with self._condition:
+                item, item_lane = self._pop(Lane.BULK)
 
-                cb(ev3_func(*args, **kwargs))
+                while (item is None and not self._stopping):
+                    self._condition.wait()
+                    item, item_lane = self._pop(Lane.BULK)
 
-        except KeyboardInterrupt:
-            pass
+            if (item is None):
+                break
 
+            self._execute(item, item_lane)
 
-    def stop(self):
-        """Instructs the thread to exit after the current function is
-        finished.
+
+    def _pop(self, lowest_lane):
+        """Removes the next function from the highest-priority lane that is
+        not empty, considering lanes up to and including lowest_lane. Must be
+        called with the condition held.
 
         """
-        with self._queue.mutex:
-            self._queue.queue.clear()
+        for lane in Lane.ALL[:(lowest_lane + 1)]:
+            if (self._lanes[lane]):
+                item = self._lanes[lane].popleft()
+
+                if (item[4] is not None):
+                    del self._keyed_items[item[4]]
+
+                return (item, lane)
+
+        return (None, None)
+
+
+    def _execute(self, item, lane):
+        future, fn, args, kwargs, key = item
+
+        if (not future.set_running_or_notify_cancel()):
+            return
+
+        outer_state = getattr(_worker_state, 'current', None)
+        _worker_state.current = (self, lane)
+
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as ex:
+            future.set_exception(ex)
+        except BaseException as ex:
+            # KeyboardInterrupt and SystemExit go on to whoever is running
+            # the worker; the Future only fails so its waiters don't hang.
+            future.set_exception(ex)
+            raise
+        else:
+            future.set_result(result)
+        finally:
+            _worker_state.current = outer_state
+
 
-        self._queue.put(self._STOP_QUEUE_ITEM)
+class AsyncThread(PriorityExecutor):
+    """Runs every function in Lane.CONTROL and hands its result to a
+    callback. Kept for compatibility; new code should use PriorityExecutor.
+
+    """
 
 
     def put(self, ev3_func, cb, *args, **kwargs):
         """Adds a new function to the queue. The cb (callback) parameter should
-        be a function that accepts the result as its only parameter.
+        be a function that accepts the result as its only parameter. Returns a
+        Future that holds the callback's result or any exception raised by
+        either function.
+
+        """
+        return self.submit(Lane.CONTROL, _call_with_callback,
+                                                ev3_func, cb, args, kwargs)
+
+
+    def stop(self, wait=False):
+        """Same as PriorityExecutor.stop but, like the original AsyncThread,
+        doesn't wait for the worker thread by default.
 
         """
-        self._queue.put((ev3_func, cb, args, kwargs))
+        PriorityExecutor.stop(self, wait)
+
+
+def preemption_pending():
+    """Returns True if the current thread is executing a function for a
+    PriorityExecutor and a function with a higher priority is waiting.
+
+    """
+    state = getattr(_worker_state, 'current', None)
+
+    if (state is None):
+        return False
+
+    executor, lane = state
+
+    return executor.preemption_pending(lane)
+
+
+def preemption_point():
+    """Called between the chunks of long operations. If the current thread is
+    executing a function for a PriorityExecutor then any waiting functions
+    with a higher priority are executed before this returns.
+
+    NOTE:   The caller must not have any replies outstanding on the link.
+
+    """
+    state = getattr(_worker_state, 'current', None)
+
+    if (state is not None):
+        executor, lane = state
+        executor.run_preempting(lane)
+
+
+def _call_with_callback(ev3_func, cb, args, kwargs):
+    return cb(ev3_func(*args, **kwargs))
@@ -0,0 +1,225 @@
+"""Merges the DirectCommands that several threads send through one EV3 object.
+
+Every DirectCommand that expects a reply costs a full round trip over the
+link so threads that each send small commands spend most of their time
+waiting for each other. A CommandBatcher holds the first command that
+arrives for a short window, adds the commands that other threads send
+during that window to the same DirectCommand, and sends them together. Each
+thread gets back only the values that its own command returned.
+
+The EV3 object uses a CommandBatcher for its DirectCommand shortcuts (i.e.
+brick.output_stop(...)) when it is created with a batch_window_s. If the EV3
+object has a controller (see the adaptive module) then the controller picks
+the window and how many commands go into each DirectCommand instead.
+
+NOTE:   If the brick reports that a batched DirectCommand failed then every
+        thread whose command was in that batch gets the DirectCommandError.
+
+EXAMPLE USAGE:
+    import threading
+
+    from ev3 import *
+
+
+    def read_port(brick, port):
+        while (True):
+            print port, brick.input_device_ready_si(port)
+
+
+    with ev3.EV3(batch_window_s=0.005) as brick:
+        for port in (direct_command.InputPort.PORT_1,
+                                        direct_command.InputPort.PORT_2):
+            t = threading.Thread(target=read_port, args=(brick, port))
+            t.daemon = True
+            t.start()
+
+        raw_input('Press enter to exit.')
+
+"""
+
+
+import threading
+import time
+
+import direct_command
+
+
+DEFAULT_WINDOW_S = 0.005
+
+
+class CommandBatcher(object):
+    """Collects DirectCommand methods that are called from several threads
+    and sends them in as few DirectCommands as possible.
+
+    """
+
+
+    def __init__(self, ev3_obj, window_s=DEFAULT_WINDOW_S):
+        """Creates a new batcher that sends through the given EV3 object. The
+        first call in a batch waits window_s seconds for other calls to join
+        it.
+
+        """
+        self._ev3_obj = ev3_obj
+        self._lock = threading.Lock()
+        self._collecting = None
+
+        # A running average of the bytes that each call adds.
+        self._command_bytes = None
+
+        self.window_s = window_s
+
+
+    def call(self, dc_name, *args):
+        """Adds the named DirectCommand method (i.e. 'add_output_stop') with
+        the given args to the next batch and blocks until the batch has been
+        sent. Returns a tuple of the values that the method added to the reply
+        or None if it didn't add any.
+
+        """
+        request = _Request(dc_name, args)
+
+        if (self._ev3_obj.lock.is_held()):
+            # This thread is in the middle of a transfer (i.e. it is running a
+            # preempting call) so waiting for a batch that can't get the lock
+            # would deadlock.
+            self._send([request])
+            return request.get()
+
+        with self._lock:
+            batch = self._collecting
+            is_leader = (batch is None)
+
+            if (is_leader):
+                batch = []
+                self._collecting = batch
+
+            batch.append(request)
+
+        if (not is_leader):
+            return request.get()
+
+        controller = getattr(self._ev3_obj, 'controller', None)
+
+        if (controller is not None):
+            time.sleep(controller.batch_window_s())
+        else:
+            time.sleep(self.window_s)
+
+        # Calls keep joining the batch while it waits for the link so that
+        # batches grow when the link is busy.
+        with self._ev3_obj.lock:
+            with self._lock:
+                self._collecting = None
+
+            self._send(batch)
+
+        return request.get()
+
+
+    def _send(self, batch):
+        cmd = direct_command.DirectCommand()
+        members = []
+
+        batch_size = None
+        controller = getattr(self._ev3_obj, 'controller', None)
+        if (controller is not None and self._command_bytes is not None):
+            batch_size = controller.batch_size(self._command_bytes)
+
+        for request in batch:
+            if (batch_size is not None and batch_size <= len(members)):
+                self._send_cmd(cmd, members)
+
+                cmd = direct_command.DirectCommand()
+                members = []
+
+            try:
+                value_count = _add(cmd, request)
+            except Exception as ex:
+                if (not members):
+                    request.fail(ex)
+                    continue
+
+                # The command is probably full so send what is there and try
+                # again with an empty one.
+                self._send_cmd(cmd, members)
+
+                cmd = direct_command.DirectCommand()
+                members = []
+
+                try:
+                    value_count = _add(cmd, request)
+                except Exception as ex:
+                    request.fail(ex)
+                    continue
+
+            members.append((request, value_count))
+
+        if (members):
+            self._send_cmd(cmd, members)
+
+
+    def _send_cmd(self, cmd, members):
+        # The header takes 3 bytes; the rest are the calls' bytecodes.
+        command_bytes = (float(len(cmd) - 3) / len(members))
+        if (self._command_bytes is None):
+            self._command_bytes = command_bytes
+        else:
+            self._command_bytes = ((0.8 * self._command_bytes) +
+                                                        (0.2 * command_bytes))
+
+        try:
+            values = cmd.send(self._ev3_obj)
+        except Exception as ex:
+            for request, value_count in members:
+                request.fail(ex)
+            return
+
+        index = 0
+        for request, value_count in members:
+            if (value_count):
+                request.finish(values[index:(index + value_count)])
+            else:
+                request.finish(None)
+
+            index += value_count
+
+
+class _Request(object):
+    """A single DirectCommand method call that is waiting to be sent."""
+
+
+    def __init__(self, dc_name, args):
+        self.dc_name = dc_name
+        self.args = args
+
+        self._done = threading.Event()
+        self._result = None
+        self._error = None
+
+
+    def finish(self, result):
+        self._result = result
+        self._done.set()
+
+
+    def fail(self, error):
+        self._error = error
+        self._done.set()
+
+
+    def get(self):
+        self._done.wait()
+
+        if (self._error is not None):
+            raise self._error
+
+        return self._result
+
+
+def _add(cmd, request):
+    value_count = cmd.value_count()
+
+    getattr(cmd, request.dc_name)(*request.args)
+
+    return (cmd.value_count() - value_count)
@@ -0,0 +1,84 @@
+"""Declares fixed DirectCommands as data and builds them once.
+
+Programs often build the same DirectCommands every time that they start.
+A CommandSet declares them as data instead: each command is a sequence of
+(FUNC_NAME, ARG, ARG, ...) tuples where FUNC_NAME is the name of a
+DirectCommand add_* function without the 'add_' prefix. The commands are
+built in memory when the set is created and are sent as often as needed
+without being rebuilt.
+
+NOTE:   The commands aren't cached on disk. Reading and validating a cache
+        file takes longer than building the commands.
+
+EXAMPLE USAGE:
+    from ev3 import *
+
+    commands = command_cache.CommandSet('arm', {
+        'open_claw': [
+            ('output_speed', direct_command.OutputPort.PORT_D, -10),
+            ('output_start', direct_command.OutputPort.PORT_D),
+            ('timer_wait', 600),
+            ('output_stop', direct_command.OutputPort.PORT_D,
+                                            direct_command.StopType.BRAKE)],
+        'read_battery': [
+            ('ui_read_get_vbatt',)]})
+
+    with ev3.EV3() as brick:
+        commands['open_claw'].send(brick)
+        print commands['read_battery'].send(brick)
+
+"""
+
+
+import direct_command
+
+
+class CommandCacheError(Exception):
+    """Subclass for reporting errors."""
+    pass
+
+
+class CommandSet(object):
+    """A named set of DirectCommands that are built from their
+    definitions.
+
+    """
+
+
+    def __init__(self, name_str, definitions):
+        """Builds the commands. The definitions are a dict of command names
+        to sequences of (FUNC_NAME, ARG, ARG, ...) tuples.
+
+        """
+        self.name = name_str
+
+        self._commands = dict((name, _build(funcs))
+                                        for name, funcs in definitions.items())
+
+
+    def __getitem__(self, name):
+        """Returns the DirectCommand with the given name."""
+        return self._commands[name]
+
+
+    def __contains__(self, name):
+        return (name in self._commands)
+
+
+    def names(self):
+        """Returns a sorted list of the command names."""
+        return sorted(self._commands)
+
+
+def _build(funcs):
+    cmd = direct_command.DirectCommand()
+
+    for func in funcs:
+        fn = getattr(cmd, ('add_' + func[0]), None)
+
+        if (fn is None):
+            raise CommandCacheError('Unknown func: %s' % func[0])
+
+        fn(*func[1:])
+
+    return cmd
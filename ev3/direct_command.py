@@ -52,6 +52,8 @@ Byte 5 - n: Response buffer (global variable values)
 """
 
 
+import array
+
 import ev3
 import message
 
@@ -73,6 +75,14 @@ MOTOR_MAX_SPEED = 100
 USB_CHAIN_LAYER_MASTER = 0
 USB_CHAIN_LAYER_SLAVE = 1
 
+MAX_CHAIN_LAYERS = 4        # The brick and up to three bricks that are
+                            # daisy-chained to it over USB.
+PORTS_PER_LAYER = 4
+
+# INPUT_DEVICE_LIST returns the DeviceType of the input ports of every layer
+# followed by those of the output ports of every layer.
+INPUT_DEVICE_LIST_LEN = (2 * MAX_CHAIN_LAYERS * PORTS_PER_LAYER)
+
 MOTOR_MIN_RATIO = -200
 MOTOR_MAX_RATIO = 200
 
@@ -1011,12 +1021,15 @@ class DirectCommand(object):
         self._local_params_byte_count = 0
         self._global_params_byte_count = 0
 
-        # Allocate space for the CommandType.
-        self._msg = [0x00]
+        # Bytes in the reply that only align the values (see stats).
+        self._global_params_pad_byte_count = 0
+
+        # The first opcode of each func that was added (see stats).
+        self._opcodes = []
 
-        # Allocate space for global and local param lengths.
-        self._msg.append(0x00)
-        self._msg.append(0x00)
+        # Allocate space for the CommandType and the global and local param
+        # lengths.
+        self._msg = bytearray(3)
 
 
     def send(self, ev3_object):
@@ -1028,15 +1041,58 @@ class DirectCommand(object):
         self._msg[2] = ((self._local_params_byte_count << 2) |
                                 ((self._global_params_byte_count >> 8) & 0x03))
 
+        stats = getattr(ev3_object, 'stats', None)
+
         if (self._global_params_byte_count):
             self._msg[0] = CommandType.DIRECT_COMMAND_REPLY
-            reply = ev3_object.send_message_for_reply(self._msg)
+
+            if (stats is None):
+                reply = ev3_object.send_message_for_reply(self._msg)
+            else:
+                # The opcodes are recorded with the same round trip as the
+                # message.
+                reply, elapsed_s = ev3_object.send_message_for_reply_timed(
+                                                                    self._msg)
+                stats.record_opcodes(self._opcodes, elapsed_s,
+                                    len(self._msg), len(reply),
+                                    self._global_params_pad_byte_count)
 
             return self._parse_reply(reply)
         else:
             self._msg[0] = CommandType.DIRECT_COMMAND_NO_REPLY
             ev3_object.send_message(self._msg)
 
+            if (stats is not None):
+                stats.record_opcodes(self._opcodes, None, len(self._msg))
+
+
+    def __len__(self):
+        """Returns the length of the message in bytes (without the
+        length/message_counter header).
+
+        """
+        return len(self._msg)
+
+
+    def value_count(self):
+        """Returns the number of values in the tuple that send returns (a
+        command that returns several values counts as one tuple).
+
+        """
+        count = 0
+        in_tuple = False
+
+        for item in self._global_params_types:
+            if (self._REPLY_TUPLE_OPEN_TOKEN == item):
+                count += 1
+                in_tuple = True
+            elif (self._REPLY_TUPLE_CLOSE_TOKEN == item):
+                in_tuple = False
+            elif (not in_tuple):
+                count += 1
+
+        return count
+
 
     def safe_add(fn):
         """A wrapper for adding commands in a safe manner."""
@@ -1052,22 +1108,40 @@ class DirectCommand(object):
 
             local_params_byte_count = _self._local_params_byte_count
             global_params_byte_count = _self._global_params_byte_count
+            global_params_pad_byte_count = _self._global_params_pad_byte_count
 
-            fn(*args)
-
-            if ((MAX_CMD_LEN < len(_self._msg)) or
-                  (MAX_CMD_LEN < _self._global_params_byte_count) or
-                  (MAX_LOCAL_VARIABLE_BYTES < _self._local_params_byte_count)):
+            def rollback():
                 del (_self._msg[msg_len:])
 
                 del (_self._global_params_types[global_params_types_len:])
 
                 _self._local_params_byte_count = local_params_byte_count
                 _self._global_params_byte_count = global_params_byte_count
+                _self._global_params_pad_byte_count = (
+                                                global_params_pad_byte_count)
+
+            # A func that raises part way through (i.e. because of a bad
+            # param) must not leave a partial command behind.
+            try:
+                fn(*args)
+            except:
+                rollback()
+                raise
+
+            if ((MAX_CMD_LEN < len(_self._msg)) or
+                  (MAX_CMD_LEN < _self._global_params_byte_count) or
+                  (MAX_LOCAL_VARIABLE_BYTES < _self._local_params_byte_count)):
+                rollback()
 
                 raise DirectCommandError('Not enough space to add the ' +
                                                                 'given func.')
 
+            if (msg_len < len(_self._msg)):
+                _self._opcodes.append(_self._msg[msg_len])
+
+        # CompactDirectCommand uses the func without the checks.
+        checked_add._unchecked = fn
+
         return checked_add
 
 
@@ -1086,6 +1160,16 @@ class DirectCommand(object):
         self._append_param(*local_var_tuple)
 
 
+    @safe_add
+    def add_timer_read_us(self):
+        """Returns the value of the brick's free-running microsecond timer.
+        The value wraps around after 0xFFFFFFFF.
+
+        """
+        self._msg.append(Opcode.TIMER_READ_US)
+        self._append_reply_param(DataFormat.DATA32)
+
+
     @safe_add
     def add_ui_draw_update(self):
         """Updates the screen (applies whatever drawing commands have been
@@ -1310,6 +1394,23 @@ class DirectCommand(object):
         self._append_reply_param(DataFormat.DATA8)
 
 
+    @safe_add
+    def add_input_device_list(self, length=INPUT_DEVICE_LIST_LEN):
+        """Returns a tuple in the form (DEVICE_TYPES, CHANGED) where
+        DEVICE_TYPES is a tuple of the DeviceType of the first length ports
+        (see INPUT_DEVICE_LIST_LEN for their order) and CHANGED is True if a
+        device has been connected or disconnected since the list was last
+        read. This is much smaller than asking each port for its type.
+
+        """
+        self._msg.append(Opcode.INPUT_DEVICE_LIST)
+        self._append_param(length)
+        self._append_reply_type(self._REPLY_TUPLE_OPEN_TOKEN)
+        self._append_reply_param((DataFormat.DATA_A, length))
+        self._append_reply_param(DataFormat.BOOL)
+        self._append_reply_type(self._REPLY_TUPLE_CLOSE_TOKEN)
+
+
     @safe_add
     def add_input_device_get_typemode(self, input_port,
                                             layer=USB_CHAIN_LAYER_MASTER):
@@ -1321,10 +1422,10 @@ class DirectCommand(object):
         self._msg.append(InputDeviceSubcode.GET_TYPEMODE)
         self._append_param(layer)
         self._append_param(input_port)
-        self._global_params_types.append(self._REPLY_TUPLE_OPEN_TOKEN)
+        self._append_reply_type(self._REPLY_TUPLE_OPEN_TOKEN)
         self._append_reply_param(DataFormat.DATA8)
         self._append_reply_param(DataFormat.DATA8)
-        self._global_params_types.append(self._REPLY_TUPLE_CLOSE_TOKEN)
+        self._append_reply_type(self._REPLY_TUPLE_CLOSE_TOKEN)
 
 
     @safe_add
@@ -1370,10 +1471,10 @@ class DirectCommand(object):
         self._msg.append(InputDeviceSubcode.GET_MINMAX)
         self._append_param(layer)
         self._append_param(input_port)
-        self._global_params_types.append(self._REPLY_TUPLE_OPEN_TOKEN)
+        self._append_reply_type(self._REPLY_TUPLE_OPEN_TOKEN)
         self._append_reply_param(DataFormat.DATA_F)
         self._append_reply_param(DataFormat.DATA_F)
-        self._global_params_types.append(self._REPLY_TUPLE_CLOSE_TOKEN)
+        self._append_reply_type(self._REPLY_TUPLE_CLOSE_TOKEN)
 
 
     @safe_add
@@ -1639,11 +1740,11 @@ class DirectCommand(object):
         """
         self._msg.append(Opcode.UI_READ)
         self._msg.append(UIReadSubcode.GET_SDCARD)
-        self._global_params_types.append(self._REPLY_TUPLE_OPEN_TOKEN)
+        self._append_reply_type(self._REPLY_TUPLE_OPEN_TOKEN)
         self._append_reply_param(DataFormat.BOOL)
         self._append_reply_param(DataFormat.DATA32)
         self._append_reply_param(DataFormat.DATA32)
-        self._global_params_types.append(self._REPLY_TUPLE_CLOSE_TOKEN)
+        self._append_reply_type(self._REPLY_TUPLE_CLOSE_TOKEN)
 
 
     @safe_add
@@ -1655,11 +1756,11 @@ class DirectCommand(object):
         """
         self._msg.append(Opcode.UI_READ)
         self._msg.append(UIReadSubcode.GET_SDCARD)
-        self._global_params_types.append(self._REPLY_TUPLE_OPEN_TOKEN)
+        self._append_reply_type(self._REPLY_TUPLE_OPEN_TOKEN)
         self._append_reply_param(DataFormat.BOOL)
         self._append_reply_param(DataFormat.DATA32)
         self._append_reply_param(DataFormat.DATA32)
-        self._global_params_types.append(self._REPLY_TUPLE_CLOSE_TOKEN)
+        self._append_reply_type(self._REPLY_TUPLE_CLOSE_TOKEN)
 
 
     @safe_add
@@ -1783,10 +1884,10 @@ class DirectCommand(object):
         self._msg.append(Opcode.OUTPUT_READ)
         self._append_param(layer)
         self._append_param(OUTPUT_CHANNEL_TO_INDEX[output_port])
-        self._global_params_types.append(self._REPLY_TUPLE_OPEN_TOKEN)
+        self._append_reply_type(self._REPLY_TUPLE_OPEN_TOKEN)
         self._append_reply_param(DataFormat.DATA8)
         self._append_reply_param(DataFormat.DATA32)
-        self._global_params_types.append(self._REPLY_TUPLE_CLOSE_TOKEN)
+        self._append_reply_type(self._REPLY_TUPLE_CLOSE_TOKEN)
 
 
     @safe_add
@@ -2013,10 +2114,70 @@ class DirectCommand(object):
         self._append_param(led_pattern)
 
 
+    @safe_add
+    def add_filename_exist(self, path_str):
+        """Returns True if a file or folder exists at the given path."""
+        self._msg.append(Opcode.FILENAME)
+        self._msg.append(FilenameSubcode.EXIST)
+        self._append_param(path_str, ParamType.LCS)
+        self._append_reply_param(DataFormat.BOOL)
+
+
+    @safe_add
+    def add_filename_pack(self, path_str):
+        """Packs the file or folder at the given path into a gzipped tar
+        archive. The archive is written next to the original and has the same
+        name but with its extension replaced by '.raf' (i.e. 'foo/bar.rdf' is
+        packed into 'foo/bar.raf').
+
+        """
+        self._msg.append(Opcode.FILENAME)
+        self._msg.append(FilenameSubcode.PACK)
+        self._append_param(path_str, ParamType.LCS)
+
+
+    @safe_add
+    def add_filename_unpack(self, path_str):
+        """Unpacks the '.raf' archive that has the same name as the given path
+        (minus its extension) into the folder that contains it.
+
+        """
+        self._msg.append(Opcode.FILENAME)
+        self._msg.append(FilenameSubcode.UNPACK)
+        self._append_param(path_str, ParamType.LCS)
+
+
+    @safe_add
+    def add_com_get_brickname(self):
+        """Returns the name of the brick as a string."""
+        self._msg.append(Opcode.COM_GET)
+        self._msg.append(COMGetSubcodes.GET_BRICKNAME)
+        self._append_param(MAX_NAME_STR_LEN, ParamType.LC2)
+        self._append_reply_param((DataFormat.DATA_S, MAX_NAME_STR_LEN))
+
+
+    @safe_add
+    def add_com_set_brickname(self, name_str):
+        """Sets the name of the brick. The new name is shown on the brick's
+        display and used by Bluetooth after the brick restarts.
+
+        """
+        self._msg.append(Opcode.COM_SET)
+        self._msg.append(COMSetSubcode.SET_BRICKNAME)
+        self._append_param(name_str, ParamType.LCS)
+
+
     def _parse_reply(self, buf):
+        return self._parse_reply_types(buf, self._global_params_types)
+
+
+    def _parse_reply_types(self, buf, reply_types):
         result = []
         index = 0
 
+        if (not isinstance(buf, bytearray)):
+            buf = bytearray(buf)
+
         if (ReplyType.DIRECT_REPLY_ERROR == buf[0]):
             raise DirectCommandError('The DirectCommand failed.')
 
@@ -2027,7 +2188,7 @@ class DirectCommand(object):
         # The items in the reply are grouped into tuples. Each tuple represents
         # the reply to a command that returns multiple values.
         sub_tuple = None
-        for item in self._global_params_types:
+        for item in reply_types:
             value = None
             length = 0
 
@@ -2069,6 +2230,10 @@ class DirectCommand(object):
         if (DataFormat.DATA_S == data_format):
             value = message.parse_null_terminated_str(buf, index, data_len)
             length = data_len
+        elif (DataFormat.DATA_A == data_format):
+            # An array of DATA8 values.
+            value = tuple(buf[index:(index + data_len)])
+            length = data_len
         elif (DataFormat.HND == data_format):
             value = (buf[index] & ~ParamType.HND)
         elif (DataFormat.DATA_F == data_format):
@@ -2108,6 +2273,7 @@ class DirectCommand(object):
             if (pad):
                 pad = (data_len - pad)
                 self._global_params_byte_count += pad
+                self._global_params_pad_byte_count += pad
         else:
             data_len = reply_format[1]
 
@@ -2119,10 +2285,18 @@ class DirectCommand(object):
             param_type = ParamType.GV2
 
         self._append_param(self._global_params_byte_count, param_type)
-        self._global_params_types.append(reply_format)
+        self._append_reply_type(reply_format)
         self._global_params_byte_count += data_len
 
 
+    def _append_reply_type(self, reply_type):
+        """Appends a reply_format or a _REPLY_TUPLE_*_TOKEN to the layout of
+        the reply.
+
+        """
+        self._global_params_types.append(reply_type)
+
+
     def _allocate_local_param(self, data_format):
         """Local parameters are essentially stack variables so they are NOT
         included in the reply from the brick. This function returns an index
@@ -2211,3 +2385,134 @@ class DirectCommand(object):
             else:
                 raise DirectCommandError('Unexpected ParamType:' +
                                                             ' %d' % param_type)
+
+
+class CompactDirectCommand(object):
+    """A DirectCommand for programs that build many short-lived commands. It
+    has the same add_* functions and sends the same bytes but it keeps its
+    state in __slots__ and the layout of its reply in an array of integer
+    codes so each object is much smaller.
+
+    The add_* functions are called without the checks that DirectCommand
+    wraps them in: the size of the command is checked once by send and a
+    func that raises part way through (i.e. because of a bad param) isn't
+    undone, so discard the object if that happens. Stats are recorded for
+    the command type but not for each opcode.
+
+    """
+    __slots__ = ('_msg', '_reply_layout', '_local_params_byte_count',
+                                            '_global_params_byte_count',
+                                            '_global_params_pad_byte_count')
+
+    _REPLY_TUPLE_OPEN_TOKEN = DirectCommand._REPLY_TUPLE_OPEN_TOKEN
+    _REPLY_TUPLE_CLOSE_TOKEN = DirectCommand._REPLY_TUPLE_CLOSE_TOKEN
+
+    # The codes of the _REPLY_TUPLE_*_TOKENs in the reply layout. Other codes
+    # are a DataFormat in the low byte and, for reply formats that are
+    # tuples, the length in the bytes above it.
+    _LAYOUT_TUPLE_OPEN = -1
+    _LAYOUT_TUPLE_CLOSE = -2
+
+
+    def __init__(self):
+        """Constructs a new, empty object."""
+        self._reply_layout = array.array('i')
+
+        self._local_params_byte_count = 0
+        self._global_params_byte_count = 0
+        self._global_params_pad_byte_count = 0
+
+        # Allocate space for the CommandType and the global and local param
+        # lengths.
+        self._msg = bytearray(3)
+
+
+    def send(self, ev3_object):
+        """Checks the size of the message, sends it, and parses the reply."""
+        if ((MAX_CMD_LEN < len(self._msg)) or
+              (MAX_CMD_LEN < self._global_params_byte_count) or
+              (MAX_LOCAL_VARIABLE_BYTES < self._local_params_byte_count)):
+            raise DirectCommandError('Not enough space for the added funcs.')
+
+        self._msg[1] = (self._global_params_byte_count & 0xFF)
+        self._msg[2] = ((self._local_params_byte_count << 2) |
+                                ((self._global_params_byte_count >> 8) & 0x03))
+
+        if (self._global_params_byte_count):
+            self._msg[0] = CommandType.DIRECT_COMMAND_REPLY
+            reply = ev3_object.send_message_for_reply(self._msg)
+
+            return self._parse_reply(reply)
+        else:
+            self._msg[0] = CommandType.DIRECT_COMMAND_NO_REPLY
+            ev3_object.send_message(self._msg)
+
+
+    def __len__(self):
+        """Returns the length of the message in bytes (without the
+        length/message_counter header).
+
+        """
+        return len(self._msg)
+
+
+    def value_count(self):
+        """Returns the number of values in the tuple that send returns (a
+        command that returns several values counts as one tuple).
+
+        """
+        count = 0
+        in_tuple = False
+
+        for code in self._reply_layout:
+            if (self._LAYOUT_TUPLE_OPEN == code):
+                count += 1
+                in_tuple = True
+            elif (self._LAYOUT_TUPLE_CLOSE == code):
+                in_tuple = False
+            elif (not in_tuple):
+                count += 1
+
+        return count
+
+
+    def _append_reply_type(self, reply_type):
+        if (self._REPLY_TUPLE_OPEN_TOKEN == reply_type):
+            self._reply_layout.append(self._LAYOUT_TUPLE_OPEN)
+        elif (self._REPLY_TUPLE_CLOSE_TOKEN == reply_type):
+            self._reply_layout.append(self._LAYOUT_TUPLE_CLOSE)
+        elif (isinstance(reply_type, tuple)):
+            self._reply_layout.append(reply_type[0] | (reply_type[1] << 8))
+        else:
+            self._reply_layout.append(reply_type)
+
+
+    def _parse_reply(self, buf):
+        reply_types = []
+
+        for code in self._reply_layout:
+            if (self._LAYOUT_TUPLE_OPEN == code):
+                reply_types.append(self._REPLY_TUPLE_OPEN_TOKEN)
+            elif (self._LAYOUT_TUPLE_CLOSE == code):
+                reply_types.append(self._REPLY_TUPLE_CLOSE_TOKEN)
+            elif (0xFF < code):
+                reply_types.append(((code & 0xFF), (code >> 8)))
+            else:
+                reply_types.append(code)
+
+        return self._parse_reply_types(buf, reply_types)
+
+
+# The add_* functions (without their safe_add checks) and the helpers that
+# they call are shared with DirectCommand.
+for _name, _value in vars(DirectCommand).items():
+    if (_name.startswith('add_')):
+        setattr(CompactDirectCommand, _name,
+                                        getattr(_value, '_unchecked', _value))
+
+for _name in ('_append_param', '_append_local_constant',
+                '_allocate_local_param', '_append_reply_param',
+                '_parse_reply_types', '_parse_param'):
+    setattr(CompactDirectCommand, _name, vars(DirectCommand)[_name])
+
+del _name, _value
@@ -39,14 +39,38 @@ Prerequisites:
             # Call single system_command functions.
             brick.write_mailbox('foo', (0,1,2,3,4,5,6,7,8,9,0))
 
+    An EV3 object can be shared by several threads. Each message and its
+    reply are sent while holding the object's lock. Create the object with a
+    batch_window_s to merge the DirectCommand shortcuts that several threads
+    call at about the same time into shared DirectCommands (see the batch
+    module).
+
+    The replies to queries whose answers rarely change (i.e.
+    brick.ui_read_get_fw_vers()) are kept in the object's query_cache (see
+    the query_cache module).
+
 """
 
 
+import threading
+import time
+
 import serial
 
+import batch
 import message
 import system_command
 import direct_command
+import fs_cache
+import query_cache
+
+
+# The number of DirectCommands that each of the DirectCommand shortcuts
+# keeps built for reuse (see EV3.__getattr__).
+FACADE_TEMPLATES_PER_METHOD = 64
+
+# The only types of args that the built DirectCommands are kept for.
+_TEMPLATE_ARG_TYPES = (int, long, float, bool, str)
 
 
 class KnownPaths(object):
@@ -66,22 +90,92 @@ class EV3Error(Exception):
     pass
 
 
+class _OwnedRLock(object):
+    """A reentrant lock that can tell whether the current thread holds it.
+    Each thread counts how many times it has acquired the lock.
+
+    """
+
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._local = threading.local()
+
+
+    def acquire(self, blocking=True):
+        if (not self._lock.acquire(blocking)):
+            return False
+
+        self._local.depth = (getattr(self._local, 'depth', 0) + 1)
+
+        return True
+
+
+    def release(self):
+        # Raises a RuntimeError if the current thread doesn't hold the lock.
+        self._lock.release()
+        self._local.depth -= 1
+
+
+    def is_held(self):
+        """Returns True if the current thread holds the lock."""
+        return (0 < getattr(self._local, 'depth', 0))
+
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+
+    def __exit__(self, type, value, traceback):
+        self.release()
+
+
 class EV3(object):
     """"""
     DEFAULT_RFCOMM_PORT = '/dev/rfcomm0'
     RFCOMM_BAUDRATE = 115200
 
 
-    def __init__(self, port_str=DEFAULT_RFCOMM_PORT):
-        """Creates a new object but doesn't open the port."""
+    def __init__(self, port_str=DEFAULT_RFCOMM_PORT, batch_window_s=None):
+        """Creates a new object but doesn't open the port. If batch_window_s
+        is not None then DirectCommand shortcuts that are called from
+        different threads within batch_window_s seconds of each other are
+        sent as a single DirectCommand.
+
+        """
         self._port_str = port_str
         self._port = None
+        self._rx_handlers = []
+
+        # Replies are read through a buffer that is reused (see
+        # message.FrameReader). It is replaced when the port changes.
+        self._frame_reader = None
+
+        # Held while a message and its reply are on the link. Hold it across
+        # several calls to keep other threads from interleaving with them.
+        self.lock = _OwnedRLock()
+
+        # Set this to a stats.Stats object to count messages and latencies.
+        self.stats = None
+
+        # Set this to an adaptive.AdaptiveController to size batches and
+        # download windows from measurements of the link.
+        self.controller = None
+
+        self._batcher = None
+        if (batch_window_s is not None):
+            self._batcher = batch.CommandBatcher(self, batch_window_s)
+
+        self.fs_cache = fs_cache.FileSystemCache(self)
+        self.query_cache = query_cache.QueryCache(self)
 
 
     def open(self):
         """Opens the object's serial port."""
-        if (self._port is None):
-            self._port = serial.Serial(port=self._port_str,
+        with self.lock:
+            if (self._port is None):
+                self._port = serial.Serial(port=self._port_str,
                                         baudrate=self.RFCOMM_BAUDRATE,
                                         bytesize=serial.EIGHTBITS,
                                         parity=serial.PARITY_NONE,
@@ -95,10 +189,19 @@ class EV3(object):
 
 
     def close(self):
-        """Closes the object's serial port."""
-        if (self._port is not None):
-            self._port.close()
-            self._port = None
+        """Closes the object's serial port. The fs_cache and query_cache are
+        cleared because the port may be connected to a different brick when
+        it is opened again.
+
+        """
+        with self.lock:
+            if (self._port is not None):
+                self._port.close()
+                self._port = None
+                self._frame_reader = None
+
+            self.fs_cache.clear()
+            self.query_cache.clear()
 
 
     def send_message(self, msg, message_counter=0x1234):
@@ -108,10 +211,15 @@ class EV3(object):
         message is a type that expects a reply.
 
         """
-        try:
-            message.send_message_no_reply(self._port, msg, message_counter)
-        except message.MessageError as ex:
-            raise EV3Error(ex.message)
+        with self.lock:
+            try:
+                message.send_message_no_reply(self._port, msg,
+                                                            message_counter)
+            except message.MessageError as ex:
+                raise EV3Error(ex.message)
+
+        if (self.stats is not None):
+            self.stats.record_msg(msg)
 
 
     def send_message_for_reply(self, msg, message_counter=0x1234):
@@ -121,12 +229,139 @@ class EV3(object):
         message is a type that doesn't expect a reply.
 
         """
-        try:
-            return message.send_message_for_reply(self._port,
+        return self.send_message_for_reply_timed(msg, message_counter)[0]
+
+
+    def send_message_for_reply_timed(self, msg, message_counter=0x1234):
+        """Same as send_message_for_reply but returns a tuple in the form
+        (REPLY, ELAPSED_S) where ELAPSED_S is the round trip time that the
+        message is recorded with in the stats (without the time spent waiting
+        for the lock).
+
+        """
+        with self.lock:
+            # Time spent waiting for the lock isn't part of the round trip.
+            start = time.time()
+
+            try:
+                reply = message.send_message_for_reply(self._port,
                                                             msg,
-                                                            message_counter)
-        except message.MessageError as ex:
-            raise EV3Error(ex.message)
+                                                            message_counter,
+                                                            self._dispatch_rx,
+                                                            self._reader())
+            except message.MessageError as ex:
+                raise EV3Error(ex.message)
+
+            elapsed_s = (time.time() - start)
+
+        if (self.stats is not None):
+            self.stats.record_msg(msg, elapsed_s, len(reply))
+
+        if (self.controller is not None):
+            self.controller.record_msg(len(msg), len(reply), elapsed_s)
+
+        return (reply, elapsed_s)
+
+
+    def send_messages(self, msgs, message_counter=0x1234):
+        """Sends several raw messages that don't expect replies with a single
+        write to the port. See send_message.
+
+        """
+        with self.lock:
+            try:
+                message.write_messages(self._port, msgs, message_counter)
+            except message.MessageError as ex:
+                raise EV3Error(ex.message)
+
+        if (self.stats is not None):
+            for msg in msgs:
+                self.stats.record_msg(msg)
+
+
+    def write_message(self, msg, message_counter=0x1234):
+        """Writes a raw message to the EV3 without waiting for its reply (if
+        it expects one). This allows several messages to be kept in flight;
+        use read_reply to collect the replies and give each in-flight message
+        a unique message_counter so that they can be matched up. Hold the
+        object's lock until the replies have been read.
+
+        """
+        with self.lock:
+            try:
+                message.write_message(self._port, msg, message_counter)
+            except message.MessageError as ex:
+                raise EV3Error(ex.message)
+
+        # The reply (if any) is matched up by the caller so only the bytes
+        # that were sent are counted.
+        if (self.stats is not None):
+            self.stats.record_msg(msg)
+
+
+    def read_reply(self):
+        """Reads the next reply from the EV3. Returns a tuple in the form
+        (MESSAGE_COUNTER, REPLY) where REPLY does not include the
+        length/message_counter header.
+
+        """
+        with self.lock:
+            try:
+                return message.read_reply(self._port, self._dispatch_rx,
+                                                            self._reader())
+            except message.MessageError as ex:
+                raise EV3Error(ex.message)
+
+
+    def poll(self):
+        """Reads any messages that the brick has sent on its own (i.e. mailbox
+        writes from a running program) and passes them to the rx handlers.
+        Returns without blocking if nothing is waiting. Messages that arrive
+        while waiting for a reply are dispatched automatically.
+
+        """
+        with self.lock:
+            try:
+                reader = self._reader()
+
+                while (reader.buffered() or self._port.inWaiting()):
+                    message_counter, msg = message.read_message(self._port,
+                                                                    reader)
+
+                    if (not message.msg_is_unsolicited(msg)):
+                        raise EV3Error('Received a reply that was not ' +
+                                                                'expected.')
+
+                    self._dispatch_rx(msg)
+            except message.MessageError as ex:
+                raise EV3Error(ex.message)
+
+
+    def add_rx_handler(self, handler):
+        """Adds a function that is called with each message that the brick
+        sends on its own. The message does not include the
+        length/message_counter header.
+
+        """
+        self._rx_handlers.append(handler)
+
+
+    def remove_rx_handler(self, handler):
+        """Removes a function that was added with add_rx_handler."""
+        self._rx_handlers.remove(handler)
+
+
+    def _reader(self):
+        if (self._frame_reader is None or
+                                    self._frame_reader.port is not self._port):
+            self._frame_reader = message.FrameReader(self._port)
+
+        return self._frame_reader
+
+
+    def _dispatch_rx(self, msg):
+        for handler in self._rx_handlers:
+            handler(msg)
 
 
     def __dir__(self):
@@ -135,49 +370,36 @@ class EV3(object):
         EV3 object.
 
         """
-        result = dir(type(self))
-        result += list(self.__dict__)
-        result += [s for s in list(system_command.__dict__)
-                                                    if not s.startswith('_')]
-        result += [s[4:] for s in list(direct_command.DirectCommand.__dict__)
-                                                        if s.startswith('add_')]
-        return sorted(set(result))
+        # Imported here because the tables module imports direct_command,
+        # which imports this module.
+        import tables
+
+        result = set(dir(type(self)))
+        result.update(self.__dict__)
+        result.update(tables.SYSTEM_COMMAND_NAMES)
+        result.update(tables.DIRECT_COMMAND_NAMES)
+        return sorted(result)
 
 
     def __getattr__(self, name):
         """A little bit of magic is used in order to make it easier to work with
-        EV3 objects.
+        EV3 objects. Functions from the system_command module and single
+        functions from the DirectCommand class can be called directly on an
+        EV3 object i.e. ev3.list_files(KnownPaths.PROJECTS_PATH) or
+        ev3.ui_draw_update(). The method for each name is generated the first
+        time that it's used and is added to the class so later calls don't
+        come through here.
 
         """
-        if (hasattr(system_command, name)):
-            # This allows functions from the system_command module to be called
-            # from an EV3 object i.e. ev3.list_files(KnownPaths.PROJECTS_PATH).
-            def execute_sc(*args):
-                """This is just a wrapper around an individual function from the
-                system_command module. See the system_command module for more
-                information.
-
-                """
-                getattr(system_command, name)(self, *args)
-
-            return execute_sc
-
-        # This allows single functions from the DirectCommand class to be called
-        # from an EV3 object i.e. ev3.ui_draw_update().
-        dc_name = ('add_' + name)
-        if (hasattr(direct_command.DirectCommand, dc_name)):
-            def execute_dc(*args):
-                """This is just a wrapper around an individual DirectCommand
-                method. See the DirectCommand class for more information.
+        method = _facade_method(name)
 
-                """
-                dc = direct_command.DirectCommand()
-                getattr(dc, dc_name)(*args)
-                return dc.send(self)
+        if (method is None):
+            raise AttributeError("'%s' object has no attribute '%s'" %
+                                                    (type(self).__name__, name))
 
-            return execute_dc
+        setattr(EV3, name, method)
 
-        return Object.__getattr__(self, name)
+        return getattr(self, name)
 
 
     def __enter__(self):
@@ -187,3 +409,86 @@ class EV3(object):
 
     def __exit__(self, type, value, traceback):
         self.close()
+
+
+def _template_key(args):
+    """Returns a key for the given DirectCommand args or None if any of them
+    isn't a plain int, long, float, bool, or str. Other types (i.e. custom
+    objects whose repr is based on their id) can't be trusted to build the
+    same bytes whenever they compare equal.
+
+    """
+    for arg in args:
+        if (type(arg) not in _TEMPLATE_ARG_TYPES):
+            return None
+
+    return tuple((type(arg), arg) for arg in args)
+
+
+def _facade_method(name):
+    """Returns a function that calls the system_command function or sends
+    the DirectCommand function with the given name or None if there isn't
+    one.
+
+    """
+    # Imported here because the tables module imports direct_command, which
+    # imports this module.
+    import tables
+
+    if (name in tables.SYSTEM_COMMAND_NAMES):
+        sc_fn = getattr(system_command, name)
+
+        def execute_sc(self, *args, **kwargs):
+            return sc_fn(self, *args, **kwargs)
+
+        execute_sc.__name__ = name
+        execute_sc.__doc__ = sc_fn.__doc__
+
+        return execute_sc
+
+    if (name in tables.DIRECT_COMMAND_NAMES):
+        dc_name = ('add_' + name)
+        dc_fn = getattr(direct_command.DirectCommand, dc_name)
+
+        # DirectCommands that have already been built keyed by the type and
+        # value of each of their args (which tells 1 from 1.0 and True).
+        templates = {}
+
+        # The cached queries whose replies this shortcut changes.
+        invalidates = query_cache.INVALIDATED_BY.get(name, ())
+
+        def execute_dc(self, *args):
+            if (self.query_cache.is_cached(name)):
+                return self.query_cache.get(name, *args)
+
+            if (self._batcher is not None):
+                result = self._batcher.call(dc_name, *args)
+            else:
+                key = _template_key(args)
+
+                dc = templates.get(key)
+                if (dc is None):
+                    dc = direct_command.DirectCommand()
+                    dc_fn(dc, *args)
+
+                    # Commands with other types of args are built every time.
+                    if (key is not None):
+                        if (FACADE_TEMPLATES_PER_METHOD <= len(templates)):
+                            templates.clear()
+
+                        templates[key] = dc
+
+                result = dc.send(self)
+
+            for query_name in invalidates:
+                self.query_cache.invalidate(query_name)
+
+            return result
+
+        execute_dc.__name__ = name
+        execute_dc.__doc__ = getattr(dc_fn, '_unchecked', dc_fn).__doc__
+
+        return execute_dc
+
+    return None
+
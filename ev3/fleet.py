@@ -0,0 +1,241 @@
+"""Drives several bricks, each on its own port, in parallel.
+
+A Fleet owns one EV3 object and one PriorityExecutor per brick so a call
+that is broadcast to the fleet runs on every brick at the same time instead
+of one brick after the other. The results are collected into a BrickResult
+per brick that holds the returned value or the exception that was raised
+along with how long the call took.
+
+A brick that doesn't answer within the timeout, or whose link fails, is
+quarantined: later calls skip it (and report a FleetError for it) so that
+one slow or dead brick doesn't hold up the rest. A quarantined brick is
+tried again once quarantine_s seconds have passed and its last call has
+finished.
+
+EXAMPLE USAGE:
+    from ev3 import *
+
+    with fleet.Fleet({'left':  '/dev/rfcomm0',
+                      'right': '/dev/rfcomm1'}) as bricks:
+        cmd = direct_command.DirectCommand()
+        cmd.add_ui_read_get_vbatt()
+
+        for name, result in bricks.send(cmd).items():
+            if (result.error is None):
+                print name, result.value, result.latency_s
+            else:
+                print name, 'failed:', result.error
+
+        bricks.run(system_command.list_files, ('../prjs/',), ['left'])
+
+"""
+
+
+import collections
+import time
+
+from concurrent import futures
+
+import async
+import ev3
+
+
+DEFAULT_TIMEOUT_S = 2.0
+DEFAULT_QUARANTINE_S = 30.0
+
+
+class FleetError(Exception):
+    """Subclass for reporting errors."""
+    pass
+
+
+# VALUE is None if the call raised ERROR. LATENCY_S is None if the call
+# didn't finish in time or the brick was skipped.
+BrickResult = collections.namedtuple('BrickResult',
+                                                'name value error latency_s')
+
+
+class Fleet(object):
+    """Runs functions on several EV3 objects in parallel."""
+
+
+    def __init__(self, port_strs, timeout_s=DEFAULT_TIMEOUT_S,
+                                        quarantine_s=DEFAULT_QUARANTINE_S):
+        """Creates an EV3 object for each brick but doesn't open the ports.
+        The port_strs parameter is either a dict of names to ports or a list
+        of ports (that are also used as the names).
+
+        """
+        if (not isinstance(port_strs, dict)):
+            port_strs = collections.OrderedDict((p, p) for p in port_strs)
+        elif (not isinstance(port_strs, collections.OrderedDict)):
+            port_strs = collections.OrderedDict(sorted(port_strs.items()))
+
+        self.timeout_s = timeout_s
+        self.quarantine_s = quarantine_s
+
+        self._bricks = collections.OrderedDict()
+        self._executors = {}
+        self._last_futures = {}
+        self._quarantined = {}
+
+        for name in port_strs:
+            self._bricks[name] = ev3.EV3(port_strs[name])
+            self._executors[name] = async.PriorityExecutor()
+
+
+    def names(self):
+        """Returns the names of the bricks in the fleet."""
+        return list(self._bricks)
+
+
+    def brick(self, name):
+        """Returns the EV3 object for the named brick."""
+        return self._bricks[name]
+
+
+    def open(self):
+        """Opens the port of each brick. Returns the results in the same form
+        as run so that bricks that can't be reached don't stop the rest from
+        being opened.
+
+        """
+        return self.run(_open, names=self.names(), use_quarantine=False)
+
+
+    def close(self):
+        """Closes the port of each brick and stops the worker threads. Calls
+        that haven't started yet are cancelled.
+
+        """
+        for name, brick in self._bricks.items():
+            future = self._last_futures.get(name)
+
+            # A brick that is stuck in a call holds its lock so waiting for
+            # it would block. Its port is left for the process to clean up.
+            if (future is None or future.done()):
+                self._executors[name].stop()
+                brick.close()
+            else:
+                self._executors[name].stop(wait=False)
+
+
+    def run(self, fn, args=(), names=None, timeout_s=None,
+                            lane=async.Lane.CONTROL, use_quarantine=True):
+        """Calls fn(EV3_OBJ, *args) for each of the named bricks (or all of
+        them if names is None) in parallel and waits up to timeout_s seconds
+        (the fleet's timeout_s if None) for them to finish. Returns an
+        OrderedDict of names to BrickResults.
+
+        """
+        if (names is None):
+            names = self.names()
+
+        if (timeout_s is None):
+            timeout_s = self.timeout_s
+
+        results = collections.OrderedDict()
+        pending = collections.OrderedDict()
+
+        for name in names:
+            if (name not in self._bricks):
+                raise FleetError('Unknown brick: %s' % name)
+
+            if (use_quarantine and self.is_quarantined(name)):
+                results[name] = BrickResult(name, None,
+                                FleetError('Quarantined: %s' % name), None)
+                continue
+
+            future = self._executors[name].submit(lane, _timed_call,
+                                        fn, self._bricks[name], args)
+
+            self._last_futures[name] = future
+            pending[name] = future
+
+        futures.wait(pending.values(), timeout_s)
+
+        for name, future in pending.items():
+            if (not future.done()):
+                self._quarantine(name)
+                results[name] = BrickResult(name, None,
+                                FleetError('Timed out: %s' % name), None)
+                continue
+
+            try:
+                value, latency_s = future.result()
+            except Exception as ex:
+                if (isinstance(ex, (ev3.EV3Error, EnvironmentError))):
+                    # The link failed so the brick is probably out of range.
+                    self._quarantine(name)
+
+                results[name] = BrickResult(name, None, ex, None)
+                continue
+
+            results[name] = BrickResult(name, value, None, latency_s)
+
+        return collections.OrderedDict((n, results[n]) for n in names)
+
+
+    def send(self, cmd, names=None, timeout_s=None, lane=async.Lane.CONTROL):
+        """Sends a DirectCommand to each of the named bricks (or all of them
+        if names is None). See run.
+
+        """
+        return self.run(_send_cmd, (cmd,), names, timeout_s, lane)
+
+
+    def is_quarantined(self, name):
+        """Returns True if the named brick is skipped by run. A brick leaves
+        quarantine once quarantine_s seconds have passed and the call that
+        put it there has finished.
+
+        """
+        quarantine_time = self._quarantined.get(name)
+
+        if (quarantine_time is None):
+            return False
+
+        if ((time.time() - quarantine_time) < self.quarantine_s or
+                not self._last_futures[name].done()):
+            return True
+
+        del self._quarantined[name]
+
+        return False
+
+
+    def quarantined(self):
+        """Returns the names of the bricks that are currently quarantined."""
+        return [n for n in self._bricks if self.is_quarantined(n)]
+
+
+    def release(self, name):
+        """Takes the named brick out of quarantine right away."""
+        self._quarantined.pop(name, None)
+
+
+    def _quarantine(self, name):
+        self._quarantined[name] = time.time()
+
+
+    def __enter__(self):
+        self.open()
+        return self
+
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+
+def _timed_call(fn, ev3_obj, args):
+    start = time.time()
+    value = fn(ev3_obj, *args)
+    return (value, (time.time() - start))
+
+
+def _open(ev3_obj):
+    ev3_obj.open()
+
+
+def _send_cmd(ev3_obj, cmd):
+    return cmd.send(ev3_obj)
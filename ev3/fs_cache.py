@@ -0,0 +1,201 @@
+"""A cache of the brick's filesystem metadata so that repeated queries about
+the same paths don't cost any radio time.
+
+Every EV3 object owns a FileSystemCache. The create_dir, delete_path, and
+download functions in the system_command module invalidate the affected
+entries automatically. Changes that are made by other means (i.e. by a
+program that is running on the brick) are picked up when an entry's TTL
+expires or after invalidate is called.
+
+NOTE:   Paths are used as keys after normalizing them so different spellings
+        of the same relative path share an entry. Absolute paths are not
+        resolved against the default directory.
+
+EXAMPLE USAGE:
+    from ev3 import *
+
+    with ev3.EV3() as brick:
+        brick.fs_cache.ttl_s = 30
+
+        if (not brick.fs_cache.exists('../prjs/demo/demo.rbf')):
+            print 'Not deployed.'
+
+        for dir_path, dir_names, files in brick.fs_cache.walk('../prjs'):
+            print dir_path, [f[2] for f in files]
+
+"""
+
+
+import posixpath
+import time
+
+import system_command
+
+
+DEFAULT_TTL_S = 10.0
+
+
+class FileSystemCache(object):
+    """Stores parsed list_files results keyed by normalized directory path.
+    Each entry is a tuple in the form (FETCH_TIME, DIR_NAMES, FILES) where
+    DIR_NAMES is a tuple of names without the trailing '/' and FILES is a
+    tuple of (MD5_SUM, FILE_LENGTH, FILE_NAME) tuples.
+
+    """
+
+
+    def __init__(self, ev3_obj, ttl_s=DEFAULT_TTL_S):
+        """Creates an empty cache for the given EV3 object. Entries older than
+        ttl_s seconds are refreshed the next time they are used. If ttl_s is
+        None then entries only expire when they are invalidated.
+
+        """
+        self._ev3_obj = ev3_obj
+        self._entries = {}
+
+        self.ttl_s = ttl_s
+
+
+    def list_files(self, path_str):
+        """Returns the same (DIRS, FILES) tuple as system_command.list_files
+        but only asks the brick if the path isn't cached or has expired.
+
+        """
+        fetch_time, dir_names, files = self._get_entry(path_str)
+
+        return ([(d + '/') for d in dir_names], list(files))
+
+
+    def exists(self, path_str):
+        """Returns True if a file or directory exists at the given path."""
+        parent, name = posixpath.split(_normalize(path_str))
+
+        if (not name or name in (posixpath.curdir, posixpath.pardir)):
+            return True
+
+        fetch_time, dir_names, files = self._get_entry(parent)
+
+        return ((name in dir_names) or
+                    (self._find_file(files, name) is not None))
+
+
+    def isdir(self, path_str):
+        """Returns True if a directory exists at the given path."""
+        parent, name = posixpath.split(_normalize(path_str))
+
+        if (not name or name in (posixpath.curdir, posixpath.pardir)):
+            return True
+
+        fetch_time, dir_names, files = self._get_entry(parent)
+
+        return (name in dir_names)
+
+
+    def stat(self, path_str):
+        """Returns the (MD5_SUM, FILE_LENGTH, FILE_NAME) tuple for the file at
+        the given path or None if there is no such file.
+
+        """
+        parent, name = posixpath.split(_normalize(path_str))
+
+        fetch_time, dir_names, files = self._get_entry(parent)
+
+        return self._find_file(files, name)
+
+
+    def walk(self, path_str):
+        """Generates (DIR_PATH, DIR_NAMES, FILES) tuples for the directory at
+        path_str and each of its subdirectories, top-down, in the same manner
+        as os.walk. FILES is a list of (MD5_SUM, FILE_LENGTH, FILE_NAME)
+        tuples.
+
+        """
+        pending = [_normalize(path_str)]
+
+        while (pending):
+            dir_path = pending.pop()
+
+            fetch_time, dir_names, files = self._get_entry(dir_path)
+
+            yield (dir_path, list(dir_names), list(files))
+
+            for d in reversed(dir_names):
+                pending.append(posixpath.join(dir_path, d))
+
+
+    def invalidate(self, *path_strs):
+        """Discards the entries for each of the given paths, everything below
+        them, and each of their parent directories. Call this after changing
+        the brick's filesystem without going through the system_command
+        module. The entries are scanned once however many paths are given.
+
+        """
+        keys = set(_normalize(path_str) for path_str in path_strs)
+
+        if (not keys):
+            return
+
+        for cached_key in self._entries.keys():
+            for parent in _parents(cached_key):
+                if (parent in keys):
+                    del self._entries[cached_key]
+                    break
+
+        for key in keys:
+            # dirname stops shortening the path at '/' (and at '' for
+            # relative paths, which is the default directory).
+            while (key not in (posixpath.curdir, posixpath.sep)):
+                key = (posixpath.dirname(key) or posixpath.curdir)
+                self._entries.pop(key, None)
+
+
+    def clear(self):
+        """Discards all of the entries."""
+        self._entries.clear()
+
+
+    def _get_entry(self, path_str):
+        key = _normalize(path_str)
+
+        entry = self._entries.get(key)
+
+        if (entry is not None):
+            if (self.ttl_s is None or
+                    (time.time() - entry[0]) < self.ttl_s):
+                return entry
+
+        dirs, files = system_command.list_files(self._ev3_obj, (key + '/'))
+
+        # Ignore './' and '../'.
+        dir_names = tuple(d[:-1] for d in dirs if d not in ('./', '../'))
+
+        entry = (time.time(), dir_names, tuple(files))
+        self._entries[key] = entry
+
+        return entry
+
+
+    def _find_file(self, files, name):
+        for f in files:
+            if (f[2] == name):
+                return f
+
+        return None
+
+
+def _normalize(path_str):
+    return posixpath.normpath(path_str or posixpath.curdir)
+
+
+def _parents(path_str):
+    """Generates the normalized path_str followed by each directory that it
+    is inside of. Paths that climb out of the default directory (i.e. '..'
+    or '../prjs') aren't inside of '.'.
+
+    """
+    yield path_str
+
+    while (path_str not in (posixpath.curdir, posixpath.sep,
+                                                        posixpath.pardir)):
+        path_str = (posixpath.dirname(path_str) or posixpath.curdir)
+        yield path_str
@@ -0,0 +1,407 @@
+"""Shares one brick link between several local processes.
+
+An RFCOMM device can only be opened by one process at a time. A Gateway owns
+the EV3 object and accepts clients on a local TCP port or Unix socket.
+Clients send and receive frames in the same format that the brick uses (see
+the message module):
+
+  - The message counter of each message is replaced with one that is unique
+    on the link and the client's own counter is restored in the reply.
+  - Clients take turns. One message is taken from each client that has
+    something queued before a second message is taken from any of them and
+    messages that don't expect replies are collected into a single write.
+  - Messages that the brick sends on its own (i.e. mailbox writes from a
+    running program) are forwarded to every client.
+
+A RemoteEV3 connects to a Gateway and can be used anywhere an EV3 can.
+
+EXAMPLE USAGE:
+    # The process that owns the link (or: python -m ev3.gateway).
+    from ev3 import *
+
+    with ev3.EV3() as brick:
+        gateway.Gateway(brick, ('127.0.0.1', 50400)).serve_forever()
+
+    # Any number of other processes.
+    from ev3 import *
+
+    with gateway.RemoteEV3(('127.0.0.1', 50400)) as brick:
+        brick.ui_draw_update()
+
+"""
+
+
+import argparse
+import collections
+import os
+import select
+import socket
+import threading
+
+import ev3
+import message
+
+
+DEFAULT_ADDRESS = ('127.0.0.1', 50400)
+
+# How often the link is checked for unsolicited messages while no client has
+# anything queued.
+POLL_INTERVAL_S = 0.01
+
+# How often serve_forever checks whether shutdown has been called.
+_ACCEPT_INTERVAL_S = 0.25
+
+
+class Gateway(object):
+    """Relays frames between local clients and a single EV3 object."""
+
+
+    def __init__(self, ev3_obj, address=DEFAULT_ADDRESS):
+        """Starts listening on the given address, which is either a
+        (HOST, PORT) tuple or the path of a Unix socket, and starts relaying
+        frames to the given (open) EV3 object.
+
+        """
+        self._ev3_obj = ev3_obj
+        self._condition = threading.Condition()
+        self._clients = []
+        self._next_client = 0
+        self._next_counter = 0
+        self._stopping = False
+
+        self._listener = _listen(address)
+        self.address = self._listener.getsockname()
+
+        ev3_obj.add_rx_handler(self._on_rx)
+
+        self._link_thread = threading.Thread(target=self._run_link)
+        self._link_thread.daemon = True
+        self._link_thread.start()
+
+
+    def serve_forever(self):
+        """Accepts clients until shutdown is called."""
+        while (not self._stopping):
+            readable, writable, exceptional = select.select([self._listener],
+                                                [], [], _ACCEPT_INTERVAL_S)
+            if (not readable or self._stopping):
+                continue
+
+            sock, address = self._listener.accept()
+            client = _Client(sock)
+
+            with self._condition:
+                self._clients.append(client)
+
+            thread = threading.Thread(target=self._run_client, args=(client,))
+            thread.daemon = True
+            thread.start()
+
+
+    def shutdown(self):
+        """Stops accepting clients, disconnects the existing ones, and stops
+        relaying. The EV3 object is left open.
+
+        """
+        with self._condition:
+            self._stopping = True
+            clients = list(self._clients)
+            self._condition.notify()
+
+        for client in clients:
+            client.close()
+
+        if (threading.current_thread() is not self._link_thread):
+            self._link_thread.join()
+
+        self._ev3_obj.remove_rx_handler(self._on_rx)
+
+        address = self._listener.getsockname()
+        self._listener.close()
+
+        if (isinstance(address, str) and os.path.exists(address)):
+            os.remove(address)
+
+
+    def _run_client(self, client):
+        while (True):
+            frame = _recv_frame(client.sock)
+
+            if (frame is None):
+                break
+
+            with self._condition:
+                client.queue.append(frame)
+                self._condition.notify()
+
+        with self._condition:
+            if (client in self._clients):
+                self._clients.remove(client)
+
+        client.close()
+
+
+    def _run_link(self):
+        while (True):
+            with self._condition:
+                if (not self._stopping and
+                        not [c for c in self._clients if c.queue]):
+                    self._condition.wait(POLL_INTERVAL_S)
+
+                if (self._stopping):
+                    return
+
+                next_round = self._take_round()
+
+            try:
+                if (next_round):
+                    self._send_round(next_round)
+                else:
+                    self._ev3_obj.poll()
+            except (ev3.EV3Error, EnvironmentError):
+                # The clients that were waiting on this round can't be told
+                # what happened to their messages.
+                for client, message_counter, msg in next_round:
+                    client.close()
+
+
+    def _take_round(self):
+        """Takes the next queued message from each client, starting with a
+        different client each time. Must be called with the condition held.
+
+        """
+        next_round = []
+
+        if (not self._clients):
+            return next_round
+
+        start = (self._next_client % len(self._clients))
+        self._next_client = (start + 1)
+
+        for client in (self._clients[start:] + self._clients[:start]):
+            if (client.queue):
+                message_counter, msg = client.queue.popleft()
+                next_round.append((client, message_counter, msg))
+
+        return next_round
+
+
+    def _send_round(self, next_round):
+        no_reply_msgs = []
+
+        for client, message_counter, msg in next_round:
+            if (not message.msg_expects_reply(msg)):
+                no_reply_msgs.append(msg)
+                continue
+
+            if (no_reply_msgs):
+                self._ev3_obj.send_messages(no_reply_msgs)
+                no_reply_msgs = []
+
+            reply = self._ev3_obj.send_message_for_reply(msg,
+                                                        self._new_counter())
+            client.send(message_counter, reply)
+
+        if (no_reply_msgs):
+            self._ev3_obj.send_messages(no_reply_msgs)
+
+
+    def _new_counter(self):
+        self._next_counter = ((self._next_counter + 1) & 0xFFFF)
+        return self._next_counter
+
+
+    def _on_rx(self, msg):
+        with self._condition:
+            clients = list(self._clients)
+
+        for client in clients:
+            client.send(0, msg)
+
+
+class RemoteEV3(ev3.EV3):
+    """An EV3 object that reaches the brick through a Gateway."""
+
+
+    def __init__(self, address=DEFAULT_ADDRESS, batch_window_s=None):
+        """Creates a new object but doesn't connect to the gateway. The
+        address is either a (HOST, PORT) tuple or the path of a Unix socket.
+
+        """
+        ev3.EV3.__init__(self, None, batch_window_s)
+        self._address = address
+
+
+    def open(self):
+        """Connects to the gateway."""
+        with self.lock:
+            if (self._port is None):
+                self._port = _SocketPort(_connect(self._address))
+
+
+class _Client(object):
+    """A connection to a gateway client and the frames it has queued."""
+
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.queue = collections.deque()
+
+        self._send_lock = threading.Lock()
+
+
+    def send(self, message_counter, msg):
+        frame = message.frame_message(msg, message_counter)
+
+        try:
+            with self._send_lock:
+                self.sock.sendall(frame)
+        except socket.error:
+            # The client's reader thread notices the broken connection.
+            pass
+
+
+    def close(self):
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except socket.error:
+            pass
+
+        self.sock.close()
+
+
+class _SocketPort(object):
+    """Provides the parts of the serial.Serial interface that EV3 objects use
+    on top of a socket.
+
+    """
+
+
+    def __init__(self, sock):
+        self._sock = sock
+
+
+    def read(self, num_bytes):
+        data = _recv_exact(self._sock, num_bytes)
+
+        if (data is None):
+            raise ev3.EV3Error('The gateway closed the connection.')
+
+        return data
+
+
+    def write(self, data):
+        self._sock.sendall(data)
+
+
+    def inWaiting(self):
+        readable, writable, exceptional = select.select([self._sock],
+                                                                [], [], 0)
+        return len(readable)
+
+
+    def close(self):
+        self._sock.close()
+
+
+def _listen(address):
+    if (isinstance(address, str)):
+        if (os.path.exists(address)):
+            os.remove(address)
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    else:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+
+    sock.bind(address)
+    sock.listen(socket.SOMAXCONN)
+
+    return sock
+
+
+def _connect(address):
+    if (isinstance(address, str)):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    else:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    sock.connect(address)
+
+    return sock
+
+
+def _recv_exact(sock, num_bytes):
+    """Returns num_bytes from the socket as a str or None if the connection
+    was closed first.
+
+    """
+    chunks = []
+
+    while (0 < num_bytes):
+        try:
+            chunk = sock.recv(num_bytes)
+        except socket.error:
+            return None
+
+        if (not chunk):
+            return None
+
+        chunks.append(chunk)
+        num_bytes -= len(chunk)
+
+    return ''.join(chunks)
+
+
+def _recv_frame(sock):
+    """Returns the next frame from a client in the form (MESSAGE_COUNTER, MSG)
+    or None if the connection was closed or the frame is malformed.
+
+    """
+    header = _recv_exact(sock, 2)
+    if (header is None):
+        return None
+
+    frame_len = message.parse_u16(header, 0)
+
+    # The frame must hold a message counter and a CommandType.
+    if (3 > frame_len):
+        return None
+
+    frame = _recv_exact(sock, frame_len)
+    if (frame is None):
+        return None
+
+    frame = bytearray(frame)
+
+    return (message.parse_u16(frame, 0), frame[2:])
+
+
+def _parse_address(address_str):
+    if (':' in address_str):
+        host, port = address_str.rsplit(':', 1)
+        return (host, int(port))
+
+    return address_str
+
+
+if ("__main__" == __name__):
+    parser = argparse.ArgumentParser(description='Shares an EV3 link ' +
+                                            'between local processes.')
+    parser.add_argument('--rfcomm', default=ev3.EV3.DEFAULT_RFCOMM_PORT,
+                                help='the port that the brick is bound to')
+    parser.add_argument('--listen', default='%s:%d' % DEFAULT_ADDRESS,
+                                help='HOST:PORT or the path of a Unix socket')
+    args = parser.parse_args()
+
+    with ev3.EV3(args.rfcomm) as brick:
+        gateway = Gateway(brick, _parse_address(args.listen))
+
+        print 'Listening on %s.' % (gateway.address,)
+
+        try:
+            gateway.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            gateway.shutdown()
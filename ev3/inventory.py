@@ -0,0 +1,246 @@
+"""Keeps track of the devices that are connected to the brick's ports.
+
+Asking each port for its type, mode, and name before every read costs two
+round trips per port. A DeviceInventory asks once and then only reads the
+brick's device list (a single DirectCommand with a 33 byte reply) to find
+out if anything has been connected or disconnected since. The ports are
+only scanned again when the list reports a change, and the list itself is
+only read when check_interval_s has passed since it was last read.
+
+The inventory is a read-only mapping of (LAYER, PORT) tuples to PortInfo
+tuples. PORT is an InputPort value (i.e. InputPort.PORT_1 or
+InputPort.PORT_A for the motor on output port A).
+
+NOTE:   The device list doesn't report mode changes so a mode that is
+        changed by reading a port in another mode isn't noticed until the
+        next scan. Ports without a device have a mode and name of None.
+
+EXAMPLE USAGE:
+    from ev3 import *
+
+    with ev3.EV3() as brick:
+        devices = inventory.DeviceInventory(brick)
+
+        info = devices[(direct_command.USB_CHAIN_LAYER_MASTER,
+                                            direct_command.InputPort.PORT_1)]
+        print info.name, info.mode
+
+        for info in devices.find(direct_command.DeviceType.EV3_GYROSCOPE):
+            print 'Gyro on port', info.port
+
+"""
+
+
+import collections
+import threading
+import time
+
+import direct_command
+
+
+DEFAULT_CHECK_INTERVAL_S = 1.0
+
+# The cached queries whose replies depend on the connected devices.
+_DEVICE_QUERIES = ('input_device_get_name', 'input_device_get_modename')
+
+# The ports of each layer in the order that the device list uses.
+_INPUT_PORTS = (direct_command.InputPort.PORT_1,
+                direct_command.InputPort.PORT_2,
+                direct_command.InputPort.PORT_3,
+                direct_command.InputPort.PORT_4)
+
+_OUTPUT_PORTS = (direct_command.InputPort.PORT_A,
+                    direct_command.InputPort.PORT_B,
+                    direct_command.InputPort.PORT_C,
+                    direct_command.InputPort.PORT_D)
+
+_PORTS = (_INPUT_PORTS + _OUTPUT_PORTS)
+
+# The number of ports whose type, mode, and name fit in one reply.
+_PORTS_PER_SCAN = (direct_command.MAX_CMD_LEN //
+                                        (2 + direct_command.MAX_NAME_STR_LEN))
+
+
+class InventoryError(Exception):
+    """Subclass for reporting errors."""
+    pass
+
+
+PortInfo = collections.namedtuple('PortInfo', ('layer', 'port',
+                                                'device_type', 'mode', 'name'))
+
+
+class DeviceInventory(collections.Mapping):
+    """Maps (LAYER, PORT) tuples to the PortInfo of each input and output
+    port on the given layers.
+
+    """
+
+
+    def __init__(self, ev3_obj,
+                        layers=(direct_command.USB_CHAIN_LAYER_MASTER,),
+                        check_interval_s=DEFAULT_CHECK_INTERVAL_S):
+        """Creates an inventory of the ports on the given USB chain layers
+        but doesn't read anything until it is used. The device list is read
+        at most once every check_interval_s seconds; if check_interval_s is
+        None then it is only read when check is called.
+
+        """
+        for layer in layers:
+            if (not (0 <= layer < direct_command.MAX_CHAIN_LAYERS)):
+                raise InventoryError('Invalid layer: %d' % layer)
+
+        self._ev3_obj = ev3_obj
+        self._lock = threading.Lock()
+
+        self._keys = tuple((layer, port) for layer in sorted(set(layers))
+                                                for port in _PORTS)
+
+        self._ports = None
+        self._device_types = None
+
+        self.check_interval_s = check_interval_s
+        self.check_time = None
+
+
+    def __getitem__(self, key):
+        return self._current()[key]
+
+
+    def __contains__(self, key):
+        # The keys are fixed so this never reads from the brick.
+        return (key in self._keys)
+
+
+    def __iter__(self):
+        return iter(self._keys)
+
+
+    def __len__(self):
+        return len(self._keys)
+
+
+    def cached(self, key):
+        """Returns the PortInfo of the given (LAYER, PORT) as of the last
+        check or None if the ports haven't been scanned yet or the key isn't
+        in the inventory. Never reads from the brick.
+
+        """
+        with self._lock:
+            if (self._ports is None):
+                return None
+
+            return self._ports.get(key)
+
+
+    def find(self, device_type):
+        """Returns a list of the PortInfo of each port that has a device of
+        the given DeviceType.
+
+        """
+        ports = self._current()
+
+        return [ports[key] for key in self._keys
+                                    if device_type == ports[key].device_type]
+
+
+    def check(self):
+        """Reads the device list and scans the ports again if it reports a
+        change. Returns a list of the keys whose PortInfo changed.
+
+        """
+        with self._lock:
+            return self._check()
+
+
+    def rescan(self):
+        """Scans every port regardless of the device list. Returns a list of
+        the keys whose PortInfo changed.
+
+        """
+        with self._lock:
+            self._device_types = None
+            return self._check()
+
+
+    def _current(self):
+        # The interval is checked under the lock so that threads that find
+        # the ports stale at the same time don't each read the list.
+        with self._lock:
+            if (self._ports is None or
+                    (self.check_interval_s is not None and
+                        self.check_interval_s <=
+                                        (time.time() - self.check_time))):
+                self._check()
+
+            return self._ports
+
+
+    def _check(self):
+        # The caller holds _lock.
+        cmd = direct_command.DirectCommand()
+        cmd.add_input_device_list()
+
+        (device_types, changed), = cmd.send(self._ev3_obj)
+
+        self.check_time = time.time()
+
+        device_types = dict((key, device_types[_list_index(key)])
+                                                    for key in self._keys)
+
+        if (not changed and device_types == self._device_types):
+            return []
+
+        return self._scan(device_types)
+
+
+    def _scan(self, device_types):
+        # Empty ports aren't asked for their mode and name.
+        ports = dict((key, PortInfo(key[0], key[1], device_types[key],
+                                                                None, None))
+                                                        for key in self._keys)
+
+        keys = [key for key in self._keys if
+                    (direct_command.DeviceType.PORT_EMPTY != device_types[key])]
+
+        for i in range(0, len(keys), _PORTS_PER_SCAN):
+            scanned = keys[i:(i + _PORTS_PER_SCAN)]
+
+            cmd = direct_command.DirectCommand()
+            for layer, port in scanned:
+                cmd.add_input_device_get_typemode(port, layer)
+                cmd.add_input_device_get_name(port, layer)
+
+            reply = cmd.send(self._ev3_obj)
+
+            for j, key in enumerate(scanned):
+                (device_type, mode), name = reply[(2 * j):((2 * j) + 2)]
+                ports[key] = PortInfo(key[0], key[1], device_type, mode, name)
+
+        previous = (self._ports or {})
+        changed = [key for key in self._keys
+                                        if ports[key] != previous.get(key)]
+
+        self._ports = ports
+        self._device_types = device_types
+
+        query_cache = getattr(self._ev3_obj, 'query_cache', None)
+        if (changed and query_cache is not None):
+            for name in _DEVICE_QUERIES:
+                query_cache.invalidate(name)
+
+        return changed
+
+
+def _list_index(key):
+    """Returns the index of the given (LAYER, PORT) in the device list."""
+    layer, port = key
+
+    if (port in _OUTPUT_PORTS):
+        return ((direct_command.MAX_CHAIN_LAYERS *
+                                        direct_command.PORTS_PER_LAYER) +
+                    (layer * direct_command.PORTS_PER_LAYER) +
+                    _OUTPUT_PORTS.index(port))
+
+    return ((layer * direct_command.PORTS_PER_LAYER) +
+                                                    _INPUT_PORTS.index(port))
@@ -0,0 +1,245 @@
+"""Typed, bidirectional messaging with programs that are running on the brick.
+
+Programs on the brick use named mailboxes to exchange text, numbers, and
+logic values (see the EV3-G Messaging block). A MailboxChannel encodes
+values in the same formats, coalesces writes so that several of them go out
+in a single write to the port, and collects the messages that the brick
+sends back into one queue per mailbox.
+
+Writes are held until flush or read is called (or until the pending
+messages would no longer fit in one packet). A mailbox on the brick only
+holds the latest value so a pending write is replaced by a newer write to
+the same mailbox.
+
+EXAMPLE USAGE:
+    from ev3 import *
+
+    with ev3.EV3() as brick:
+        channel = mailbox.MailboxChannel(brick)
+
+        channel.write_number('speed', 50)
+        channel.write_text('mode', 'follow')
+        channel.flush()
+
+        print channel.read_number('distance', timeout_s=1.0)
+
+"""
+
+
+import collections
+import Queue
+import struct
+import time
+
+import message
+import system_command
+
+
+# How often read polls the brick while it waits for a message.
+POLL_INTERVAL_S = 0.01
+
+
+class MailboxError(Exception):
+    """Subclass for reporting errors."""
+    pass
+
+
+class Encoding(object):
+    """The formats that EV3-G uses for mailbox messages."""
+    TEXT    = 'text'    # Null-terminated string
+    NUMBER  = 'number'  # 32bit floating point value (single precision)
+    LOGIC   = 'logic'   # A single byte that is either 0 or 1
+    RAW     = 'raw'     # Unformatted bytes
+
+
+def encode(value, encoding):
+    """Returns the given value as a bytearray in the given Encoding."""
+    result = bytearray()
+
+    if (Encoding.TEXT == encoding):
+        message.append_str(result, str(value))
+    elif (Encoding.NUMBER == encoding):
+        message.append_float(result, value)
+    elif (Encoding.LOGIC == encoding):
+        message.append_u8(result, int(bool(value)))
+    elif (Encoding.RAW == encoding):
+        result.extend(value)
+    else:
+        raise MailboxError('Unknown encoding: %s' % encoding)
+
+    return result
+
+
+def decode(byte_seq, encoding):
+    """Returns the value of a message payload in the given Encoding."""
+    if (Encoding.TEXT == encoding):
+        return message.parse_null_terminated_str(byte_seq, 0, len(byte_seq))
+    elif (Encoding.NUMBER == encoding):
+        return message.parse_float(byte_seq, 0)
+    elif (Encoding.LOGIC == encoding):
+        return bool(byte_seq[0])
+    elif (Encoding.RAW == encoding):
+        return tuple(byte_seq)
+
+    raise MailboxError('Unknown encoding: %s' % encoding)
+
+
+class MailboxChannel(object):
+    """Sends and receives mailbox messages over an EV3 object."""
+
+
+    def __init__(self, ev3_obj):
+        """Creates a new channel and starts collecting the messages that the
+        brick sends to any mailbox.
+
+        """
+        self._ev3_obj = ev3_obj
+        self._pending = collections.OrderedDict()
+        self._pending_len = 0
+        self._queues = collections.defaultdict(Queue.Queue)
+
+        ev3_obj.add_rx_handler(self._on_rx)
+
+
+    def write(self, name_str, value, encoding=Encoding.RAW):
+        """Queues a message for the named mailbox."""
+        msg = _write_mailbox_msg(name_str, encode(value, encoding))
+
+        replaced = self._pending.pop(name_str, None)
+        if (replaced is not None):
+            self._pending_len -= len(replaced)
+
+        if (system_command.MAX_TX_BYTES < (self._pending_len + len(msg))):
+            self.flush()
+
+        self._pending[name_str] = msg
+        self._pending_len += len(msg)
+
+
+    def write_text(self, name_str, text_str):
+        """Queues a text message for the named mailbox."""
+        self.write(name_str, text_str, Encoding.TEXT)
+
+
+    def write_number(self, name_str, value):
+        """Queues a numeric message for the named mailbox."""
+        self.write(name_str, value, Encoding.NUMBER)
+
+
+    def write_logic(self, name_str, value):
+        """Queues a logic message for the named mailbox."""
+        self.write(name_str, value, Encoding.LOGIC)
+
+
+    def write_raw(self, name_str, byte_seq):
+        """Queues a message of unformatted bytes for the named mailbox."""
+        self.write(name_str, byte_seq, Encoding.RAW)
+
+
+    def flush(self):
+        """Sends all of the queued messages with a single write."""
+        if (self._pending):
+            msgs = self._pending.values()
+
+            self._pending.clear()
+            self._pending_len = 0
+
+            self._ev3_obj.send_messages(msgs)
+
+
+    def read(self, name_str, encoding=Encoding.RAW, timeout_s=None):
+        """Returns the oldest message that the brick has sent to the named
+        mailbox, decoded with the given Encoding. Pending writes are flushed
+        first. Polls the brick until a message arrives or timeout_s seconds
+        have passed (raises a MailboxError). If timeout_s is None then it
+        waits forever.
+
+        """
+        self.flush()
+
+        queue = self._queues[name_str]
+
+        start = time.time()
+        while (True):
+            try:
+                return decode(queue.get_nowait(), encoding)
+            except Queue.Empty:
+                pass
+
+            self._ev3_obj.poll()
+
+            if (not queue.empty()):
+                continue
+
+            if (timeout_s is not None and timeout_s <= (time.time() - start)):
+                raise MailboxError('Timed out waiting for: %s' % name_str)
+
+            time.sleep(POLL_INTERVAL_S)
+
+
+    def read_text(self, name_str, timeout_s=None):
+        """Returns the oldest text message for the named mailbox."""
+        return self.read(name_str, Encoding.TEXT, timeout_s)
+
+
+    def read_number(self, name_str, timeout_s=None):
+        """Returns the oldest numeric message for the named mailbox."""
+        return self.read(name_str, Encoding.NUMBER, timeout_s)
+
+
+    def read_logic(self, name_str, timeout_s=None):
+        """Returns the oldest logic message for the named mailbox."""
+        return self.read(name_str, Encoding.LOGIC, timeout_s)
+
+
+    def read_raw(self, name_str, timeout_s=None):
+        """Returns the oldest message for the named mailbox as a tuple of
+        bytes.
+
+        """
+        return self.read(name_str, Encoding.RAW, timeout_s)
+
+
+    def close(self):
+        """Flushes any pending writes and stops collecting messages."""
+        self.flush()
+        self._ev3_obj.remove_rx_handler(self._on_rx)
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+
+    def _on_rx(self, msg):
+        if (system_command.Command.WRITEMAILBOX != msg[1]):
+            return
+
+        name_len = msg[2]
+        name_str = message.parse_null_terminated_str(msg, 3, name_len)
+
+        index = (3 + name_len)
+        payload_len = message.parse_u16(msg, index)
+        index += 2
+
+        self._queues[name_str].put(msg[index:(index + payload_len)])
+
+
+def _write_mailbox_msg(name_str, byte_seq):
+    if (not name_str.endswith('\0')):
+        name_str += '\0'
+
+    msg = bytearray()
+    msg.append(system_command.CommandType.SYSTEM_COMMAND_NO_REPLY)
+    msg.append(system_command.Command.WRITEMAILBOX)
+
+    message.append_u8(msg, len(name_str))
+    message.append_str(msg, name_str)
+
+    message.append_u16(msg, len(byte_seq))
+    msg.extend(byte_seq)
+
+    return msg
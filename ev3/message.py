@@ -10,44 +10,169 @@ import system_command
 import direct_command
 
 
+# Length/message_counter header and the value types of the messages.
+_HEADER = struct.Struct('<HH')
+_U16 = struct.Struct('<H')
+_U32 = struct.Struct('<I')
+_FLOAT = struct.Struct('<f')
+
+# The types that the parse helpers read from without copying. A memoryview
+# is copied first because on Python 2 its items are 1-char strs and bytes()
+# of it returns its repr.
+_BUFFER_TYPES = (bytearray, bytes)
+
+# The largest frame: the length header and a message of 0xFFFF bytes.
+MAX_FRAME_LEN = (2 + 0xFFFF)
+
+DEFAULT_READ_BUFFER_SIZE = (2 * MAX_FRAME_LEN)
+
+# Records every frame that is written or read (see the trace module).
+_trace_writer = None
+
+
 class MessageError(Exception):
     """Subclass for reporting errors."""
     pass
 
 
-def send_message_for_reply(port, msg, message_counter=0x1234):
-    """Sends the message and waits for a reply. The msg is expected to be a
-    sequence of bytes and it should not contain the length/message_counter
-    header. Returns an sequence of bytes without the length/message_counter
-    header.
+class FrameReader(object):
+    """Reads frames from a port through a single receive buffer that is
+    allocated once. Each read takes whatever the port has waiting (at least
+    enough to finish the frame that is being parsed) so the replies to
+    several messages that are in flight at once usually arrive with one
+    read. Ports that have a readinto method fill the buffer directly.
 
     """
-    if (not msg_expects_reply(msg)):
-        raise MessageError('The message is not a type that expects a reply.')
 
-    # Message length includes the two message_counter bytes.
-    msg_len = (2 + len(msg))
 
-    msg_counter_lsb = (message_counter & 0xFF)
-    msg_counter_msb = ((message_counter >> 8) & 0xFF)
+    def __init__(self, port, buffer_size=DEFAULT_READ_BUFFER_SIZE):
+        """Creates a reader for the given port. The buffer_size is raised to
+        MAX_FRAME_LEN if it is smaller.
 
-    buf = [(msg_len & 0xFF),
-                ((msg_len >> 8) & 0xFF),
-                msg_counter_lsb,
-                msg_counter_msb]
+        """
+        self.port = port
 
-    _write_bytes(port, buf)
-    _write_bytes(port, msg)
+        self._readinto = getattr(port, 'readinto', None)
+        self._in_waiting = getattr(port, 'inWaiting', None)
+
+        self._buf = bytearray(max(buffer_size, MAX_FRAME_LEN))
+        self._view = memoryview(self._buf)
+
+        # The unparsed bytes are self._buf[self._start:self._end].
+        self._start = 0
+        self._end = 0
+
+
+    def buffered(self):
+        """Returns the number of bytes that have been read from the port but
+        not yet returned in a frame.
+
+        """
+        return (self._end - self._start)
+
+
+    def read_message(self):
+        """Reads a single message of any type. Returns a tuple in the form
+        (MESSAGE_COUNTER, MSG) where MSG is a bytearray, copied out of the
+        receive buffer, without the length/message_counter header.
+
+        """
+        message_counter, start, end = self._next_frame()
+        return (message_counter, self._buf[start:end])
+
+
+    def _next_frame(self):
+        """Returns a tuple in the form (MESSAGE_COUNTER, START, END) where
+        START and END are the bounds of the next message in the buffer.
+
+        """
+        if (_HEADER.size > (self._end - self._start)):
+            self._fill(_HEADER.size)
+
+        msg_len, message_counter = _HEADER.unpack_from(self._buf, self._start)
+
+        # Message length includes the two message_counter bytes.
+        if (2 > msg_len):
+            raise MessageError('Received a frame without a message counter.')
+
+        frame_len = (2 + msg_len)
 
-    expected_len = _read_bytes(port, 2)
-    expected_len = (expected_len[0] | (expected_len[1] << 8))
+        if (frame_len > (self._end - self._start)):
+            self._fill(frame_len)
 
-    reply = _read_bytes(port, expected_len)
+        start = self._start
+        self._start += frame_len
 
-    if (reply[0] != msg_counter_lsb or reply[1] != msg_counter_msb):
+        return (message_counter, (start + _HEADER.size), (start + frame_len))
+
+
+    def _fill(self, num_bytes):
+        """Reads from the port until at least num_bytes unparsed bytes are in
+        the buffer.
+
+        """
+        if ((len(self._buf) - self._start) < num_bytes):
+            # Move the unparsed bytes to the front. The sizes match so the
+            # buffer isn't resized (it can't be while views of it exist).
+            unparsed = (self._end - self._start)
+            self._buf[:unparsed] = self._buf[self._start:self._end]
+            self._start = 0
+            self._end = unparsed
+
+        missing = (num_bytes - (self._end - self._start))
+
+        while (0 < missing):
+            size = missing
+            if (self._in_waiting is not None):
+                size = max(size, self._in_waiting())
+
+            size = min(size, (len(self._buf) - self._end))
+
+            if (self._readinto is not None):
+                count = self._readinto(self._view[self._end:(self._end + size)])
+            else:
+                data = self.port.read(size)
+                count = len(data)
+                self._buf[self._end:(self._end + count)] = data
+
+            if (not count):
+                raise MessageError('Timed out waiting for a message.')
+
+            self._end += count
+            missing -= count
+
+
+def set_trace_writer(writer):
+    """Sets the object whose record_tx and record_rx methods are called with
+    (MESSAGE_COUNTER, MSG) for each frame that is written to or read from any
+    port. Pass None to stop tracing.
+
+    """
+    global _trace_writer
+    _trace_writer = writer
+
+
+def send_message_for_reply(port, msg, message_counter=0x1234,
+                                                            rx_handler=None,
+                                                            reader=None):
+    """Sends the message and waits for a reply. The msg is expected to be a
+    sequence of bytes and it should not contain the length/message_counter
+    header. Returns a bytearray without the length/message_counter header.
+    See read_reply for a description of the rx_handler and reader
+    parameters.
+
+    """
+    if (not msg_expects_reply(msg)):
+        raise MessageError('The message is not a type that expects a reply.')
+
+    write_message(port, msg, message_counter)
+
+    reply_counter, reply = read_reply(port, rx_handler, reader)
+
+    if (reply_counter != (message_counter & 0xFFFF)):
         raise MessageError('Reply message counter does not match.')
 
-    return reply[2:]
+    return reply
 
 
 def send_message_no_reply(port, msg, message_counter=0x1234):
@@ -55,19 +180,103 @@ def send_message_no_reply(port, msg, message_counter=0x1234):
     if (msg_expects_reply(msg)):
         raise MessageError('The message is a type that expects a reply.')
 
-    # Message length includes the two message_counter bytes.
-    msg_len = (2 + len(msg))
+    write_message(port, msg, message_counter)
+
 
-    msg_counter_lsb = (message_counter & 0xFF)
-    msg_counter_msb = ((message_counter >> 8) & 0xFF)
+def write_message(port, msg, message_counter=0x1234):
+    """Writes the message and its length/message_counter header without
+    reading anything back. This allows several messages to be in flight at
+    once; use read_reply to collect their replies.
 
-    buf = [(msg_len & 0xFF),
-                ((msg_len >> 8) & 0xFF),
-                msg_counter_lsb,
-                msg_counter_msb]
+    """
+    _write_bytes(port, frame_message(msg, message_counter))
+
+    if (_trace_writer is not None):
+        _trace_writer.record_tx(message_counter, msg)
+
+
+def write_messages(port, msgs, message_counter=0x1234):
+    """Writes several messages that don't expect replies with a single write
+    to the port.
+
+    """
+    buf = bytearray()
+
+    for msg in msgs:
+        if (msg_expects_reply(msg)):
+            raise MessageError('The message is a type that expects a reply.')
+
+        buf += frame_message(msg, message_counter)
 
     _write_bytes(port, buf)
-    _write_bytes(port, msg)
+
+    if (_trace_writer is not None):
+        for msg in msgs:
+            _trace_writer.record_tx(message_counter, msg)
+
+
+def frame_message(msg, message_counter=0x1234):
+    """Returns a bytearray that holds the message preceded by its
+    length/message_counter header.
+
+    """
+    frame = bytearray(_HEADER.size)
+
+    # Message length includes the two message_counter bytes.
+    _HEADER.pack_into(frame, 0, ((2 + len(msg)) & 0xFFFF),
+                                                (message_counter & 0xFFFF))
+    frame += _as_buffer(msg)
+
+    return frame
+
+
+def read_reply(port, rx_handler=None, reader=None):
+    """Reads the next reply from the port. Returns a tuple in the form
+    (MESSAGE_COUNTER, REPLY) where REPLY is a bytearray without the
+    length/message_counter header.
+
+    Messages that the brick sends on its own (i.e. mailbox writes from a
+    running program) can arrive ahead of the reply. Each of them is passed to
+    rx_handler (without its header) or discarded if rx_handler is None.
+
+    If reader is a FrameReader for the port then the reply is read through
+    its buffer (see read_message).
+
+    """
+    while (True):
+        message_counter, msg = read_message(port, reader)
+
+        if (not msg_is_unsolicited(msg)):
+            return (message_counter, msg)
+
+        if (rx_handler is not None):
+            rx_handler(msg)
+
+
+def read_message(port, reader=None):
+    """Reads a single message of any type from the port. Returns a tuple in
+    the form (MESSAGE_COUNTER, MSG) where MSG is a bytearray without the
+    length/message_counter header.
+
+    If reader is a FrameReader for the port then the message is read through
+    its buffer. Bytes that the port already has waiting are read along with
+    the message and the following calls parse them without reading again.
+
+    """
+    if (reader is not None):
+        message_counter, msg = reader.read_message()
+    else:
+        expected_len = _U16.unpack_from(_read_bytes(port, 2), 0)[0]
+
+        msg = _read_bytes(port, expected_len)
+
+        message_counter = _U16.unpack_from(msg, 0)[0]
+        del msg[:2]
+
+    if (_trace_writer is not None):
+        _trace_writer.record_rx(message_counter, msg)
+
+    return (message_counter, msg)
 
 
 def msg_expects_reply(msg):
@@ -75,59 +284,67 @@ def msg_expects_reply(msg):
     given message should not include the length/message_counter header.
 
     """
-    if (system_command.CommandType.SYSTEM_COMMAND_REPLY == msg[0]):
+    msg_type = _msg_type(msg)
+
+    if (system_command.CommandType.SYSTEM_COMMAND_REPLY == msg_type):
         return True
 
-    if (direct_command.CommandType.DIRECT_COMMAND_REPLY == msg[0]):
+    if (direct_command.CommandType.DIRECT_COMMAND_REPLY == msg_type):
         return True
 
     return False
 
 
+def msg_is_unsolicited(msg):
+    """Returns True if the given message, read from the brick, is a command
+    rather than a reply (i.e. a mailbox write from a program that is running
+    on the brick). The given message should not include the
+    length/message_counter header.
+
+    """
+    return (_msg_type(msg) in (system_command.CommandType.SYSTEM_COMMAND_REPLY,
+                        system_command.CommandType.SYSTEM_COMMAND_NO_REPLY,
+                        direct_command.CommandType.DIRECT_COMMAND_REPLY,
+                        direct_command.CommandType.DIRECT_COMMAND_NO_REPLY))
+
+
 def parse_u16(byte_seq, index):
-    """Parses a u32 value at the given index from the byte_seq."""
-    return (byte_seq[index] | (byte_seq[index + 1] << 8))
+    """Parses a u16 value at the given index from the byte_seq."""
+    return _U16.unpack_from(_as_buffer(byte_seq), index)[0]
 
 
 def parse_u32(byte_seq, index):
     """Parses a u32 value at the given index from the byte_seq."""
-    return (byte_seq[index] |
-                (byte_seq[index + 1] << 8) |
-                (byte_seq[index + 2] << 16) |
-                (byte_seq[index + 3] << 24))
+    return _U32.unpack_from(_as_buffer(byte_seq), index)[0]
 
 
 def parse_str(byte_seq, index, length=None):
     """Parses a string of length chars."""
     if (length is None):
-        return ''.join([chr(c) for c in byte_seq[index:]])
+        return bytes(_as_buffer(byte_seq)[index:])
     else:
-        return ''.join([chr(c) for c in byte_seq[index:(index + length)]])
+        return bytes(_as_buffer(byte_seq)[index:(index + length)])
 
 
 def parse_null_terminated_str(byte_seq, index, length):
     """Parses a null-terminated string of up to length chars."""
-    result = []
+    result = bytes(_as_buffer(byte_seq)[index:(index + length)])
 
-    for i in range(index, (index + length)):
-        if (0x00 != byte_seq[i]):
-            result.append(chr(byte_seq[i]))
-        else:
-            break
+    end = result.find('\0')
+    if (-1 != end):
+        return result[:end]
 
-    return ''.join(result)
+    return result
 
 
 def parse_float(byte_seq, index):
     """Parses a 32bit floating point number."""
-    str_value = ''.join([chr(c) for c in byte_seq[index:(index + 4)]])
-    return struct.unpack('<f', str_value)[0]
+    return _FLOAT.unpack_from(_as_buffer(byte_seq), index)[0]
 
 
 def append_float(byte_list, value):
     """Appends a 32bit floating point number."""
-    value_str = struct.pack('<f', value).ljust(4, '\0')
-    map(byte_list.append, [ord(c) for c in value_str])
+    byte_list.extend(bytearray(_FLOAT.pack(value)))
 
 
 def append_u8(byte_list, value):
@@ -137,30 +354,47 @@ def append_u8(byte_list, value):
 
 def append_u16(byte_list, value):
     """Appends the given value to the list in little-endian order."""
-    byte_list.append(value & 0xFF)
-    byte_list.append((value >> 8) & 0xFF)
+    byte_list.extend(bytearray(_U16.pack(value & 0xFFFF)))
 
 
 def append_u32(byte_list, value):
     """Appends the given value to the list in little-endian order."""
-    byte_list.append(value & 0xFF)
-    byte_list.append((value >> 8) & 0xFF)
-    byte_list.append((value >> 16) & 0xFF)
-    byte_list.append((value >> 24) & 0xFF)
+    byte_list.extend(bytearray(_U32.pack(value & 0xFFFFFFFF)))
 
 
 def append_str(byte_list, str_value):
     """Appends a null-terminated string."""
-    if ('\0' != str_value[-1]):
+    if (not str_value.endswith('\0')):
         str_value += '\0'
 
-    for c in str_value:
-        byte_list.append(ord(c))
+    byte_list.extend(bytearray(str_value))
+
+
+def _as_buffer(byte_seq):
+    """Returns byte_seq if it is a bytearray or a str, a str copy of a
+    memoryview, or a bytearray copy of any other sequence of byte values.
+
+    """
+    if (isinstance(byte_seq, _BUFFER_TYPES)):
+        return byte_seq
+
+    if (isinstance(byte_seq, memoryview)):
+        return byte_seq.tobytes()
+
+    return bytearray(byte_seq)
+
+
+def _msg_type(msg):
+    """Returns the first byte of the message as an int whatever the type of
+    the message is.
+
+    """
+    return bytearray(msg[:1])[0]
 
 
 def _read_bytes(port, num_bytes):
-    return [ord(i) for i in port.read(num_bytes)]
+    return bytearray(port.read(num_bytes))
 
 
 def _write_bytes(port, byte_seq):
-    port.write(''.join([chr(i) for i in byte_seq]))
+    port.write(bytes(_as_buffer(byte_seq)))
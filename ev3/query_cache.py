@@ -0,0 +1,193 @@
+"""A cache of the replies to DirectCommand queries whose answers rarely change
+so that repeated identity and inventory lookups don't cost any radio time.
+
+Every EV3 object owns a QueryCache. The DirectCommand shortcuts that are
+listed in DEFAULT_TTLS (i.e. brick.ui_read_get_fw_vers() or
+brick.input_device_get_name(port)) are answered from it. Each reply is kept
+until the TTL of its query expires; a TTL of None keeps it until it is
+invalidated. The version and build queries never expire because the answers
+can only change when the brick is reflashed. The brick name is invalidated
+automatically when it is changed through brick.com_set_brickname(...).
+
+NOTE:   INVALIDATED_BY only applies to the DirectCommand shortcuts of an
+        EV3 object. Changes that are made by other means (i.e. by a
+        DirectCommand with add_com_set_brickname that is built and sent
+        directly or by a sensor being plugged in) are picked up when the
+        entry's TTL expires or after invalidate is called.
+
+The cache is cleared when its EV3 object is closed so a reconnect (possibly
+to a different brick on the same port) never sees the old brick's replies.
+
+EXAMPLE USAGE:
+    from ev3 import *
+
+    with ev3.EV3() as brick:
+        brick.query_cache.set_ttl('input_device_get_name', 0.5)
+
+        # Only the first call is sent to the brick.
+        for i in range(10):
+            print brick.ui_read_get_fw_vers()[0]
+
+        # After swapping sensors:
+        brick.query_cache.invalidate('input_device_get_name')
+
+"""
+
+
+import threading
+import time
+
+import direct_command
+
+
+# The TTL in seconds of each query that is cached. Queries that aren't listed
+# are always sent to the brick.
+DEFAULT_TTLS = {
+    'ui_read_get_fw_vers':          None,
+    'ui_read_get_hw_vers':          None,
+    'ui_read_get_fw_build':         None,
+    'ui_read_get_os_vers':          None,
+    'ui_read_get_os_build':         None,
+    'ui_read_get_version':          None,
+    'com_get_brickname':            60.0,
+    'input_device_get_name':        2.0,
+    'input_device_get_modename':    2.0,
+}
+
+# The queries that can be cached (see QueryCache.set_ttl). They only read
+# from the brick; commands that change anything must never be answered from
+# the cache.
+QUERIES = frozenset(list(DEFAULT_TTLS) + [
+    'ui_read_get_vbatt',
+    'ui_read_get_ibatt',
+    'ui_read_get_tbatt',
+    'ui_read_get_imotor',
+    'ui_read_get_lbatt',
+    'ui_read_get_ip',
+    'ui_read_get_sdcard',
+    'ui_read_get_usbstick',
+    'input_device_get_typemode',
+    'input_device_get_minmax',
+    'input_device_list',
+    'output_get_type',
+])
+
+# The queries whose entries are discarded after each of the EV3 object's
+# DirectCommand shortcuts (but not after DirectCommands that are sent
+# directly).
+INVALIDATED_BY = {
+    'com_set_brickname':            ('com_get_brickname',),
+}
+
+
+class QueryCacheError(Exception):
+    """Subclass for reporting errors."""
+    pass
+
+
+class QueryCache(object):
+    """Stores the replies to DirectCommand queries keyed by (NAME, ARGS)
+    where NAME is the name of the add_* function without the 'add_' prefix.
+    Each entry is a tuple in the form (FETCH_TIME, REPLY).
+
+    """
+
+
+    def __init__(self, ev3_obj, ttls=None):
+        """Creates an empty cache for the given EV3 object. The ttls are a
+        dict of query names to TTLs that replace the DEFAULT_TTLS of those
+        queries.
+
+        """
+        self._ev3_obj = ev3_obj
+        self._entries = {}
+        self._lock = threading.Lock()
+
+        self._ttls = dict(DEFAULT_TTLS)
+        if (ttls is not None):
+            for name, ttl_s in ttls.items():
+                self.set_ttl(name, ttl_s)
+
+
+    def is_cached(self, name):
+        """Returns True if the replies to the named query are cached."""
+        return (name in self._ttls)
+
+
+    def get_ttl(self, name):
+        """Returns the TTL of the named query."""
+        try:
+            return self._ttls[name]
+        except KeyError:
+            raise QueryCacheError('Not a cached query: %s' % name)
+
+
+    def set_ttl(self, name, ttl_s):
+        """Sets the TTL of the named query (None means that its replies only
+        expire when they are invalidated). Only the read-only queries in
+        QUERIES can be cached. The entries that are already cached follow the
+        new TTL.
+
+        """
+        if (name not in QUERIES):
+            raise QueryCacheError('Not a read-only query: %s' % name)
+
+        self._ttls[name] = ttl_s
+
+
+    def get(self, name, *args):
+        """Returns the reply to the named query with the given args. The
+        query is only sent to the brick if its reply isn't cached or has
+        expired.
+
+        """
+        ttl_s = self.get_ttl(name)
+
+        key = (name, args)
+
+        entry = self._entries.get(key)
+
+        if (entry is not None):
+            if (ttl_s is None or (time.time() - entry[0]) < ttl_s):
+                return entry[1]
+
+        reply = self._fetch(name, args)
+
+        # The replies are tuples so they can be shared by every caller.
+        with self._lock:
+            self._entries[key] = (time.time(), reply)
+
+        return reply
+
+
+    def invalidate(self, name=None, *args):
+        """Discards the entries of the named query. If args are given then
+        only the entry for those args is discarded. If name is None then
+        every entry is discarded.
+
+        """
+        with self._lock:
+            if (name is None):
+                self._entries.clear()
+            elif (args):
+                self._entries.pop((name, args), None)
+            else:
+                for key in self._entries.keys():
+                    if (key[0] == name):
+                        del self._entries[key]
+
+
+    def clear(self):
+        """Discards all of the entries."""
+        self.invalidate()
+
+
+    def _fetch(self, name, args):
+        batcher = getattr(self._ev3_obj, '_batcher', None)
+        if (batcher is not None):
+            return batcher.call(('add_' + name), *args)
+
+        cmd = direct_command.DirectCommand()
+        getattr(cmd, ('add_' + name))(*args)
+
+        return cmd.send(self._ev3_obj)
@@ -0,0 +1,296 @@
+"""Orders sensor reads so that each sensor changes mode as few times as
+possible.
+
+The input_device_ready_* funcs take a mode and the brick switches the
+sensor to it before reading. A switch makes the sensor settle for many
+milliseconds (much longer than a read) so a loop that reads one sensor in
+alternating modes (i.e. the color sensor in REFLECTED and COLOR or the gyro
+in ANGLE and RATE) stalls for a different time on every pass depending on
+the order of its reads. A ReadPlanner remembers the mode that each port was
+last read in, reads the port in that mode first, and groups the rest of the
+reads for the port by mode so that each mode costs at most one switch. The
+reads are sent in as few DirectCommands as possible and the values are
+returned in the order that they were requested.
+
+Each switch in a plan has a cost: the average time that the switch has
+taken on that port between the same modes or, until it has been measured,
+an estimate. A switch is measured with the brick's microsecond timer, which
+is read just before and after the read that makes it, so the time of the
+link isn't included.
+
+EXAMPLE USAGE:
+    from ev3 import *
+
+    PORT = direct_command.InputPort.PORT_3
+
+    with ev3.EV3() as brick:
+        planner = read_planner.ReadPlanner(brick)
+
+        while (True):
+            # One switch per pass instead of two.
+            reflected, color = planner.read([read_planner.Read(PORT, 0),
+                                                read_planner.Read(PORT, 2)])
+
+            for switch in planner.last_plan.switches:
+                print switch.port, switch.from_mode, switch.to_mode,
+                print switch.cost_s
+
+"""
+
+
+import collections
+import threading
+
+import direct_command
+
+
+# A rough figure for the time that a sensor takes to settle after a mode
+# switch; measurements replace it.
+DEFAULT_SWITCH_COST_S = 0.03
+
+# The mode that leaves the sensor in whatever mode it is in.
+KEEP_MODE = -1
+
+# How much each new measurement moves an average.
+_SMOOTHING = 0.3
+
+# The most reads, each with the timer reads that may surround it, that fit in
+# a DirectCommand.
+_READS_PER_COMMAND = (direct_command.MAX_CMD_LEN // 24)
+
+
+class ReadUnit(object):
+    """The units that a Read can return its value in."""
+    SI          = 'input_device_ready_si'
+    RAW         = 'input_device_ready_raw'
+    PERCENT     = 'input_device_ready_percent'
+
+
+class Read(collections.namedtuple('Read', ('port', 'mode', 'unit',
+                                                        'device_type',
+                                                        'layer'))):
+    """A single read of an InputPort in a mode."""
+    __slots__ = ()
+
+
+    def __new__(cls, port, mode=KEEP_MODE,
+                            unit=ReadUnit.SI,
+                            device_type=0,
+                            layer=direct_command.USB_CHAIN_LAYER_MASTER):
+        return super(Read, cls).__new__(cls, port, mode, unit, device_type,
+                                                                        layer)
+
+
+# A mode switch in a plan. The index is that of the read that makes the
+# switch and the from_mode is None if the port's mode isn't known.
+Switch = collections.namedtuple('Switch', ('index', 'layer', 'port',
+                                            'from_mode', 'to_mode', 'cost_s'))
+
+
+class Plan(collections.namedtuple('Plan', ('order', 'switches'))):
+    """The order (a list of indexes into the requested reads) that the reads
+    are sent in and the Switches that it causes.
+
+    """
+    __slots__ = ()
+
+
+    def cost_s(self):
+        """Returns the total cost of the plan's switches."""
+        return sum(switch.cost_s for switch in self.switches)
+
+
+class ReadPlanner(object):
+    """Tracks the mode of each port that it reads and plans the order of
+    reads.
+
+    """
+
+
+    def __init__(self, ev3_obj, inventory=None,
+                                switch_cost_s=DEFAULT_SWITCH_COST_S):
+        """Creates a planner that reads through the given EV3 object. If an
+        inventory (see the inventory module) is given then the modes that it
+        found in its last scan are used for the ports that haven't been read
+        yet (the planner never makes it scan). The
+        switch_cost_s is the estimate for switches that haven't been
+        measured.
+
+        """
+        self._ev3_obj = ev3_obj
+        self._inventory = inventory
+        self._lock = threading.Lock()
+
+        # The mode of each (LAYER, PORT) as of the last read.
+        self._modes = {}
+
+        # The average time of each switch keyed by
+        # (LAYER, PORT, FROM_MODE, TO_MODE).
+        self._switch_s = {}
+
+        self.switch_cost_s = switch_cost_s
+        self.last_plan = None
+
+
+    def mode(self, port, layer=direct_command.USB_CHAIN_LAYER_MASTER):
+        """Returns the mode that the port is believed to be in or None if it
+        isn't known.
+
+        """
+        key = (layer, port)
+
+        if (key in self._modes):
+            return self._modes[key]
+
+        # Only what the inventory already knows; planning never sends.
+        if (self._inventory is not None):
+            info = self._inventory.cached(key)
+            if (info is not None):
+                return info.mode
+
+        return None
+
+
+    def set_mode(self, port, mode,
+                            layer=direct_command.USB_CHAIN_LAYER_MASTER):
+        """Records the mode of a port that was changed by other means (i.e.
+        by a DirectCommand that is sent directly). A mode of None means that
+        it isn't known.
+
+        """
+        with self._lock:
+            if (mode is None):
+                self._modes.pop((layer, port), None)
+            else:
+                self._modes[(layer, port)] = mode
+
+
+    def switch_costs(self):
+        """Returns a dict of (LAYER, PORT, FROM_MODE, TO_MODE) tuples to the
+        measured average time of each switch.
+
+        """
+        with self._lock:
+            return dict(self._switch_s)
+
+
+    def plan(self, reads):
+        """Returns the Plan for the given sequence of Reads without sending
+        them.
+
+        """
+        with self._lock:
+            return self._plan(reads)
+
+
+    def read(self, reads):
+        """Sends the given sequence of Reads in the planned order. Returns a
+        list of their values in the order of reads. The plan that was used
+        is kept in last_plan.
+
+        """
+        reads = list(reads)
+
+        with self._lock:
+            plan = self._plan(reads)
+
+            # The switches that are timed keyed by the index of their read.
+            timed = dict((switch.index, switch) for switch in plan.switches
+                                            if switch.from_mode is not None)
+
+            values = [None] * len(reads)
+
+            for first in range(0, len(plan.order), _READS_PER_COMMAND):
+                order = plan.order[first:(first + _READS_PER_COMMAND)]
+
+                cmd = direct_command.DirectCommand()
+
+                for i in order:
+                    read = reads[i]
+
+                    if (i in timed):
+                        cmd.add_timer_read_us()
+
+                    getattr(cmd, ('add_' + read.unit))(read.port, read.mode,
+                                                            read.device_type,
+                                                            read.layer)
+
+                    if (i in timed):
+                        cmd.add_timer_read_us()
+
+                reply = iter(cmd.send(self._ev3_obj))
+
+                for i in order:
+                    read = reads[i]
+
+                    if (i in timed):
+                        start_us = next(reply)
+                        values[i] = next(reply)
+                        end_us = next(reply)
+
+                        self._record_switch(timed[i],
+                                            ((end_us - start_us) & 0xFFFFFFFF))
+                    else:
+                        values[i] = next(reply)
+
+                    if (KEEP_MODE != read.mode):
+                        self._modes[(read.layer, read.port)] = read.mode
+
+            self.last_plan = plan
+
+        return values
+
+
+    def _plan(self, reads):
+        # The reads of each port grouped by mode. Ports and modes are kept in
+        # the order that they are first requested.
+        ports = collections.OrderedDict()
+
+        for i, read in enumerate(reads):
+            groups = ports.setdefault((read.layer, read.port),
+                                                    collections.OrderedDict())
+            groups.setdefault(read.mode, []).append(i)
+
+        order = []
+        switches = []
+
+        for key, groups in ports.items():
+            mode = self.mode(key[1], key[0])
+
+            # Reads that keep the current mode go first, then those in the
+            # current mode; every other mode costs one switch.
+            modes = list(groups)
+            for first in (mode, KEEP_MODE):
+                if (first in groups):
+                    modes.remove(first)
+                    modes.insert(0, first)
+
+            for to_mode in modes:
+                if (KEEP_MODE != to_mode and mode != to_mode):
+                    switches.append(Switch(groups[to_mode][0], key[0], key[1],
+                                            mode, to_mode,
+                                            self._cost_s(key, mode, to_mode)))
+                    mode = to_mode
+
+                order.extend(groups[to_mode])
+
+        return Plan(order, switches)
+
+
+    def _cost_s(self, key, from_mode, to_mode):
+        return self._switch_s.get((key + (from_mode, to_mode)),
+                                                        self.switch_cost_s)
+
+
+    def _record_switch(self, switch, elapsed_us):
+        key = (switch.layer, switch.port, switch.from_mode, switch.to_mode)
+
+        self._switch_s[key] = _smooth(self._switch_s.get(key),
+                                                        (elapsed_us / 1e6))
+
+
+def _smooth(average, sample):
+    if (average is None):
+        return sample
+
+    return (((1.0 - _SMOOTHING) * average) + (_SMOOTHING * sample))
@@ -0,0 +1,287 @@
+"""Counts the messages that are exchanged with the brick and how long they
+take.
+
+Set an EV3 object's stats attribute to a Stats object to start counting
+(it is None by default so nothing is recorded). Each message is recorded
+under a (KIND, NAME) key:
+
+    ('system_command', NAME)    i.e. ('system_command', 'LIST_FILES')
+    ('direct_command', NAME)    'DIRECT_COMMAND_REPLY' or '_NO_REPLY'
+    ('opcode', NAME)            i.e. ('opcode', 'INPUT_DEVICE')
+
+The opcode keys are recorded by DirectCommand.send. Each opcode that was
+added to a DirectCommand is charged with the whole command (its latency
+and all of its bytes) so they answer questions such as "how long do the
+commands that read sensors take".
+
+For each key the number of messages, the bytes sent and received, the bytes
+of the replies that only align values (padding), and a histogram of the
+round trip latencies are kept. Counters are kept per thread so recording
+never takes a lock; snapshot adds them up. The counters of threads that have
+exited are folded into a shared total.
+
+EXAMPLE USAGE:
+    from ev3 import *
+
+    with ev3.EV3() as brick:
+        brick.stats = stats.Stats()
+
+        brick.ui_read_get_vbatt()
+
+        print brick.stats.to_json()
+        print brick.stats.to_prometheus()
+
+"""
+
+
+import bisect
+import json
+import threading
+import weakref
+
+import system_command
+import tables
+
+
+# The upper bounds of the latency histogram buckets in seconds. An extra
+# bucket holds everything slower.
+DEFAULT_LATENCY_BUCKETS_S = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                                                        1.0, 2.5, 5.0)
+
+
+class Kind(object):
+    """The kinds of keys that messages are recorded under."""
+    SYSTEM_COMMAND  = 'system_command'
+    DIRECT_COMMAND  = 'direct_command'
+    OPCODE          = 'opcode'
+
+
+# The positions of the counters in an entry. The latency buckets follow.
+_COUNT = 0
+_TX_BYTES = 1
+_RX_BYTES = 2
+_PAD_BYTES = 3
+_LATENCY_COUNT = 4
+_LATENCY_SUM_S = 5
+_BUCKETS = 6
+
+# Length/message_counter header.
+_HEADER_LEN = 4
+
+
+class Stats(object):
+    """Message counters and latency histograms keyed by (KIND, NAME)."""
+
+
+    def __init__(self, latency_buckets_s=DEFAULT_LATENCY_BUCKETS_S):
+        """Creates an empty object with the given latency bucket bounds."""
+        self.latency_buckets_s = tuple(sorted(latency_buckets_s))
+
+        self._local = threading.local()
+        self._shards_lock = threading.Lock()
+
+        # The shard of each thread keyed by a weakref to the thread. The refs
+        # of threads that have been collected are appended to _exited (a
+        # list.append never blocks so it is safe in a weakref callback) and
+        # their shards are folded into _retired the next time the lock is
+        # taken.
+        self._shards = {}
+        self._exited = []
+        self._retired = {}
+
+
+    def record(self, key, latency_s=None, tx_bytes=0, rx_bytes=0,
+                                                                pad_bytes=0):
+        """Records a message under the given (KIND, NAME) key. The latency_s
+        is None if the message doesn't have a reply.
+
+        """
+        shard = getattr(self._local, 'shard', None)
+        if (shard is None):
+            shard = self._new_shard()
+
+        entry = shard.get(key)
+        if (entry is None):
+            entry = ([0, 0, 0, 0, 0, 0.0] +
+                                    ([0] * (len(self.latency_buckets_s) + 1)))
+            shard[key] = entry
+
+        entry[_COUNT] += 1
+        entry[_TX_BYTES] += tx_bytes
+        entry[_RX_BYTES] += rx_bytes
+        entry[_PAD_BYTES] += pad_bytes
+
+        if (latency_s is not None):
+            entry[_LATENCY_COUNT] += 1
+            entry[_LATENCY_SUM_S] += latency_s
+            entry[_BUCKETS + bisect.bisect_left(self.latency_buckets_s,
+                                                            latency_s)] += 1
+
+
+    def record_msg(self, msg, latency_s=None, reply_len=0):
+        """Records a raw message (without its length/message_counter header)
+        under its system command or direct command type.
+
+        """
+        if (msg[0] in (system_command.CommandType.SYSTEM_COMMAND_REPLY,
+                        system_command.CommandType.SYSTEM_COMMAND_NO_REPLY)):
+            key = (Kind.SYSTEM_COMMAND,
+                        tables.SYSTEM_COMMANDS.name(msg[1], '0x%02X' % msg[1]))
+        else:
+            key = (Kind.DIRECT_COMMAND,
+                    tables.DIRECT_COMMAND_TYPES.name(msg[0], '0x%02X' % msg[0]))
+
+        rx_bytes = 0
+        if (reply_len):
+            rx_bytes = (_HEADER_LEN + reply_len)
+
+        self.record(key, latency_s, (_HEADER_LEN + len(msg)), rx_bytes)
+
+
+    def record_opcodes(self, opcodes, latency_s, msg_len, reply_len=0,
+                                                                pad_bytes=0):
+        """Records a DirectCommand under each of its distinct opcodes."""
+        tx_bytes = (_HEADER_LEN + msg_len)
+
+        rx_bytes = 0
+        if (reply_len):
+            rx_bytes = (_HEADER_LEN + reply_len)
+
+        if (not reply_len):
+            latency_s = None
+
+        for opcode in set(opcodes):
+            self.record((Kind.OPCODE,
+                            tables.OPCODES.name(opcode, '0x%02X' % opcode)),
+                                    latency_s, tx_bytes, rx_bytes, pad_bytes)
+
+
+    def snapshot(self):
+        """Returns a dict of (KIND, NAME) keys to dicts that hold the counters
+        added up over every thread. The 'latency_buckets' item is a list of
+        (UPPER_BOUND_S, COUNT) tuples where the counts are not cumulative and
+        the last bound is float('inf').
+
+        """
+        totals = {}
+
+        with self._shards_lock:
+            self._fold_exited()
+
+            _add_shard(totals, self._retired)
+            shards = self._shards.values()
+
+        for shard in shards:
+            _add_shard(totals, shard)
+
+        bounds = (self.latency_buckets_s + (float('inf'),))
+
+        result = {}
+        for key, total in totals.items():
+            result[key] = {'count': total[_COUNT],
+                            'tx_bytes': total[_TX_BYTES],
+                            'rx_bytes': total[_RX_BYTES],
+                            'pad_bytes': total[_PAD_BYTES],
+                            'latency_count': total[_LATENCY_COUNT],
+                            'latency_sum_s': total[_LATENCY_SUM_S],
+                            'latency_buckets': zip(bounds, total[_BUCKETS:])}
+
+        return result
+
+
+    def reset(self):
+        """Discards everything that has been recorded."""
+        with self._shards_lock:
+            self._fold_exited()
+
+            self._retired.clear()
+            for shard in self._shards.values():
+                shard.clear()
+
+
+    def to_json(self):
+        """Returns the snapshot as a JSON object in the form
+        {KIND: {NAME: COUNTERS}}.
+
+        """
+        result = {}
+
+        for (kind, name), counters in self.snapshot().items():
+            counters['latency_buckets'] = [[_format_bound(b), c]
+                                    for b, c in counters['latency_buckets']]
+            result.setdefault(kind, {})[name] = counters
+
+        return json.dumps(result, sort_keys=True)
+
+
+    def to_prometheus(self):
+        """Returns the snapshot in the Prometheus text exposition format."""
+        snapshot = sorted(self.snapshot().items())
+
+        lines = []
+
+        for metric, counter in (('ev3_messages_total', 'count'),
+                                ('ev3_tx_bytes_total', 'tx_bytes'),
+                                ('ev3_rx_bytes_total', 'rx_bytes'),
+                                ('ev3_padding_bytes_total', 'pad_bytes')):
+            lines.append('# TYPE %s counter' % metric)
+
+            for (kind, name), counters in snapshot:
+                lines.append('%s{kind="%s",name="%s"} %d' % (metric, kind,
+                                                    name, counters[counter]))
+
+        lines.append('# TYPE ev3_latency_seconds histogram')
+
+        for (kind, name), counters in snapshot:
+            labels = 'kind="%s",name="%s"' % (kind, name)
+
+            cumulative = 0
+            for bound, count in counters['latency_buckets']:
+                cumulative += count
+                lines.append('ev3_latency_seconds_bucket{%s,le="%s"} %d' %
+                                    (labels, _format_bound(bound), cumulative))
+
+            lines.append('ev3_latency_seconds_sum{%s} %r' %
+                                            (labels, counters['latency_sum_s']))
+            lines.append('ev3_latency_seconds_count{%s} %d' %
+                                            (labels, counters['latency_count']))
+
+        return ('\n'.join(lines) + '\n')
+
+
+    def _new_shard(self):
+        shard = {}
+        self._local.shard = shard
+
+        ref = weakref.ref(threading.current_thread(), self._exited.append)
+
+        with self._shards_lock:
+            self._fold_exited()
+            self._shards[ref] = shard
+
+        return shard
+
+
+    def _fold_exited(self):
+        # The caller holds _shards_lock.
+        while (self._exited):
+            shard = self._shards.pop(self._exited.pop(), None)
+            if (shard is not None):
+                _add_shard(self._retired, shard)
+
+
+def _add_shard(totals, shard):
+    for key, entry in shard.items():
+        total = totals.get(key)
+        if (total is None):
+            totals[key] = list(entry)
+        else:
+            for i in range(len(entry)):
+                total[i] += entry[i]
+
+
+def _format_bound(bound):
+    if (float('inf') == bound):
+        return '+Inf'
+
+    return repr(bound)
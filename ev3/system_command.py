@@ -23,15 +23,41 @@ Byte 7 - N: payload
 """
 
 
-import itertools
-
+import hashlib
+import os
+import posixpath
+import time
 
 import message
 
+try:
+    from async import preemption_pending as _preemption_pending
+    from async import preemption_point as _preemption_point
+except ImportError:
+    # The async module needs concurrent.futures (the 'futures' package on
+    # Python 2). Without it nothing runs in a PriorityExecutor so there is
+    # never anything to preempt.
+    def _preemption_pending():
+        return False
+
+    def _preemption_point():
+        pass
+
 
 MAX_REPLY_BYTES = 1014  # According to c_com.h comments.
 MAX_TX_BYTES = 1016
 
+# The number of CONTINUE_DOWNLOAD chunks that are kept in flight by default.
+# A value of 1 means that each chunk waits for its reply (lock-step).
+DEFAULT_DOWNLOAD_WINDOW = 1
+
+# How often tail_file asks the brick for new bytes when none are available.
+DEFAULT_TAIL_POLL_INTERVAL_S = 0.5
+
+# The message counters of windowed chunks start here so that their replies
+# can't be confused with replies to the default message counter.
+_WINDOW_MESSAGE_COUNTER_BASE = 0x8000
+
 
 class SystemCommandError(Exception):
     """Subclass for reporting errors."""
@@ -71,6 +97,13 @@ class Command(object):
     SETBUNDLESEEDID         = 0xA2  # Set Bundle Seed ID for mode 2
 
 
+class SyncAction(object):
+    """The actions that sync_dir can perform on the brick."""
+    CREATE_DIR  = 'create_dir'
+    DOWNLOAD    = 'download'
+    DELETE      = 'delete'
+
+
 class ReturnCode(object):
     """Enumerated System Command return codes."""
     SUCCESS                 = 0x00
@@ -93,7 +126,7 @@ def write_mailbox(ev3_obj, mailbox_name_str, byte_seq):
     if ('\0' != mailbox_name_str[-1]):
         mailbox_name_str += '\0'
 
-    cmd = []
+    cmd = bytearray()
     cmd.append(CommandType.SYSTEM_COMMAND_NO_REPLY)
     cmd.append(Command.WRITEMAILBOX)
 
@@ -101,7 +134,7 @@ def write_mailbox(ev3_obj, mailbox_name_str, byte_seq):
     message.append_str(cmd, mailbox_name_str)
 
     message.append_u16(cmd, len(byte_seq))
-    map(cmd.append, byte_seq)
+    cmd.extend(byte_seq)
 
     ev3_obj.send_message(cmd)
 
@@ -172,8 +205,12 @@ def download_file_from_path(ev3_obj, save_path_str, file_path_str):
         return download_file(ev3_obj, read_file.read(), save_path_str)
 
 
-def download_file(ev3_obj, save_path_str, file_data):
-    """Downloads the file_data to save_path_str on the brick.
+def download_file(ev3_obj, save_path_str, file_data, window_size=None):
+    """Downloads the file_data to save_path_str on the brick. If window_size
+    is greater than one then up to that many chunks are kept in flight at
+    once instead of waiting for the reply to each chunk before sending the
+    next one. If window_size is None then the EV3 object's controller picks
+    it (DEFAULT_DOWNLOAD_WINDOW is used if the object doesn't have one).
 
     NOTE:   This function creates intermediary directories automatically.
 
@@ -181,7 +218,7 @@ def download_file(ev3_obj, save_path_str, file_data):
     if (not isinstance(save_path_str, str)):
         raise ValueError('The save_path_str param must be of type str.')
 
-    cmd = []
+    cmd = bytearray()
     cmd.append(CommandType.SYSTEM_COMMAND_REPLY)
     cmd.append(Command.BEGIN_DOWNLOAD)
 
@@ -190,8 +227,6 @@ def download_file(ev3_obj, save_path_str, file_data):
 
     reply = ev3_obj.send_message_for_reply(cmd)
 
-    print 'reply: ', reply
-
     if (reply[0] == ReplyType.SYSTEM_REPLY_ERROR):
         raise SystemCommandError('A command failed.')
 
@@ -203,16 +238,25 @@ def download_file(ev3_obj, save_path_str, file_data):
 
     handle = reply[3]
 
-    _continue_download_file(ev3_obj, handle, file_data)
+    if (window_size is None):
+        window_size = _download_window_size(ev3_obj)
+
+    if (1 < window_size):
+        # Other threads must not read the replies to the chunks in flight.
+        with ev3_obj.lock:
+            _continue_download_file_windowed(ev3_obj, handle, file_data,
+                                                                window_size)
+    else:
+        _continue_download_file(ev3_obj, handle, file_data)
+
+    _invalidate_fs_cache(ev3_obj, save_path_str)
 
 
 def create_dir(ev3_obj, path_str):
     """Creates the directory at the given path_str."""
-    cmd = []
-    cmd.append(CommandType.SYSTEM_COMMAND_NO_REPLY)
-    cmd.append(Command.CREATE_DIR)
-    message.append_str(cmd, path_str)
-    ev3_obj.send_message(cmd)
+    ev3_obj.send_message(_path_command(Command.CREATE_DIR, path_str))
+
+    _invalidate_fs_cache(ev3_obj, path_str)
 
 
 def delete_path(ev3_obj, path_str):
@@ -221,40 +265,500 @@ def delete_path(ev3_obj, path_str):
     NOTE:   Directories must be empty before they can be deleted.
 
     """
-    cmd = []
-    cmd.append(CommandType.SYSTEM_COMMAND_NO_REPLY)
-    cmd.append(Command.DELETE_FILE)
-    message.append_str(cmd, path_str)
-    ev3_obj.send_message(cmd)
+    ev3_obj.send_message(_path_command(Command.DELETE_FILE, path_str))
+
+    _invalidate_fs_cache(ev3_obj, path_str)
 
 
-def delete_directory(ev3_obj, dir_path_str):
+def delete_directory(ev3_obj, dir_path_str, verify=True):
     """Convenience function for deleting directories that may or may not be
-    empty.
+    empty. See delete_tree.
+
+    """
+    return delete_tree(ev3_obj, dir_path_str, verify)
+
+
+def delete_tree(ev3_obj, dir_path_str, verify=True):
+    """Deletes the directory at dir_path_str along with everything in it. The
+    whole tree is planned up front (from the EV3 object's fs_cache when it has
+    fresh entries) and then the DELETE_FILE commands are streamed back to
+    back without waiting for replies. If verify is True then a single listing
+    of the parent directory confirms that the directory is gone; if it isn't
+    (i.e. because the cached plan was stale) then the tree is planned again
+    from fresh listings and deleted once more. Returns the list of deleted
+    paths.
+
+    """
+    dir_path_str = dir_path_str.rstrip('/')
+
+    paths = plan_delete_tree(ev3_obj, dir_path_str, use_cache=True)
+    run_bulk(ev3_obj, [(Command.DELETE_FILE, p) for p in paths])
+
+    if (verify and _brick_dir_exists(ev3_obj, dir_path_str)):
+        paths = plan_delete_tree(ev3_obj, dir_path_str)
+        run_bulk(ev3_obj, [(Command.DELETE_FILE, p) for p in paths])
+
+        if (_brick_dir_exists(ev3_obj, dir_path_str)):
+            raise SystemCommandError('Failed to delete: %s' % dir_path_str)
+
+    return paths
+
+
+def create_tree(ev3_obj, dir_paths, verify=True):
+    """Creates each of the directories in dir_paths along with any missing
+    intermediary directories. The CREATE_DIR commands are streamed back to
+    back without waiting for replies. If verify is True then a single listing
+    per distinct parent of the deepest directories confirms that they were
+    created (which they can't be unless their ancestors were). Returns the
+    list of paths that CREATE_DIR was sent for.
+
+    """
+    paths = plan_create_tree(dir_paths)
+    run_bulk(ev3_obj, [(Command.CREATE_DIR, p) for p in paths])
+
+    if (verify):
+        parents = set(posixpath.dirname(p) for p in paths)
+        leaves = [p for p in paths if p not in parents]
+
+        listings = {}
+        for leaf in leaves:
+            parent, name = posixpath.split(leaf)
+            parent = (parent or '.')
+
+            if (parent not in listings):
+                listings[parent] = list_files(ev3_obj, (parent + '/'))[0]
+
+            if ((name + '/') not in listings[parent]):
+                raise SystemCommandError('Failed to create: %s' % leaf)
+
+    return paths
+
+
+def plan_delete_tree(ev3_obj, dir_path_str, use_cache=False):
+    """Returns the list of paths that have to be deleted, in order, to remove
+    the directory at dir_path_str: files first and then directories with
+    children ahead of their parents. If use_cache is True then listings are
+    taken from the EV3 object's fs_cache when it has one.
+
+    """
+    dir_path_str = dir_path_str.rstrip('/')
+
+    dirs, files = _walk_brick_dir(ev3_obj, dir_path_str, use_cache)
+
+    paths = [posixpath.join(dir_path_str, f) for f in sorted(files)]
+
+    # Children sort after their parents so reversing deletes them first.
+    paths += [posixpath.join(dir_path_str, d)
+                                    for d in sorted(dirs, reverse=True)]
+    paths.append(dir_path_str)
+
+    return paths
+
+
+def plan_create_tree(dir_paths):
+    """Returns the list of paths that CREATE_DIR has to be sent for, in
+    order, to create each of the directories in dir_paths. Intermediary
+    directories are included ahead of their children; the brick ignores
+    directories that already exist.
+
+    """
+    paths = set()
+
+    for dir_path_str in dir_paths:
+        path_str = posixpath.normpath(dir_path_str)
+
+        while (path_str and
+                posixpath.basename(path_str) not in ('', '.', '..')):
+            paths.add(path_str)
+            path_str = posixpath.dirname(path_str)
+
+    # Parents sort ahead of their children.
+    return sorted(paths)
+
+
+def run_bulk(ev3_obj, ops):
+    """Streams a list of (Command, PATH) tuples to the brick back to back.
+    Only the no-reply Command.DELETE_FILE and Command.CREATE_DIR commands are
+    supported so nothing waits for a round trip. The fs_cache is
+    invalidated once for the whole list.
+
+    """
+    for command, path_str in ops:
+        if (command not in (Command.DELETE_FILE, Command.CREATE_DIR)):
+            raise ValueError('Unsupported bulk command: 0x%02X' % command)
+
+    try:
+        for command, path_str in ops:
+            ev3_obj.send_message(_path_command(command, path_str))
+    finally:
+        _invalidate_fs_cache(ev3_obj, *[path_str for command, path_str in ops])
+
+
+def sync_dir(ev3_obj, local_dir_str, brick_path_str, dry_run=False,
+                                                            window_size=None):
+    """Makes the directory at brick_path_str on the brick match the directory
+    at local_dir_str on the PC. Only files whose MD5 sums differ are
+    downloaded, missing directories are created, and files and directories
+    that don't exist locally are deleted. Returns a list of the actions in
+    the form (SyncAction, BRICK_PATH) in the order that they were (or, if
+    dry_run is True, would have been) performed.
+
+    """
+    if (not isinstance(brick_path_str, str)):
+        raise ValueError('The brick_path_str param must be of type str.')
+
+    brick_path_str = brick_path_str.rstrip('/')
+
+    local_dirs, local_files = _walk_local_dir(local_dir_str)
+
+    if (_brick_dir_exists(ev3_obj, brick_path_str)):
+        brick_dirs, brick_files = _walk_brick_dir(ev3_obj, brick_path_str)
+    else:
+        brick_dirs, brick_files = (set(), {})
+        local_dirs.add('')
+
+    actions = []
+
+    for d in sorted(local_dirs - brick_dirs):
+        dir_path_str = posixpath.join(brick_path_str, d).rstrip('/')
+        actions.append((SyncAction.CREATE_DIR, dir_path_str))
+
+    for f in sorted(local_files):
+        brick_md5 = brick_files.get(f)
+        if (brick_md5 is None or brick_md5.lower() != local_files[f]):
+            actions.append((SyncAction.DOWNLOAD,
+                                    posixpath.join(brick_path_str, f)))
+
+    for f in sorted(set(brick_files) - set(local_files)):
+        actions.append((SyncAction.DELETE, posixpath.join(brick_path_str, f)))
+
+    # Children sort after their parents so reversing deletes them first.
+    for d in sorted((brick_dirs - local_dirs), reverse=True):
+        actions.append((SyncAction.DELETE, posixpath.join(brick_path_str, d)))
+
+    if (dry_run):
+        return actions
+
+    for action, path_str in actions:
+        if (SyncAction.CREATE_DIR == action):
+            create_dir(ev3_obj, path_str)
+        elif (SyncAction.DOWNLOAD == action):
+            rel_path = posixpath.relpath(path_str, brick_path_str)
+            local_path = os.path.join(local_dir_str, *rel_path.split('/'))
+            with open(local_path, 'rb') as read_file:
+                download_file(ev3_obj, path_str, bytearray(read_file.read()),
+                                                                window_size)
+        else:
+            delete_path(ev3_obj, path_str)
+
+    return actions
+
+
+def tail_file(ev3_obj, path_str, record_sep='\n',
+                                poll_interval_s=DEFAULT_TAIL_POLL_INTERVAL_S,
+                                timeout_s=None):
+    """Follows a file on the brick that is being written to (i.e. a datalog
+    that is being written by a running program) and yields each record as it
+    is appended. See FileTail.follow.
+
+    """
+    with FileTail(ev3_obj, path_str) as file_tail:
+        for record in file_tail.follow(record_sep, poll_interval_s, timeout_s):
+            yield record
+
+
+class FileTail(object):
+    """Uses BEGIN_GETFILE/CONTINUE_GETFILE to read only the bytes that have
+    been appended to a file on the brick since the last read. The brick keeps
+    the handle's position so each poll costs a single round trip no matter
+    how large the file has grown.
+
+    EXAMPLE USAGE:
+        with system_command.FileTail(brick, '../prjs/log/data.rdf') as tail:
+            for line in tail.follow():
+                print line
+
+    """
+
+
+    def __init__(self, ev3_obj, path_str, offset=0):
+        """Creates a new object that will start reading at the given offset.
+        Nothing is sent to the brick until read or follow is called.
+
+        """
+        if (not isinstance(path_str, str)):
+            raise ValueError('The path_str param must be of type str.')
+
+        self._ev3_obj = ev3_obj
+        self._path_str = path_str
+        self._handle = None
+        self._handle_offset = 0
+
+        self.offset = offset
+        self.file_size = None
+
+
+    def read(self):
+        """Returns the bytes that have been appended to the file since the
+        last call as a string. Returns an empty string if nothing new is
+        available.
+
+        """
+        result = []
+
+        if (self._handle is not None):
+            rc, data = self._continue()
+
+        if (self._handle is None):
+            # Either this is the first read or the brick has closed the
+            # handle. Start over and skip the bytes that were already read.
+            rc, data = self._begin()
+
+        while (True):
+            if (self.file_size < self.offset):
+                # The file was truncated or replaced. Release the old handle
+                # first because the brick only has a few of them.
+                self.close()
+                self.offset = 0
+                rc, data = self._begin()
+
+            data_len = len(data)
+
+            # The data covers the bytes that precede the handle's position.
+            skip = (self.offset - (self._handle_offset - data_len))
+            if (0 < skip):
+                data = data[skip:]
+
+            if (data):
+                result.append(message.parse_str(data, 0))
+                self.offset += len(data)
+
+            if (ReturnCode.END_OF_FILE == rc or 0 == data_len):
+                break
+
+            rc, data = self._continue()
+
+            if (self._handle is None):
+                break
+
+        return ''.join(result)
+
+
+    def follow(self, record_sep='\n',
+                                poll_interval_s=DEFAULT_TAIL_POLL_INTERVAL_S,
+                                timeout_s=None):
+        """Generates the records that are appended to the file. Records are
+        split on record_sep and a partial record is held back until it is
+        complete. If record_sep is None then the raw strings returned by read
+        are generated instead. Stops after timeout_s seconds without any new
+        bytes (or never if timeout_s is None).
+
+        """
+        pending = ''
+        last_data_time = time.time()
+
+        while (True):
+            data = self.read()
+
+            if (not data):
+                if (timeout_s is not None and
+                        timeout_s <= (time.time() - last_data_time)):
+                    break
+
+                time.sleep(poll_interval_s)
+                continue
+
+            last_data_time = time.time()
+
+            if (record_sep is None):
+                yield data
+                continue
+
+            records = (pending + data).split(record_sep)
+            pending = records.pop()
+
+            for record in records:
+                yield record
+
+
+    def close(self):
+        """Releases the handle on the brick."""
+        if (self._handle is not None):
+            cmd = bytearray()
+            cmd.append(CommandType.SYSTEM_COMMAND_NO_REPLY)
+            cmd.append(Command.CLOSE_FILEHANDLE)
+            cmd.append(self._handle)
+
+            self._ev3_obj.send_message(cmd)
+
+            self._handle = None
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+
+    def _begin(self):
+        cmd = bytearray()
+        cmd.append(CommandType.SYSTEM_COMMAND_REPLY)
+        cmd.append(Command.BEGIN_GETFILE)
+
+        message.append_u16(cmd, MAX_REPLY_BYTES)
+        message.append_str(cmd, self._path_str)
+
+        reply = self._ev3_obj.send_message_for_reply(cmd)
+
+        self._check_reply(reply, Command.BEGIN_GETFILE)
+
+        self.file_size = message.parse_u32(reply, 3)
+        self._handle = reply[7]
+
+        data = reply[8:]
+        self._handle_offset = len(data)
+
+        return (reply[2], data)
+
+
+    def _continue(self):
+        cmd = bytearray()
+        cmd.append(CommandType.SYSTEM_COMMAND_REPLY)
+        cmd.append(Command.CONTINUE_GETFILE)
+        cmd.append(self._handle)
+
+        message.append_u16(cmd, MAX_REPLY_BYTES)
+
+        reply = self._ev3_obj.send_message_for_reply(cmd)
+
+        if (ReturnCode.UNKNOWN_HANDLE == reply[2]):
+            self._handle = None
+            return (reply[2], bytearray())
+
+        self._check_reply(reply, Command.CONTINUE_GETFILE)
+
+        self.file_size = message.parse_u32(reply, 4)
+
+        data = reply[8:]
+        self._handle_offset += len(data)
+
+        return (reply[2], data)
+
+
+    def _check_reply(self, reply, command):
+        if (reply[0] == ReplyType.SYSTEM_REPLY_ERROR):
+            raise SystemCommandError('A command failed.')
+
+        if (reply[1] != command):
+            raise SystemCommandError('Sync error detected.')
+
+        if (reply[2] == ReturnCode.UNKNOWN_ERROR):
+            raise SystemCommandError('An error occurred.')
+
+
+def _walk_local_dir(local_dir_str):
+    """Returns a tuple in the form (DIRS, FILES). DIRS is a set of directory
+    paths and FILES is a dict of MD5 sums keyed by file path. All paths are
+    relative to local_dir_str and use '/' as the separator.
+
+    """
+    dirs = set()
+    files = {}
+
+    for dir_path, dir_names, file_names in os.walk(local_dir_str):
+        rel_dir = os.path.relpath(dir_path, local_dir_str)
+        if (os.curdir == rel_dir):
+            rel_dir = ''
+        rel_dir = rel_dir.replace(os.sep, '/')
+
+        for d in dir_names:
+            dirs.add(posixpath.join(rel_dir, d))
+
+        for f in file_names:
+            md5 = hashlib.md5()
+            with open(os.path.join(dir_path, f), 'rb') as read_file:
+                md5.update(read_file.read())
+            files[posixpath.join(rel_dir, f)] = md5.hexdigest()
+
+    return (dirs, files)
+
+
+def _walk_brick_dir(ev3_obj, path_str, use_cache=False):
+    """Recursively lists the brick directory at path_str. Returns a tuple in
+    the form (DIRS, FILES). DIRS is a set of directory paths and FILES is a
+    dict of MD5 sums keyed by file path. All paths are relative to path_str.
+    If use_cache is True then listings are taken from the EV3 object's
+    fs_cache when it has one.
 
     """
-    if (not dir_path_str.endswith('/')):
-        dir_path_str += '/'
+    dirs = set()
+    files = {}
+    pending = ['']
 
-    directories, files = list_files(ev3_obj, dir_path_str)
+    fs_cache = getattr(ev3_obj, 'fs_cache', None)
+    if (use_cache and fs_cache is not None):
+        list_fn = fs_cache.list_files
+    else:
+        list_fn = lambda path_str: list_files(ev3_obj, path_str)
+
+    while (pending):
+        rel_dir = pending.pop()
 
-    for f in files:
-        md5, length, file_name = f
-        delete_path_str(ev3_obj, (dir_path_str + file_name))
+        sub_dirs, sub_files = list_fn(posixpath.join(path_str, rel_dir) + '/')
 
-    for d in directories:
-        # Ignore './' and '../'.
-        if (not d.startswith('.')):
-            delete_directory(ev3_obj, (dir_path_str + d))
+        for md5, length, file_name in sub_files:
+            files[posixpath.join(rel_dir, file_name)] = md5
 
-    delete_path_str(ev3_obj, dir_path_str)
+        for d in sub_dirs:
+            # Ignore './' and '../' but not hidden directories, which
+            # _walk_local_dir includes.
+            if (d not in ('./', '../')):
+                rel_path = posixpath.join(rel_dir, d.rstrip('/'))
+                dirs.add(rel_path)
+                pending.append(rel_path)
+
+    return (dirs, files)
+
+
+def _brick_dir_exists(ev3_obj, path_str):
+    parent, name = posixpath.split(path_str.rstrip('/'))
+
+    if (not name or name in (posixpath.curdir, posixpath.pardir)):
+        return True
+
+    dirs, files = list_files(ev3_obj, ((parent or '.') + '/'))
+
+    return ((name + '/') in dirs)
+
+
+def _path_command(command, path_str):
+    """Returns a no-reply system command that takes a single path."""
+    cmd = bytearray()
+    cmd.append(CommandType.SYSTEM_COMMAND_NO_REPLY)
+    cmd.append(command)
+    message.append_str(cmd, path_str)
+
+    return cmd
+
+
+def _invalidate_fs_cache(ev3_obj, *path_strs):
+    """Keeps the EV3 object's filesystem metadata cache (if it has one)
+    consistent with changes made by this module.
+
+    """
+    fs_cache = getattr(ev3_obj, 'fs_cache', None)
+
+    if (fs_cache is not None):
+        fs_cache.invalidate(*path_strs)
 
 
 def _list_files(ev3_obj, path_str):
     handle = None
     needs_continue = False
 
-    cmd = []
+    cmd = bytearray()
     cmd.append(CommandType.SYSTEM_COMMAND_REPLY)
     cmd.append(Command.LIST_FILES)
 
@@ -283,7 +787,7 @@ def _list_files(ev3_obj, path_str):
 def _continue_list_files(ev3_obj, handle):
     result = []
 
-    cmd = []
+    cmd = bytearray()
     cmd.append(CommandType.SYSTEM_COMMAND_REPLY)
     cmd.append(Command.CONTINUE_LIST_FILES)
     cmd.append(handle)
@@ -291,6 +795,8 @@ def _continue_list_files(ev3_obj, handle):
     message.append_u16(cmd, MAX_REPLY_BYTES)
 
     while (True):
+        _preemption_point()
+
         reply = ev3_obj.send_message_for_reply(cmd)
 
         if (reply[0] == ReplyType.SYSTEM_REPLY_ERROR):
@@ -316,7 +822,7 @@ def _upload_file(ev3_obj, path_str):
     handle = None
     needs_continue = False
 
-    cmd = []
+    cmd = bytearray()
     cmd.append(CommandType.SYSTEM_COMMAND_REPLY)
     cmd.append(Command.BEGIN_UPLOAD)
 
@@ -345,7 +851,7 @@ def _upload_file(ev3_obj, path_str):
 def _continue_upload_file(ev3_obj, handle):
     result = []
 
-    cmd = []
+    cmd = bytearray()
     cmd.append(CommandType.SYSTEM_COMMAND_REPLY)
     cmd.append(Command.CONTINUE_UPLOAD)
     cmd.append(handle)
@@ -353,6 +859,8 @@ def _continue_upload_file(ev3_obj, handle):
     message.append_u16(cmd, MAX_REPLY_BYTES)
 
     while (True):
+        _preemption_point()
+
         reply = ev3_obj.send_message_for_reply(cmd)
 
         if (reply[0] == ReplyType.SYSTEM_REPLY_ERROR):
@@ -371,27 +879,22 @@ def _continue_upload_file(ev3_obj, handle):
         if (reply[2] == ReturnCode.END_OF_FILE):
             break
 
-    return itertools.chain.from_iterable(result)
-
+    return bytearray().join(result)
 
-def _continue_download_file(ev3_obj, handle, data):
-    offset = 0
 
+def _continue_download_file(ev3_obj, handle, data, offset=0):
     data_len = len(data)
 
-    cmd = []
-    cmd.append(CommandType.SYSTEM_COMMAND_REPLY)
-    cmd.append(Command.CONTINUE_DOWNLOAD)
-    cmd.append(handle)
+    while (True):
+        _preemption_point()
 
-    if (MAX_TX_BYTES >= data_len):
-        offset = data_len
-    else:
-        offset = MAX_TX_BYTES
+        if (MAX_TX_BYTES >= (data_len - offset)):
+            new_offset = data_len
+        else:
+            new_offset = (offset + MAX_TX_BYTES)
 
-    map(cmd.append, data[:offset])
+        cmd = _continue_download_cmd(handle, data[offset:new_offset])
 
-    while (True):
         reply = ev3_obj.send_message_for_reply(cmd)
 
         if (reply[0] == ReplyType.SYSTEM_REPLY_ERROR):
@@ -403,15 +906,109 @@ def _continue_download_file(ev3_obj, handle, data):
         if (reply[2] == ReturnCode.UNKNOWN_ERROR):
             raise SystemCommandError('An error occurred.')
 
+        offset = new_offset
+
         if (data_len == offset):
             break
 
-        del (cmd[3:])
 
-        if (MAX_TX_BYTES >= (data_len - offset)):
-            map(cmd.append, data[offset:])
-            offset = data_len
+def _continue_download_file_windowed(ev3_obj, handle, data, window_size):
+    """Keeps up to window_size CONTINUE_DOWNLOAD chunks in flight. Each chunk
+    is sent with its own message counter so that replies can be matched to
+    chunks. If the brick reports an error then the remaining replies are
+    drained and the transfer falls back to lock-step starting with the
+    chunk that failed.
+
+    """
+    data_len = len(data)
+
+    chunk_offsets = range(0, data_len, MAX_TX_BYTES)
+
+    if (1 >= len(chunk_offsets)):
+        _continue_download_file(ev3_obj, handle, data)
+        return
+
+    in_flight = {}
+    failed = []
+    succeeded = []
+    next_chunk = 0
+
+    while (in_flight or (not failed and next_chunk < len(chunk_offsets))):
+        if (not in_flight):
+            _preemption_point()
+
+        # Stop refilling the window while higher-priority calls are waiting
+        # so that they can run once the window drains.
+        while (not failed and
+                next_chunk < len(chunk_offsets) and
+                len(in_flight) < window_size and
+                not _preemption_pending()):
+            offset = chunk_offsets[next_chunk]
+            counter = ((_WINDOW_MESSAGE_COUNTER_BASE + next_chunk) & 0xFFFF)
+
+            ev3_obj.write_message(_continue_download_cmd(handle,
+                                    data[offset:(offset + MAX_TX_BYTES)]),
+                                    counter)
+
+            in_flight[counter] = next_chunk
+            next_chunk += 1
+
+        if (not in_flight):
+            continue
+
+        counter, reply = ev3_obj.read_reply()
+
+        if (counter not in in_flight):
+            raise SystemCommandError('Sync error detected.')
+
+        chunk = in_flight.pop(counter)
+
+        if (_download_chunk_failed(reply)):
+            failed.append(chunk)
         else:
-            new_offset = (offset + MAX_TX_BYTES)
-            map(cmd.append, data[offset:new_offset])
-            offset = new_offset
+            succeeded.append(chunk)
+
+    if (failed):
+        first_failed = min(failed)
+
+        if ([c for c in succeeded if c > first_failed]):
+            # The brick appends chunks in the order that they are received so
+            # the file can't be repaired by resending the failed chunk.
+            raise SystemCommandError('A chunk failed after later chunks ' +
+                                                            'were written.')
+
+        _continue_download_file(ev3_obj, handle, data,
+                                                chunk_offsets[first_failed])
+
+
+def _download_window_size(ev3_obj):
+    controller = getattr(ev3_obj, 'controller', None)
+
+    if (controller is None):
+        return DEFAULT_DOWNLOAD_WINDOW
+
+    # The chunk plus the CommandType, the Command, and the handle.
+    return controller.window_size(MAX_TX_BYTES + 3)
+
+
+def _continue_download_cmd(handle, chunk):
+    cmd = bytearray()
+    cmd.append(CommandType.SYSTEM_COMMAND_REPLY)
+    cmd.append(Command.CONTINUE_DOWNLOAD)
+    cmd.append(handle)
+
+    cmd.extend(chunk)
+
+    return cmd
+
+
+def _download_chunk_failed(reply):
+    """Returns True if the reply to a CONTINUE_DOWNLOAD reports an error.
+    Raises a SystemCommandError if the reply is to a different command.
+
+    """
+    if (reply[1] != Command.CONTINUE_DOWNLOAD):
+        raise SystemCommandError('Sync error detected.')
+
+    return ((reply[0] == ReplyType.SYSTEM_REPLY_ERROR) or
+                (reply[2] == ReturnCode.UNKNOWN_ERROR))
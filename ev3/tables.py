@@ -0,0 +1,129 @@
+"""Read-only lookup tables between the names and values of the constants that
+the brick uses.
+
+The tables are built once, when this module is first imported, from the
+classes in the direct_command and system_command modules. Each Table maps
+names to values and also looks up the name of a value. SUBCODES maps each
+opcode that takes a subcode to the Table of its subcodes.
+
+EXAMPLE USAGE:
+    from ev3 import tables
+
+    print tables.OPCODES.name(0x81)                 # 'UI_READ'
+    print tables.OPCODES['UI_READ']                 # 129
+    print tables.SUBCODES[0x81].name(0x01)          # 'GET_VBATT'
+    print tables.RETURN_CODES.name(0x08, '?')       # 'END_OF_FILE'
+
+"""
+
+
+import collections
+import inspect
+import types
+
+import direct_command
+import system_command
+
+
+class Table(collections.Mapping):
+    """Maps the names of the constants in a class to their values. Where
+    several names share a value the reverse lookup returns the first name in
+    sorted order.
+
+    """
+
+
+    def __init__(self, cls):
+        """Builds the table from the public attributes of cls."""
+        self._values = dict((k, v) for k, v in vars(cls).items()
+                                                    if not k.startswith('_'))
+
+        self._names = {}
+        for name in sorted(self._values):
+            self._names.setdefault(self._values[name], name)
+
+
+    def __getitem__(self, name):
+        return self._values[name]
+
+
+    def __iter__(self):
+        return iter(self._values)
+
+
+    def __len__(self):
+        return len(self._values)
+
+
+    def name(self, value, default=None):
+        """Returns the name of the given value or default if no constant has
+        that value.
+
+        """
+        return self._names.get(value, default)
+
+
+class FrozenDict(collections.Mapping):
+    """A dict that can't be changed after it has been created."""
+
+
+    def __init__(self, *args, **kwargs):
+        self._items = dict(*args, **kwargs)
+
+
+    def __getitem__(self, key):
+        return self._items[key]
+
+
+    def __iter__(self):
+        return iter(self._items)
+
+
+    def __len__(self):
+        return len(self._items)
+
+
+_Opcode = direct_command.Opcode
+
+
+OPCODES = Table(_Opcode)
+PARAM_TYPES = Table(direct_command.ParamType)
+DATA_FORMATS = Table(direct_command.DataFormat)
+
+DIRECT_COMMAND_TYPES = Table(direct_command.CommandType)
+DIRECT_REPLY_TYPES = Table(direct_command.ReplyType)
+
+SYSTEM_COMMAND_TYPES = Table(system_command.CommandType)
+SYSTEM_REPLY_TYPES = Table(system_command.ReplyType)
+SYSTEM_COMMANDS = Table(system_command.Command)
+RETURN_CODES = Table(system_command.ReturnCode)
+
+SUBCODES = FrozenDict({
+    _Opcode.PROGRAM_INFO: Table(direct_command.ProgramInfoSubcode),
+    _Opcode.INFO:         Table(direct_command.InfoSubcode),
+    _Opcode.STRINGS:      Table(direct_command.StringSubcode),
+    _Opcode.UI_READ:      Table(direct_command.UIReadSubcode),
+    _Opcode.UI_WRITE:     Table(direct_command.UIWriteSubcode),
+    _Opcode.UI_BUTTON:    Table(direct_command.UIButtonSubcode),
+    _Opcode.UI_DRAW:      Table(direct_command.UIDrawSubcode),
+    _Opcode.SOUND:        Table(direct_command.SoundSubcode),
+    _Opcode.INPUT_DEVICE: Table(direct_command.InputDeviceSubcode),
+    _Opcode.FILE:         Table(direct_command.FileSubcode),
+    _Opcode.ARRAY:        Table(direct_command.ArraySubcode),
+    _Opcode.FILENAME:     Table(direct_command.FilenameSubcode),
+    _Opcode.COM_GET:      Table(direct_command.COMGetSubcodes),
+    _Opcode.COM_SET:      Table(direct_command.COMSetSubcode),
+    _Opcode.TST:          Table(direct_command.TstSubcode)})
+
+# The names that an EV3 object provides on behalf of the public functions of
+# the system_command module that take an ev3_obj as their first parameter and
+# of DirectCommand (without the 'add_' prefix).
+SYSTEM_COMMAND_NAMES = frozenset(k for k, v in vars(system_command).items()
+                                    if (not k.startswith('_') and
+                                        isinstance(v, types.FunctionType) and
+                                        (['ev3_obj'] ==
+                                            inspect.getargspec(v).args[:1])))
+
+DIRECT_COMMAND_NAMES = frozenset(k[4:]
+                                    for k in vars(direct_command.DirectCommand)
+                                    if k.startswith('add_'))
@@ -0,0 +1,196 @@
+"""Records the frames that are exchanged with the brick and replays them.
+
+A TraceWriter is installed with message.set_trace_writer (or by using it as
+a context manager) and appends a record for every frame that is written to
+or read from a port. The file is opened in append mode with a large buffer
+so tracing can be left on; call flush to make sure that the latest records
+are on disk.
+
+The file starts with TRACE_MAGIC and each record is a TRACE_RECORD header
+followed by the frame's bytes (without the length/message_counter header):
+
+    double  Timestamp (seconds since the epoch)
+    u8      Direction (Direction.TX or Direction.RX)
+    u16     Message counter
+    u16     Number of bytes that follow
+
+All values are little endian. Frames from every port in the process are
+recorded to the same file.
+
+EXAMPLE USAGE:
+    from ev3 import *
+
+    with trace.TraceWriter('session.ev3trace'):
+        with ev3.EV3() as brick:
+            brick.list_files(ev3.KnownPaths.PROJECTS_PATH)
+
+    with ev3.EV3() as brick:
+        for result in trace.replay(brick, 'session.ev3trace'):
+            print result
+
+"""
+
+
+import struct
+import threading
+import time
+
+import message
+
+
+TRACE_MAGIC = 'EV3TRACE\x01'
+TRACE_RECORD = struct.Struct('<dBHH')
+
+DEFAULT_BUFFER_SIZE = (64 * 1024)
+
+
+class TraceError(Exception):
+    """Subclass for reporting errors."""
+    pass
+
+
+class Direction(object):
+    """Which way a frame was travelling."""
+    TX  = 0 # To the brick
+    RX  = 1 # From the brick
+
+
+class TraceWriter(object):
+    """Appends frames to a trace file."""
+
+
+    def __init__(self, path_str, buffer_size=DEFAULT_BUFFER_SIZE):
+        """Opens the file at path_str for appending (it is created if it
+        doesn't exist) but doesn't start recording. See start.
+
+        """
+        self._lock = threading.Lock()
+        self._file = open(path_str, 'ab', buffer_size)
+
+        if (0 == self._file.tell()):
+            self._file.write(TRACE_MAGIC)
+
+
+    def start(self):
+        """Starts recording the frames on every port."""
+        message.set_trace_writer(self)
+
+
+    def stop(self):
+        """Stops recording if this object is the one that is installed."""
+        if (message._trace_writer is self):
+            message.set_trace_writer(None)
+
+
+    def record_tx(self, message_counter, msg):
+        """Appends a frame that was written to a port."""
+        self._record(Direction.TX, message_counter, msg)
+
+
+    def record_rx(self, message_counter, msg):
+        """Appends a frame that was read from a port."""
+        self._record(Direction.RX, message_counter, msg)
+
+
+    def flush(self):
+        """Writes the buffered records to the file."""
+        with self._lock:
+            self._file.flush()
+
+
+    def close(self):
+        """Stops recording and closes the file."""
+        self.stop()
+
+        with self._lock:
+            self._file.close()
+
+
+    def _record(self, direction, message_counter, msg):
+        record = (TRACE_RECORD.pack(time.time(), direction,
+                                    (message_counter & 0xFFFF), len(msg)) +
+                                                        str(bytearray(msg)))
+
+        with self._lock:
+            self._file.write(record)
+
+
+    def __enter__(self):
+        self.start()
+        return self
+
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+
+def read_trace(path_str):
+    """Generates a (TIMESTAMP, Direction, MESSAGE_COUNTER, MSG) tuple for each
+    record in the trace file, in the order that they were recorded. MSG is a
+    bytearray.
+
+    """
+    with open(path_str, 'rb') as trace_file:
+        if (TRACE_MAGIC != trace_file.read(len(TRACE_MAGIC))):
+            raise TraceError('Not a trace file: %s' % path_str)
+
+        while (True):
+            header = trace_file.read(TRACE_RECORD.size)
+
+            if (not header):
+                break
+
+            if (TRACE_RECORD.size != len(header)):
+                raise TraceError('Truncated record in: %s' % path_str)
+
+            timestamp, direction, message_counter, msg_len = (
+                                                TRACE_RECORD.unpack(header))
+
+            msg = trace_file.read(msg_len)
+
+            if (msg_len != len(msg)):
+                raise TraceError('Truncated record in: %s' % path_str)
+
+            yield (timestamp, direction, message_counter, bytearray(msg))
+
+
+def replay(ev3_obj, path_str, realtime=True):
+    """Sends the frames that were written to the brick in the trace file to
+    the given EV3 object with their original message counters. If realtime
+    is True then the frames are sent at the pace at which they were recorded
+    (unless the replies take longer); otherwise they are sent as fast as
+    possible.
+
+    Returns a list of (MESSAGE_COUNTER, MSG, REPLY, ELAPSED_S) tuples where
+    REPLY is None for frames that don't expect a reply and ELAPSED_S is the
+    time that the frame took to send (including its reply).
+
+    """
+    results = []
+
+    first_timestamp = None
+    start = time.time()
+
+    for timestamp, direction, message_counter, msg in read_trace(path_str):
+        if (Direction.TX != direction):
+            continue
+
+        if (first_timestamp is None):
+            first_timestamp = timestamp
+
+        if (realtime):
+            delay = ((timestamp - first_timestamp) - (time.time() - start))
+            if (0 < delay):
+                time.sleep(delay)
+
+        sent = time.time()
+
+        reply = None
+        if (message.msg_expects_reply(msg)):
+            reply = ev3_obj.send_message_for_reply(msg, message_counter)
+        else:
+            ev3_obj.send_message(msg, message_counter)
+
+        results.append((message_counter, msg, reply, (time.time() - sent)))
+
+    return results
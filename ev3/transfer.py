@@ -0,0 +1,386 @@
+"""Transfers files and folders between the PC and the brick with optional
+compression.
+
+Compressed uploads pack the file or folder on the brick into a gzipped tar
+archive using the FILENAME PACK direct command, upload the archive, and
+unpack it locally. Compressed downloads do the reverse and finish with
+FILENAME UNPACK on the brick. The archive is deleted from the brick
+afterwards.
+
+Whether compression is used is decided by a TransferPolicy unless the caller
+specifies it. The policy compares the expected time of a plain transfer with
+the time that it takes to pack/unpack on the brick plus the transfer of the
+smaller archive. It learns the link's throughput, the typical compression
+ratio, and the brick's pack overhead from the transfers that it is used for.
+
+NOTE:   The archive replaces the extension of the file or folder with '.raf'
+        so an existing file with that name in the same folder is overwritten.
+
+EXAMPLE USAGE:
+    from ev3 import *
+
+    with ev3.EV3() as brick:
+        transfer.upload(brick, '../prjs/logger/log.rdf', 'log.rdf')
+        transfer.download(brick, '../prjs/sounds', 'sounds', compress=True)
+
+"""
+
+
+import hashlib
+import io
+import os
+import posixpath
+import tarfile
+import time
+
+import direct_command
+import system_command
+
+
+ARCHIVE_EXT = '.raf'
+
+# Roughly what is left of 115200 baud after the framing overhead.
+DEFAULT_BYTES_PER_S = 8000.0
+DEFAULT_COMPRESSION_RATIO = 0.5
+DEFAULT_PACK_OVERHEAD_S = 0.5
+
+# Files smaller than this are never worth the extra round trips.
+MIN_COMPRESS_BYTES = 4096
+
+# How much weight each new measurement carries.
+_SMOOTHING = 0.3
+
+
+class TransferError(Exception):
+    """Subclass for reporting errors."""
+    pass
+
+
+class TransferPolicy(object):
+    """Decides whether a transfer should be compressed. The estimates are
+    updated with exponential smoothing as transfers are measured.
+
+    """
+
+
+    def __init__(self, bytes_per_s=DEFAULT_BYTES_PER_S,
+                            compression_ratio=DEFAULT_COMPRESSION_RATIO,
+                            pack_overhead_s=DEFAULT_PACK_OVERHEAD_S,
+                            min_compress_bytes=MIN_COMPRESS_BYTES):
+        """Creates a new object with the given initial estimates."""
+        self.bytes_per_s = bytes_per_s
+        self.compression_ratio = compression_ratio
+        self.pack_overhead_s = pack_overhead_s
+        self.min_compress_bytes = min_compress_bytes
+
+
+    def should_compress(self, size, compressed_size=None):
+        """Returns True if compressing a transfer of size bytes is expected to
+        be faster. If the compressed size is already known (i.e. because the
+        archive was built locally) then it is used instead of the estimated
+        compression ratio.
+
+        """
+        if (size < self.min_compress_bytes):
+            return False
+
+        if (compressed_size is None):
+            compressed_size = (size * self.compression_ratio)
+
+        plain_s = (size / self.bytes_per_s)
+        compressed_s = (self.pack_overhead_s +
+                                    (compressed_size / self.bytes_per_s))
+
+        return (compressed_s < plain_s)
+
+
+    def record_transfer(self, num_bytes, elapsed_s):
+        """Updates the throughput estimate."""
+        if (0 < num_bytes and 0 < elapsed_s):
+            self.bytes_per_s = _smooth(self.bytes_per_s,
+                                                (num_bytes / elapsed_s))
+
+
+    def record_compression(self, size, compressed_size):
+        """Updates the compression ratio estimate."""
+        if (0 < size):
+            self.compression_ratio = _smooth(self.compression_ratio,
+                                                (float(compressed_size) / size))
+
+
+    def record_pack(self, elapsed_s):
+        """Updates the estimate of the time that packing or unpacking takes on
+        the brick.
+
+        """
+        self.pack_overhead_s = _smooth(self.pack_overhead_s, elapsed_s)
+
+
+DEFAULT_POLICY = TransferPolicy()
+
+
+def upload(ev3_obj, path_str, save_path_str, compress=None,
+                                                    policy=DEFAULT_POLICY):
+    """Uploads the file or folder at path_str on the brick to save_path_str on
+    the PC. If compress is None then the policy decides whether to pack it on
+    the brick first.
+
+    """
+    fs_cache = ev3_obj.fs_cache
+    is_dir = fs_cache.isdir(path_str)
+
+    if (compress is None):
+        compress = policy.should_compress(_brick_size(fs_cache, path_str,
+                                                                    is_dir))
+
+    if (not compress):
+        if (is_dir):
+            _upload_dir(ev3_obj, path_str, save_path_str, policy)
+        else:
+            _upload_file(ev3_obj, path_str, save_path_str, policy)
+        return
+
+    archive_path_str = _archive_path(path_str)
+
+    start = time.time()
+    cmd = direct_command.DirectCommand()
+    cmd.add_filename_pack(path_str)
+    cmd.add_filename_exist(archive_path_str)
+    archive_exists, = cmd.send(ev3_obj)
+    policy.record_pack(time.time() - start)
+
+    fs_cache.invalidate(archive_path_str)
+
+    if (not archive_exists):
+        raise TransferError('Failed to pack: %s' % path_str)
+
+    try:
+        archive = _upload_file(ev3_obj, archive_path_str, None, policy)
+    finally:
+        system_command.delete_path(ev3_obj, archive_path_str)
+
+    root = posixpath.basename(path_str.rstrip('/'))
+    size = 0
+
+    with tarfile.open(fileobj=io.BytesIO(bytes(bytearray(archive))),
+                                                        mode='r:gz') as tar:
+        for member in tar:
+            local_path = _member_path(member, root, save_path_str)
+
+            if (member.isdir()):
+                if (not os.path.isdir(local_path)):
+                    os.makedirs(local_path)
+            elif (member.isfile()):
+                with open(local_path, 'wb') as out_file:
+                    out_file.write(tar.extractfile(member).read())
+                size += member.size
+
+    policy.record_compression(size, len(archive))
+
+
+def _member_path(member, root, save_path_str):
+    """Returns the local path that the tar member is extracted to. Raises a
+    TransferError for links and for members that would end up outside of
+    save_path_str.
+
+    """
+    if (member.issym() or member.islnk()):
+        raise TransferError('Archive member is a link: %s' % member.name)
+
+    name = member.name
+    parts = name.split('/')
+
+    if (posixpath.isabs(name) or posixpath.pardir in parts or
+                                                        root != parts[0]):
+        raise TransferError('Unexpected archive member: %s' % name)
+
+    # Drop the root and the empty and '.' parts (i.e. 'root/./a//b/').
+    parts = [p for p in parts[1:] if p not in ('', posixpath.curdir)]
+
+    base_path = os.path.abspath(save_path_str)
+    local_path = os.path.abspath(os.path.join(base_path, *parts))
+
+    if (local_path != base_path and
+                    not local_path.startswith(base_path.rstrip(os.sep) +
+                                                                    os.sep)):
+        raise TransferError('Unexpected archive member: %s' % name)
+
+    return local_path
+
+
+def download(ev3_obj, save_path_str, file_path_str, compress=None,
+                                                    policy=DEFAULT_POLICY):
+    """Downloads the file or folder at file_path_str on the PC to
+    save_path_str on the brick. If compress is None then the policy decides
+    whether to send it as an archive that is unpacked on the brick.
+
+    """
+    save_path_str = save_path_str.rstrip('/')
+
+    size = 0
+    if (os.path.isdir(file_path_str)):
+        for dir_path, dir_names, file_names in os.walk(file_path_str):
+            for f in file_names:
+                size += os.path.getsize(os.path.join(dir_path, f))
+    else:
+        size = os.path.getsize(file_path_str)
+
+    if (compress is False or
+            (compress is None and size < policy.min_compress_bytes)):
+        _download(ev3_obj, save_path_str, file_path_str, policy)
+        return
+
+    buf = io.BytesIO()
+    with tarfile.open(fileobj=buf, mode='w:gz') as tar:
+        tar.add(file_path_str, arcname=posixpath.basename(save_path_str))
+    archive = buf.getvalue()
+
+    policy.record_compression(size, len(archive))
+
+    if (compress is None and not policy.should_compress(size, len(archive))):
+        _download(ev3_obj, save_path_str, file_path_str, policy)
+        return
+
+    archive_path_str = _archive_path(save_path_str)
+
+    _download_data(ev3_obj, archive_path_str, bytearray(archive), policy)
+
+    try:
+        start = time.time()
+        cmd = direct_command.DirectCommand()
+        cmd.add_filename_unpack(save_path_str)
+        # The reply isn't sent until the unpack has finished.
+        cmd.add_filename_exist(save_path_str)
+        exists, = cmd.send(ev3_obj)
+        policy.record_pack(time.time() - start)
+    finally:
+        system_command.delete_path(ev3_obj, archive_path_str)
+
+    ev3_obj.fs_cache.invalidate(save_path_str)
+
+    # The path may have existed before the unpack so it only succeeded if
+    # the brick holds the files from the archive.
+    if (not exists or
+            not _has_files(ev3_obj, save_path_str, _local_md5s(file_path_str))):
+        raise TransferError('Failed to unpack: %s' % save_path_str)
+
+
+def _local_md5s(path_str):
+    """Returns a dict of the MD5 sums of the file at path_str or of each of
+    the files in the folder at path_str keyed by their paths relative to
+    path_str (using '/' as the separator). A file's own key is ''.
+
+    """
+    if (not os.path.isdir(path_str)):
+        return {'': _md5(path_str)}
+
+    md5s = {}
+
+    for dir_path, dir_names, file_names in os.walk(path_str):
+        rel_dir = os.path.relpath(dir_path, path_str)
+        if (os.curdir == rel_dir):
+            rel_dir = ''
+        rel_dir = rel_dir.replace(os.sep, '/')
+
+        for f in file_names:
+            md5s[posixpath.join(rel_dir, f)] = _md5(os.path.join(dir_path, f))
+
+    return md5s
+
+
+def _md5(path_str):
+    with open(path_str, 'rb') as read_file:
+        return hashlib.md5(read_file.read()).hexdigest()
+
+
+def _has_files(ev3_obj, path_str, md5s):
+    """Returns True if each of the files in md5s (see _local_md5s) is on the
+    brick below path_str with the same MD5 sum.
+
+    """
+    try:
+        for rel_path, md5 in md5s.items():
+            stat = ev3_obj.fs_cache.stat(posixpath.join(path_str, rel_path))
+
+            if (stat is None or stat[0].lower() != md5):
+                return False
+    except system_command.SystemCommandError:
+        return False
+
+    return True
+
+
+def _archive_path(path_str):
+    return (posixpath.splitext(path_str.rstrip('/'))[0] + ARCHIVE_EXT)
+
+
+def _brick_size(fs_cache, path_str, is_dir):
+    if (not is_dir):
+        stat = fs_cache.stat(path_str)
+        if (stat is None):
+            raise TransferError('No such file: %s' % path_str)
+        return stat[1]
+
+    size = 0
+    for dir_path, dir_names, files in fs_cache.walk(path_str):
+        size += sum(f[1] for f in files)
+
+    return size
+
+
+def _upload_file(ev3_obj, path_str, save_path_str, policy):
+    start = time.time()
+    data = system_command.upload_file(ev3_obj, path_str)
+    policy.record_transfer(len(data), (time.time() - start))
+
+    if (save_path_str is None):
+        return data
+
+    with open(save_path_str, 'wb') as out_file:
+        out_file.write(bytes(bytearray(data)))
+
+
+def _upload_dir(ev3_obj, path_str, save_path_str, policy):
+    path_str = posixpath.normpath(path_str)
+
+    for dir_path, dir_names, files in ev3_obj.fs_cache.walk(path_str):
+        rel_dir = posixpath.relpath(dir_path, path_str)
+
+        local_dir = os.path.normpath(os.path.join(save_path_str,
+                                                        *rel_dir.split('/')))
+        if (not os.path.isdir(local_dir)):
+            os.makedirs(local_dir)
+
+        for md5, length, file_name in files:
+            _upload_file(ev3_obj, posixpath.join(dir_path, file_name),
+                                os.path.join(local_dir, file_name), policy)
+
+
+def _download(ev3_obj, save_path_str, file_path_str, policy):
+    if (not os.path.isdir(file_path_str)):
+        with open(file_path_str, 'rb') as read_file:
+            _download_data(ev3_obj, save_path_str,
+                                        bytearray(read_file.read()), policy)
+        return
+
+    for dir_path, dir_names, file_names in os.walk(file_path_str):
+        rel_dir = os.path.relpath(dir_path, file_path_str)
+
+        brick_dir = posixpath.normpath(posixpath.join(save_path_str,
+                                                *rel_dir.split(os.sep)))
+        system_command.create_dir(ev3_obj, brick_dir)
+
+        for f in file_names:
+            with open(os.path.join(dir_path, f), 'rb') as read_file:
+                _download_data(ev3_obj, posixpath.join(brick_dir, f),
+                                        bytearray(read_file.read()), policy)
+
+
+def _download_data(ev3_obj, save_path_str, data, policy):
+    start = time.time()
+    system_command.download_file(ev3_obj, save_path_str, data)
+    policy.record_transfer(len(data), (time.time() - start))
+
+
+def _smooth(estimate, sample):
+    return (((1.0 - _SMOOTHING) * estimate) + (_SMOOTHING * sample))
@@ -0,0 +1,148 @@
+"""Helpers that are shared by the tests.
+
+The tests run against the EmulatedBrick that the benchmarks use (see
+benchmarks/emulated_brick.py) so they don't need a brick. A ScriptedBrick
+adds the parts of the protocol that the benchmarks don't need.
+
+EXAMPLE USAGE:
+    -> % python -m unittest discover -s tests
+
+"""
+
+
+import os
+import struct
+import sys
+
+_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+sys.path.insert(0, _ROOT)
+sys.path.insert(0, os.path.join(_ROOT, 'benchmarks'))
+
+import emulated_brick
+
+from ev3 import ev3
+from ev3 import direct_command
+from ev3 import system_command
+
+
+Command = system_command.Command
+ReturnCode = system_command.ReturnCode
+
+
+class ScriptedBrick(emulated_brick.EmulatedBrick):
+    """An EmulatedBrick that also records each frame that it receives,
+    answers DirectCommands with scripted replies, fails chosen download
+    chunks, and supports BEGIN_GETFILE/CONTINUE_GETFILE.
+
+    """
+
+
+    def __init__(self, rtt_s=0.0, bytes_per_s=None):
+        emulated_brick.EmulatedBrick.__init__(self, rtt_s, bytes_per_s)
+
+        # Every frame without its length header.
+        self.frames = []
+
+        # The global variables of the replies to the next DirectCommands
+        # (the replies are zeroed once this is empty).
+        self.direct_replies = []
+
+        # The CONTINUE_DOWNLOAD chunks, numbered from 1, that fail.
+        self.failing_chunks = set()
+
+        self._chunk_count = 0
+
+
+    def push_unsolicited(self, msg):
+        """Queues a message that the brick sends on its own (i.e. a mailbox
+        write from a running program).
+
+        """
+        self._out_buf += struct.pack('<HH', (2 + len(msg)), 0)
+        self._out_buf += msg
+
+
+    def direct_frames(self):
+        """Returns the frames of the DirectCommands that were received."""
+        return [f for f in self.frames if f[2] in
+                        (direct_command.CommandType.DIRECT_COMMAND_REPLY,
+                        direct_command.CommandType.DIRECT_COMMAND_NO_REPLY)]
+
+
+    def system_frames(self, command):
+        """Returns the frames of the given system Command."""
+        return [f for f in self.frames if
+                    f[2] not in
+                        (direct_command.CommandType.DIRECT_COMMAND_REPLY,
+                        direct_command.CommandType.DIRECT_COMMAND_NO_REPLY) and
+                    command == f[3]]
+
+
+    def _handle_frame(self, frame):
+        self.frames.append(bytearray(frame))
+
+        if (direct_command.CommandType.DIRECT_COMMAND_REPLY == frame[2] and
+                                                        self.direct_replies):
+            message_counter = (frame[0] | (frame[1] << 8))
+            self._reply(message_counter, len(frame),
+                        bytearray([direct_command.ReplyType.DIRECT_REPLY]) +
+                                            self.direct_replies.pop(0))
+            return
+
+        emulated_brick.EmulatedBrick._handle_frame(self, frame)
+
+
+    def _handle_system_command(self, command, payload):
+        if (Command.CONTINUE_DOWNLOAD == command):
+            self._chunk_count += 1
+
+            if (self._chunk_count in self.failing_chunks):
+                return (ReturnCode.UNKNOWN_ERROR, bytearray([payload[0]]))
+        elif (Command.BEGIN_GETFILE == command):
+            max_len = struct.unpack_from('<H', bytes(payload[:2]))[0]
+            path_str = emulated_brick._path(payload[2:])
+
+            if (path_str not in self.files):
+                return (ReturnCode.UNKNOWN_ERROR, bytearray(5))
+
+            data = bytearray(self.files[path_str])
+            handle = self._new_handle([path_str, len(data[:max_len])])
+
+            return_code = ReturnCode.SUCCESS
+            if (len(data) <= max_len):
+                return_code = ReturnCode.END_OF_FILE
+
+            return (return_code, (bytearray(struct.pack('<IB', len(data),
+                                                handle)) + data[:max_len]))
+        elif (Command.CONTINUE_GETFILE == command):
+            handle = payload[0]
+            max_len = struct.unpack_from('<H', bytes(payload[1:3]))[0]
+
+            if (handle not in self._handles):
+                return (ReturnCode.UNKNOWN_HANDLE, bytearray([handle]))
+
+            path_str, offset = self._handles[handle]
+            data = bytearray(self.files.get(path_str, ''))
+            chunk = data[offset:(offset + max_len)]
+            self._handles[handle][1] = (offset + len(chunk))
+
+            return_code = ReturnCode.SUCCESS
+            if (len(data) <= (offset + len(chunk))):
+                return_code = ReturnCode.END_OF_FILE
+
+            return (return_code, (bytearray([handle]) +
+                                    struct.pack('<I', len(data)) + chunk))
+
+        return emulated_brick.EmulatedBrick._handle_system_command(self,
+                                                            command, payload)
+
+
+def connect(rtt_s=0.0, bytes_per_s=None, batch_window_s=None):
+    """Returns a tuple in the form (EV3, BRICK) where the open EV3 object is
+    attached to a new ScriptedBrick.
+
+    """
+    ev3_obj = ev3.EV3(batch_window_s=batch_window_s)
+    ev3_obj._port = ScriptedBrick(rtt_s, bytes_per_s)
+    return (ev3_obj, ev3_obj._port)
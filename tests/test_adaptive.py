@@ -0,0 +1,97 @@
+"""Tests the link model of the AdaptiveController."""
+
+
+import unittest
+
+import support
+
+from ev3 import adaptive
+from ev3 import direct_command
+
+
+class AdaptiveControllerTest(unittest.TestCase):
+
+
+    def test_fit(self):
+        controller = adaptive.AdaptiveController()
+
+        for i in range(50):
+            num_bytes = (100 + (i % 5) * 200)
+            controller.record(num_bytes, (0.02 + (0.0001 * num_bytes)))
+
+        self.assertAlmostEqual(0.02, controller.base_rtt_s)
+        self.assertAlmostEqual(0.0001, controller.s_per_byte)
+        self.assertAlmostEqual(0.12, controller.predict_s(1000))
+
+
+    def test_similar_sizes_refine_the_base(self):
+        controller = adaptive.AdaptiveController(s_per_byte=0.0001)
+
+        for i in range(20):
+            controller.record(100, 0.05)
+
+        self.assertEqual(0.0001, controller.s_per_byte)
+        self.assertAlmostEqual(0.04, controller.base_rtt_s)
+
+
+    def test_max_frame_bytes(self):
+        controller = adaptive.AdaptiveController(latency_target_s=0.1,
+                                                        base_rtt_s=0.05,
+                                                        s_per_byte=0.0001)
+
+        self.assertEqual((500 - 8), controller.max_frame_bytes())
+        self.assertEqual(4, controller.batch_size(123))
+        self.assertEqual(1, controller.batch_size(1000))
+
+        # A slow link still allows a command; a fast one is capped.
+        controller.base_rtt_s = 1.0
+        self.assertEqual(adaptive.MIN_FRAME_BYTES,
+                                                controller.max_frame_bytes())
+
+        controller.base_rtt_s = 0.0
+        controller.s_per_byte = 1e-9
+        self.assertEqual(direct_command.MAX_CMD_LEN,
+                                                controller.max_frame_bytes())
+
+
+    def test_batch_window(self):
+        controller = adaptive.AdaptiveController(latency_target_s=0.1,
+                                                        base_rtt_s=0.05,
+                                                        s_per_byte=0.0001)
+
+        self.assertAlmostEqual(0.0008, controller.batch_window_s())
+
+        controller.base_rtt_s = 0.2
+        self.assertEqual(0.0, controller.batch_window_s())
+
+
+    def test_window_size(self):
+        controller = adaptive.AdaptiveController(latency_target_s=0.1,
+                                                        base_rtt_s=0.03,
+                                                        s_per_byte=0.0001)
+
+        # The round trip of 100 bytes takes 4 times its airtime.
+        self.assertEqual(4, controller.window_size(100))
+
+        # Only a single 1000 byte frame fits in the target.
+        self.assertEqual(1, controller.window_size(1000))
+
+        controller.latency_target_s = 10.0
+        controller.base_rtt_s = 1.0
+        self.assertEqual(adaptive.MAX_WINDOW_SIZE,
+                                                controller.window_size(100))
+
+
+    def test_brick_records_round_trips(self):
+        brick, port = support.connect()
+
+        controller = adaptive.AdaptiveController()
+        brick.controller = controller
+
+        brick.ui_read_get_vbatt()
+
+        self.assertEqual(1.0, controller._w)
+
+
+if ('__main__' == __name__):
+    unittest.main()
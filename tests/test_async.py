@@ -0,0 +1,224 @@
+"""Tests the priority-lane executor in the async module."""
+
+
+import os
+import subprocess
+import sys
+import threading
+import unittest
+
+import support
+
+from ev3 import async
+
+
+Lane = async.Lane
+
+
+class PriorityExecutorTest(unittest.TestCase):
+
+
+    def setUp(self):
+        self.executor = async.PriorityExecutor()
+
+        # The worker waits on this so that calls can be queued behind it.
+        self.release = threading.Event()
+        self.executor.submit(Lane.BULK, self.release.wait, 5)
+
+
+    def tearDown(self):
+        self.release.set()
+        self.executor.stop()
+
+
+    def test_lanes_run_in_priority_order(self):
+        order = []
+
+        futures = [self.executor.submit(lane, order.append, lane)
+                            for lane in (Lane.BULK, Lane.TELEMETRY,
+                                            Lane.SAFETY, Lane.CONTROL)]
+        self.release.set()
+
+        for future in futures:
+            future.result(5)
+
+        self.assertEqual([Lane.SAFETY, Lane.CONTROL, Lane.TELEMETRY,
+                                                        Lane.BULK], order)
+
+
+    def test_exceptions_are_set_on_the_future(self):
+        def fail():
+            raise ValueError('failed')
+
+        future = self.executor.submit(Lane.CONTROL, fail)
+        self.release.set()
+
+        with self.assertRaises(ValueError):
+            future.result(5)
+
+        # The worker is still running.
+        self.assertEqual(2, self.executor.submit(Lane.CONTROL,
+                                                    (lambda: 2)).result(5))
+
+
+    def test_stop_cancels_waiting_calls(self):
+        future = self.executor.submit(Lane.CONTROL, (lambda: 1))
+
+        self.release.set()
+        self.executor.stop()
+
+        self.assertTrue(future.cancelled() or 1 == future.result(0))
+
+        with self.assertRaises(RuntimeError):
+            self.executor.submit(Lane.CONTROL, (lambda: 1))
+
+
+    def test_preemption_point(self):
+        order = []
+        started = threading.Event()
+        resume = threading.Event()
+
+        def upload():
+            order.append('upload start')
+            started.set()
+            resume.wait(5)
+
+            # Higher-priority calls run here, on this thread.
+            async.preemption_point()
+            order.append('upload end')
+
+        upload_future = self.executor.submit(Lane.BULK, upload)
+        self.release.set()
+        started.wait(5)
+
+        stop_future = self.executor.submit(Lane.SAFETY, order.append, 'stop')
+        self.assertTrue(self.executor.preemption_pending(Lane.BULK))
+        resume.set()
+
+        upload_future.result(5)
+        stop_future.result(5)
+
+        self.assertEqual(['upload start', 'stop', 'upload end'], order)
+
+
+    def test_keyboard_interrupt_propagates(self):
+        def interrupt():
+            raise KeyboardInterrupt()
+
+        future = async.futures.Future()
+
+        with self.assertRaises(KeyboardInterrupt):
+            self.executor._execute((future, interrupt, (), {}, None),
+                                                                Lane.CONTROL)
+
+        # Waiters aren't left hanging.
+        self.assertIsInstance(future.exception(0), KeyboardInterrupt)
+
+
+class SubmitLatestTest(unittest.TestCase):
+
+
+    def setUp(self):
+        self.executor = async.PriorityExecutor()
+
+        self.release = threading.Event()
+        self.executor.submit(Lane.BULK, self.release.wait, 5)
+
+
+    def tearDown(self):
+        self.release.set()
+        self.executor.stop()
+
+
+    def test_waiting_call_is_replaced(self):
+        speeds = []
+
+        first = self.executor.submit_latest(Lane.CONTROL, 'B', speeds.append,
+                                                                        10)
+        other = self.executor.submit_latest(Lane.CONTROL, 'C', speeds.append,
+                                                                        -5)
+        last = self.executor.submit_latest(Lane.CONTROL, 'B', speeds.append,
+                                                                        30)
+        self.release.set()
+
+        last.result(5)
+        other.result(5)
+
+        self.assertTrue(first.cancelled())
+
+        # The replacement keeps the place of the call that it replaced.
+        self.assertEqual([30, -5], speeds)
+
+
+    def test_key_is_released_once_the_call_starts(self):
+        speeds = []
+
+        self.release.set()
+        self.executor.submit_latest(Lane.CONTROL, 'B', speeds.append,
+                                                                10).result(5)
+        self.executor.submit_latest(Lane.CONTROL, 'B', speeds.append,
+                                                                20).result(5)
+
+        self.assertEqual([10, 20], speeds)
+
+
+    def test_stop_cancels_keyed_calls(self):
+        future = self.executor.submit_latest(Lane.CONTROL, 'B', (lambda: 1))
+
+        self.executor.stop(wait=False)
+
+        self.assertTrue(future.cancelled())
+
+
+class AsyncThreadTest(unittest.TestCase):
+
+
+    def test_put(self):
+        thread = async.AsyncThread()
+
+        future = thread.put((lambda a, b: (a + b)), (lambda r: (r * 2)), 1, 2)
+
+        self.assertEqual(6, future.result(5))
+
+        thread.stop()
+
+
+    def test_stop_does_not_wait(self):
+        thread = async.AsyncThread()
+        release = threading.Event()
+
+        thread.put(release.wait, (lambda r: r), 5)
+        thread.stop()
+
+        self.assertTrue(thread._thread.is_alive())
+
+        release.set()
+        thread._thread.join(5)
+
+
+class OptionalFuturesTest(unittest.TestCase):
+
+
+    def test_system_command_works_without_futures(self):
+        # Hides the concurrent package from a fresh interpreter.
+        script = '\n'.join([
+            'import sys',
+            'class Hide(object):',
+            '    def find_module(self, name, path=None):',
+            '        if (name.split(".")[0] == "concurrent"):',
+            '            return self',
+            '    def load_module(self, name):',
+            '        raise ImportError(name)',
+            'sys.meta_path.insert(0, Hide())',
+            'import support',
+            'from ev3 import system_command',
+            'brick, port = support.connect()',
+            'system_command.download_file(brick, "../prjs/a", "x" * 5000)',
+            'assert ("x" * 5000) == port.files["../prjs/a"]'])
+
+        self.assertEqual(0, subprocess.call([sys.executable, '-c', script],
+                                cwd=os.path.dirname(os.path.abspath(__file__))))
+
+
+if ('__main__' == __name__):
+    unittest.main()
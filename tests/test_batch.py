@@ -0,0 +1,105 @@
+"""Tests the CommandBatcher and the EV3 object's lock."""
+
+
+import struct
+import threading
+import unittest
+
+import support
+
+from ev3 import direct_command
+from ev3 import ev3
+
+
+class OwnedRLockTest(unittest.TestCase):
+
+
+    def test_is_held_by_the_current_thread_only(self):
+        lock = ev3._OwnedRLock()
+        held = []
+
+        with lock:
+            with lock:
+                self.assertTrue(lock.is_held())
+
+            # Still held after the inner release.
+            self.assertTrue(lock.is_held())
+
+            t = threading.Thread(target=(lambda: held.append(lock.is_held())))
+            t.start()
+            t.join()
+
+        self.assertEqual([False], held)
+        self.assertFalse(lock.is_held())
+
+
+    def test_release_without_acquire(self):
+        lock = ev3._OwnedRLock()
+
+        with self.assertRaises(RuntimeError):
+            lock.release()
+
+        self.assertFalse(lock.is_held())
+
+
+    def test_non_blocking_acquire(self):
+        lock = ev3._OwnedRLock()
+        acquired = []
+
+        with lock:
+            t = threading.Thread(
+                        target=(lambda: acquired.append(lock.acquire(False))))
+            t.start()
+            t.join()
+
+        self.assertEqual([False], acquired)
+
+
+class CommandBatcherTest(unittest.TestCase):
+
+
+    def setUp(self):
+        self.brick, self.port = support.connect(batch_window_s=0.2)
+
+
+    def test_calls_from_threads_share_a_command(self):
+        self.port.direct_replies.append(bytearray(struct.pack('<ff', 1.0,
+                                                                        2.0)))
+        start = threading.Event()
+        results = []
+
+        def read():
+            start.wait(5)
+            results.append(self.brick.ui_read_get_vbatt())
+
+        threads = [threading.Thread(target=read) for i in range(2)]
+        for t in threads:
+            t.start()
+
+        start.set()
+
+        for t in threads:
+            t.join(5)
+
+        self.assertEqual(1, len(self.port.direct_frames()))
+
+        # Each thread gets only the value of its own call.
+        self.assertEqual([(1.0,), (2.0,)], sorted(results))
+
+
+    def test_lock_holder_sends_at_once(self):
+        # i.e. a preempting call that runs in the middle of a transfer.
+        with self.brick.lock:
+            self.assertEqual((0.0,), self.brick.ui_read_get_vbatt())
+
+        self.assertEqual(1, len(self.port.direct_frames()))
+
+
+    def test_calls_without_values(self):
+        self.assertIsNone(self.brick.output_stop(
+                                            direct_command.OutputPort.ALL,
+                                            direct_command.StopType.BRAKE))
+
+
+if ('__main__' == __name__):
+    unittest.main()
@@ -0,0 +1,77 @@
+"""Smoke tests for the benchmark runner."""
+
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import support
+
+import run_benchmarks
+
+
+class BenchmarksTest(unittest.TestCase):
+
+
+    def test_every_benchmark_runs(self):
+        for name, (fn, unit) in run_benchmarks.BENCHMARKS.items():
+            step = fn()
+
+            self.assertLess(0, step(), name)
+
+
+    def test_run(self):
+        results = run_benchmarks.run(['dc_build'], 1, 0.0)
+
+        self.assertEqual(['dc_build'], list(results))
+        self.assertLess(0, results['dc_build'])
+
+
+    def test_baseline_names_benchmarks(self):
+        with open(run_benchmarks.DEFAULT_BASELINE) as baseline_file:
+            baseline = json.load(baseline_file)
+
+        for name in baseline['benchmarks']:
+            self.assertIn(name, run_benchmarks.BENCHMARKS)
+
+
+    def test_compare(self):
+        baseline = {'benchmarks': {'a': {'value': 100.0},
+                                    'b': {'value': 100.0,
+                                            'max_regression': 0.1}}}
+
+        comparison = run_benchmarks.compare({'a': 80.0, 'b': 80.0,
+                                                        'c': 1.0}, baseline)
+
+        self.assertEqual([('a', 80.0, 100.0, -0.2, False),
+                            ('b', 80.0, 100.0, -0.2, True),
+                            ('c', 1.0, None, None, False)],
+                                                        sorted(comparison))
+
+
+    def test_write_baseline(self):
+        tmp_dir = tempfile.mkdtemp()
+        path_str = os.path.join(tmp_dir, 'baseline.json')
+
+        try:
+            run_benchmarks.write_baseline(path_str, {'dc_build': 5.0},
+                            {'benchmarks': {
+                                'dc_build': {'value': 1.0,
+                                                'max_regression': 0.1},
+                                'upload': {'value': 2.0}}})
+
+            with open(path_str) as baseline_file:
+                benchmarks = json.load(baseline_file)['benchmarks']
+        finally:
+            shutil.rmtree(tmp_dir)
+
+        # The max_regression and the other benchmarks are kept.
+        self.assertEqual(5.0, benchmarks['dc_build']['value'])
+        self.assertEqual(0.1, benchmarks['dc_build']['max_regression'])
+        self.assertEqual({'value': 2.0}, benchmarks['upload'])
+
+
+if ('__main__' == __name__):
+    unittest.main()
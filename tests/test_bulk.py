@@ -0,0 +1,130 @@
+"""Tests the bulk delete/create tree operations in system_command."""
+
+
+import unittest
+
+import support
+
+from ev3 import system_command
+
+
+Command = system_command.Command
+
+
+class PlanTest(unittest.TestCase):
+
+
+    def test_plan_create_tree(self):
+        self.assertEqual(['../prjs', '../prjs/a', '../prjs/a/b',
+                                            '../prjs/a/c', '/media',
+                                                            '/media/card'],
+                        system_command.plan_create_tree(['../prjs/a/b/',
+                                                        '../prjs/a/c',
+                                                        '/media/card']))
+
+
+    def test_plan_delete_tree(self):
+        brick, port = support.connect()
+        port.dirs.update(['../prjs/p', '../prjs/p/s', '../prjs/p/s/t'])
+        port.files['../prjs/p/a'] = 'a'
+        port.files['../prjs/p/s/t/b'] = 'b'
+
+        # Files first and then directories, children ahead of parents.
+        self.assertEqual(['../prjs/p/a', '../prjs/p/s/t/b', '../prjs/p/s/t',
+                                                '../prjs/p/s', '../prjs/p'],
+                        system_command.plan_delete_tree(brick, '../prjs/p/'))
+
+
+class BulkTest(unittest.TestCase):
+
+
+    def setUp(self):
+        self.brick, self.port = support.connect()
+
+
+    def test_create_tree(self):
+        system_command.create_tree(self.brick, ['../prjs/a/b', '../prjs/c'])
+
+        self.assertTrue(set(['../prjs/a', '../prjs/a/b', '../prjs/c']) <=
+                                                            self.port.dirs)
+
+        # Nothing waits for a reply until the deepest directories are
+        # listed: one listing per distinct parent.
+        self.assertEqual(2, len(self.port.system_frames(Command.LIST_FILES)))
+
+
+    def test_create_tree_verifies_new_directories(self):
+        handle = self.port._handle_system_command
+
+        def drop_leaf(command, payload):
+            if (Command.CREATE_DIR == command and
+                                    str(payload).startswith('../prjs/a/b')):
+                return None
+
+            return handle(command, payload)
+
+        self.port._handle_system_command = drop_leaf
+
+        with self.assertRaises(system_command.SystemCommandError):
+            system_command.create_tree(self.brick, ['../prjs/a/b'])
+
+
+    def test_delete_tree(self):
+        self.port.dirs.update(['../prjs/p', '../prjs/p/s'])
+        self.port.files['../prjs/p/a'] = 'a'
+        self.port.files['../prjs/p/s/b'] = 'b'
+
+        system_command.delete_tree(self.brick, '../prjs/p')
+
+        self.assertEqual({}, self.port.files)
+        self.assertNotIn('../prjs/p', self.port.dirs)
+
+
+    def test_delete_tree_replans_a_stale_cache(self):
+        self.port.dirs.add('../prjs/p')
+        self.port.files['../prjs/p/a'] = 'a'
+
+        # Cache the listing and then add a file behind its back.
+        self.brick.fs_cache.ttl_s = None
+        self.brick.fs_cache.list_files('../prjs/p')
+        self.port.files['../prjs/p/b'] = 'b'
+
+        handle = self.port._handle_system_command
+
+        def keep_non_empty(command, payload):
+            # Like the brick, refuse to delete a directory that isn't empty.
+            if (Command.DELETE_FILE == command and
+                            '../prjs/p' == str(payload).rstrip('\0') and
+                            '../prjs/p/b' in self.port.files):
+                return None
+
+            return handle(command, payload)
+
+        self.port._handle_system_command = keep_non_empty
+
+        system_command.delete_tree(self.brick, '../prjs/p')
+
+        self.assertEqual({}, self.port.files)
+        self.assertNotIn('../prjs/p', self.port.dirs)
+
+
+    def test_run_bulk_invalidates_once(self):
+        invalidated = []
+        self.brick.fs_cache.invalidate = (lambda *paths:
+                                                invalidated.append(paths))
+
+        system_command.run_bulk(self.brick, [(Command.CREATE_DIR, '../prjs/a'),
+                                        (Command.CREATE_DIR, '../prjs/b')])
+
+        self.assertEqual([('../prjs/a', '../prjs/b')], invalidated)
+
+
+    def test_run_bulk_rejects_commands_that_reply(self):
+        with self.assertRaises(ValueError):
+            system_command.run_bulk(self.brick, [(Command.LIST_FILES, '.')])
+
+        self.assertEqual([], self.port.frames)
+
+
+if ('__main__' == __name__):
+    unittest.main()
@@ -0,0 +1,61 @@
+"""Tests building DirectCommands from definitions with a CommandSet."""
+
+
+import struct
+import unittest
+
+import support
+
+from ev3 import command_cache
+from ev3 import direct_command
+
+
+OutputPort = direct_command.OutputPort
+
+
+DEFINITIONS = {
+    'open_claw': [
+        ('output_speed', OutputPort.PORT_D, -10),
+        ('output_start', OutputPort.PORT_D),
+        ('output_stop', OutputPort.PORT_D, direct_command.StopType.BRAKE)],
+    'read_battery': [
+        ('ui_read_get_vbatt',)]}
+
+
+class CommandSetTest(unittest.TestCase):
+
+
+    def test_commands_match_built_ones(self):
+        commands = command_cache.CommandSet('arm', DEFINITIONS)
+
+        cmd = direct_command.DirectCommand()
+        cmd.add_output_speed(OutputPort.PORT_D, -10)
+        cmd.add_output_start(OutputPort.PORT_D)
+        cmd.add_output_stop(OutputPort.PORT_D, direct_command.StopType.BRAKE)
+
+        self.assertEqual('arm', commands.name)
+        self.assertEqual(['open_claw', 'read_battery'], commands.names())
+        self.assertIn('open_claw', commands)
+        self.assertNotIn('close_claw', commands)
+        self.assertEqual(cmd._msg, commands['open_claw']._msg)
+
+
+    def test_commands_are_sent_repeatedly(self):
+        brick, port = support.connect()
+        commands = command_cache.CommandSet('arm', DEFINITIONS)
+
+        port.direct_replies.extend([bytearray(struct.pack('<f', 7.5)),
+                                        bytearray(struct.pack('<f', 7.0))])
+
+        self.assertEqual((7.5,), commands['read_battery'].send(brick))
+        self.assertEqual((7.0,), commands['read_battery'].send(brick))
+        self.assertEqual(2, len(port.direct_frames()))
+
+
+    def test_unknown_func(self):
+        with self.assertRaises(command_cache.CommandCacheError):
+            command_cache.CommandSet('arm', {'fly': [('output_fly', 1)]})
+
+
+if ('__main__' == __name__):
+    unittest.main()
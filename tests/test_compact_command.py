@@ -0,0 +1,85 @@
+"""Tests that a CompactDirectCommand matches a DirectCommand."""
+
+
+import struct
+import unittest
+
+import support
+
+from ev3 import direct_command
+
+
+InputPort = direct_command.InputPort
+
+
+def _build(command_class):
+    cmd = command_class()
+
+    cmd.add_ui_read_get_lbatt()
+    cmd.add_input_device_get_typemode(InputPort.PORT_1)
+    cmd.add_ui_read_get_fw_vers()
+    cmd.add_input_device_get_minmax(InputPort.PORT_2)
+
+    return cmd
+
+
+class CompactDirectCommandTest(unittest.TestCase):
+
+
+    def send(self, cmd):
+        brick, port = support.connect()
+
+        # The version takes 64 bytes and the floats are aligned to 4.
+        port.direct_replies.append(bytearray([50, 29, 3]) +
+                                    'V1.09H'.ljust(64, '\0') + '\0' +
+                                    struct.pack('<ff', -1, 1))
+
+        return (cmd.send(brick), port.direct_frames())
+
+
+    def test_same_bytes_and_values(self):
+        compact = _build(direct_command.CompactDirectCommand)
+        cmd = _build(direct_command.DirectCommand)
+
+        self.assertEqual(len(cmd), len(compact))
+        self.assertEqual(cmd.value_count(), compact.value_count())
+
+        values, frames = self.send(compact)
+
+        self.assertEqual(self.send(cmd), (values, frames))
+        self.assertEqual((50, (29, 3), 'V1.09H', (-1.0, 1.0)), values)
+
+
+    def test_no_reply(self):
+        brick, port = support.connect()
+
+        cmd = direct_command.CompactDirectCommand()
+        cmd.add_output_stop(direct_command.OutputPort.ALL,
+                                            direct_command.StopType.BRAKE)
+
+        self.assertIsNone(cmd.send(brick))
+        self.assertEqual(direct_command.CommandType.DIRECT_COMMAND_NO_REPLY,
+                                                port.direct_frames()[0][2])
+
+
+    def test_size_is_checked_on_send(self):
+        brick, port = support.connect()
+
+        cmd = direct_command.CompactDirectCommand()
+        for i in range(direct_command.MAX_CMD_LEN):
+            cmd.add_ui_read_get_fw_vers()
+
+        with self.assertRaises(direct_command.DirectCommandError):
+            cmd.send(brick)
+
+        self.assertEqual([], port.frames)
+
+
+    def test_slots(self):
+        cmd = direct_command.CompactDirectCommand()
+
+        self.assertFalse(hasattr(cmd, '__dict__'))
+
+
+if ('__main__' == __name__):
+    unittest.main()
@@ -0,0 +1,72 @@
+"""Tests the system_command and DirectCommand shortcuts of EV3 objects."""
+
+
+import unittest
+
+import support
+
+from ev3 import ev3
+from ev3 import system_command
+
+
+class FacadeTest(unittest.TestCase):
+
+
+    def setUp(self):
+        self.brick, self.port = support.connect()
+
+
+    def test_system_command_shortcuts(self):
+        self.brick.download_file('../prjs/a', bytearray('abc'))
+
+        self.assertEqual('abc', self.port.files['../prjs/a'])
+        self.assertEqual(system_command.download_file.__doc__,
+                                            ev3.EV3.download_file.__doc__)
+
+
+    def test_only_functions_that_take_an_ev3_obj(self):
+        # plan_create_tree only works with paths.
+        with self.assertRaises(AttributeError):
+            self.brick.plan_create_tree
+
+        self.assertNotIn('plan_create_tree', dir(self.brick))
+        self.assertIn('plan_delete_tree', dir(self.brick))
+
+        with self.assertRaises(AttributeError):
+            self.brick.add_output_stop
+
+
+    def test_templates_send_the_same_bytes(self):
+        for name_str in ('a', 'b', 'a'):
+            self.brick.com_set_brickname(name_str)
+
+        frames = self.port.direct_frames()
+
+        self.assertEqual(frames[0], frames[2])
+        self.assertNotEqual(frames[0], frames[1])
+
+
+class TemplateKeyTest(unittest.TestCase):
+
+
+    def test_equal_args_of_other_types(self):
+        keys = set(ev3._template_key(args) for args in
+                                        [(1,), (1L,), (1.0,), (True,), ('1',)])
+
+        self.assertEqual(5, len(keys))
+        self.assertEqual(ev3._template_key((1, 'a')),
+                                                ev3._template_key((1, 'a')))
+
+
+    def test_other_types_are_not_kept(self):
+        class Port(object):
+            pass
+
+        self.assertIsNone(ev3._template_key((1, Port())))
+        self.assertIsNone(ev3._template_key(([1, 2],)))
+        self.assertIsNone(ev3._template_key((u'a',)))
+        self.assertEqual((), ev3._template_key(()))
+
+
+if ('__main__' == __name__):
+    unittest.main()
@@ -0,0 +1,79 @@
+"""Tests FileTail and tail_file in system_command."""
+
+
+import unittest
+
+import support
+
+from ev3 import system_command
+
+
+_PATH = '../prjs/log.txt'
+
+
+class FileTailTest(unittest.TestCase):
+
+
+    def setUp(self):
+        self.brick, self.port = support.connect()
+        self.port.files[_PATH] = 'a,1\nb,2\n'
+
+
+    def test_reads_only_appended_bytes(self):
+        with system_command.FileTail(self.brick, _PATH) as tail:
+            self.assertEqual('a,1\nb,2\n', tail.read())
+            self.assertEqual('', tail.read())
+
+            # More than fits in one reply.
+            appended = ('x' * 2500) + '\n'
+            self.port.files[_PATH] += appended
+
+            self.assertEqual(appended, tail.read())
+            self.assertEqual(len(self.port.files[_PATH]), tail.offset)
+
+
+    def test_starts_at_offset(self):
+        with system_command.FileTail(self.brick, _PATH, offset=4) as tail:
+            self.assertEqual('b,2\n', tail.read())
+
+
+    def test_reopens_a_closed_handle(self):
+        with system_command.FileTail(self.brick, _PATH) as tail:
+            tail.read()
+
+            # The brick dropped the handle.
+            self.port._handles.clear()
+            self.port.files[_PATH] += 'c,3\n'
+
+            self.assertEqual('c,3\n', tail.read())
+
+
+    def test_truncation_releases_the_old_handle(self):
+        with system_command.FileTail(self.brick, _PATH) as tail:
+            tail.read()
+
+            # Each replacement is shorter than what was read so the tail
+            # notices it.
+            for i in range(5):
+                data = (('n' * (6 - i)) + '\n')
+                self.port.files[_PATH] = data
+
+                self.assertEqual(data, tail.read())
+                self.assertEqual(1, len(self.port._handles))
+
+        self.assertEqual({}, self.port._handles)
+
+
+    def test_tail_file(self):
+        self.port.files[_PATH] += 'c,3\npartial'
+
+        records = list(system_command.tail_file(self.brick, _PATH,
+                                                        poll_interval_s=0.01,
+                                                        timeout_s=0.05))
+
+        # The partial record is held back until it is complete.
+        self.assertEqual(['a,1', 'b,2', 'c,3'], records)
+
+
+if ('__main__' == __name__):
+    unittest.main()
@@ -0,0 +1,116 @@
+"""Tests running calls on several bricks with a Fleet."""
+
+
+import threading
+import unittest
+
+import support
+
+from ev3 import direct_command
+from ev3 import ev3
+from ev3 import fleet
+
+
+def _fail(ev3_obj):
+    raise ev3.EV3Error('The link failed.')
+
+
+class FleetTest(unittest.TestCase):
+
+
+    def setUp(self):
+        self.fleet = fleet.Fleet({'right': 'port1', 'left': 'port0'},
+                                            timeout_s=1.0, quarantine_s=60.0)
+        self.ports = {}
+
+        for name in self.fleet.names():
+            port = support.ScriptedBrick()
+            self.fleet.brick(name)._port = port
+            self.ports[name] = port
+
+
+    def tearDown(self):
+        self.fleet.close()
+
+
+    def test_send_to_every_brick(self):
+        self.ports['left'].direct_replies.append(bytearray([1]))
+        self.ports['right'].direct_replies.append(bytearray([2]))
+
+        cmd = direct_command.DirectCommand()
+        cmd.add_ui_read_get_lbatt()
+
+        results = self.fleet.send(cmd)
+
+        # A dict of ports is ordered by name.
+        self.assertEqual(['left', 'right'], list(results))
+
+        self.assertEqual((1,), results['left'].value)
+        self.assertEqual((2,), results['right'].value)
+        self.assertIsNone(results['left'].error)
+        self.assertLessEqual(0.0, results['left'].latency_s)
+
+
+    def test_run_on_named_bricks(self):
+        results = self.fleet.run((lambda ev3_obj, x: x), (3,), ['right'])
+
+        self.assertEqual(['right'], list(results))
+        self.assertEqual(3, results['right'].value)
+
+        with self.assertRaises(fleet.FleetError):
+            self.fleet.run((lambda ev3_obj: None), names=['middle'])
+
+
+    def test_link_failures_quarantine_the_brick(self):
+        results = self.fleet.run(_fail, names=['left'])
+
+        self.assertIsInstance(results['left'].error, ev3.EV3Error)
+        self.assertEqual(['left'], self.fleet.quarantined())
+
+        results = self.fleet.run((lambda ev3_obj: 1))
+        self.assertIsInstance(results['left'].error, fleet.FleetError)
+        self.assertEqual(1, results['right'].value)
+
+        self.fleet.release('left')
+        self.assertEqual([], self.fleet.quarantined())
+
+
+    def test_other_errors_do_not_quarantine(self):
+        def fail(ev3_obj):
+            raise ValueError('bad args')
+
+        results = self.fleet.run(fail)
+
+        self.assertIsInstance(results['left'].error, ValueError)
+        self.assertEqual([], self.fleet.quarantined())
+
+
+    def test_timeout(self):
+        self.fleet.quarantine_s = 0.0
+        release = threading.Event()
+
+        results = self.fleet.run((lambda ev3_obj: release.wait(5)),
+                                            names=['left'], timeout_s=0.05)
+
+        self.assertIsInstance(results['left'].error, fleet.FleetError)
+        self.assertIsNone(results['left'].latency_s)
+
+        # Quarantine lasts until the stuck call has finished.
+        self.assertTrue(self.fleet.is_quarantined('left'))
+
+        release.set()
+        self.fleet._last_futures['left'].result(5)
+
+        self.assertFalse(self.fleet.is_quarantined('left'))
+
+
+    def test_list_of_ports(self):
+        bricks = fleet.Fleet(['port1', 'port0'])
+
+        self.assertEqual(['port1', 'port0'], bricks.names())
+
+        bricks.close()
+
+
+if ('__main__' == __name__):
+    unittest.main()
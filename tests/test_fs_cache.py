@@ -0,0 +1,137 @@
+"""Tests the brick filesystem metadata cache."""
+
+
+import unittest
+
+import support
+
+from ev3 import fs_cache
+from ev3 import system_command
+
+
+Command = system_command.Command
+
+
+class FileSystemCacheTest(unittest.TestCase):
+
+
+    def setUp(self):
+        self.brick, self.port = support.connect()
+
+        self.port.dirs.update(['../prjs/p', '../prjs/p/s'])
+        self.port.files['../prjs/p/a.rbf'] = 'abc'
+        self.port.files['../prjs/p/s/b.txt'] = 'x'
+
+        self.cache = self.brick.fs_cache
+
+
+    def test_queries(self):
+        self.assertTrue(self.cache.exists('../prjs/p/a.rbf'))
+        self.assertTrue(self.cache.exists('../prjs/p/s'))
+        self.assertFalse(self.cache.exists('../prjs/p/missing'))
+
+        self.assertTrue(self.cache.isdir('../prjs/p/s'))
+        self.assertFalse(self.cache.isdir('../prjs/p/a.rbf'))
+
+        self.assertEqual(3, self.cache.stat('../prjs/p/a.rbf')[1])
+        self.assertEqual('a.rbf', self.cache.stat('../prjs/p/a.rbf')[2])
+        self.assertIsNone(self.cache.stat('../prjs/p/missing'))
+
+
+    def test_walk(self):
+        walked = [(dir_path, dir_names, [f[2] for f in files])
+                    for dir_path, dir_names, files in
+                                            self.cache.walk('../prjs/p/')]
+
+        self.assertEqual([('../prjs/p', ['s'], ['a.rbf']),
+                            ('../prjs/p/s', [], ['b.txt'])], walked)
+
+
+    def test_listings_are_reused(self):
+        self.cache.exists('../prjs/p/a.rbf')
+        self.cache.stat('./../prjs/p/a.rbf')
+        self.cache.isdir('../prjs/p/s/')
+
+        self.assertEqual(1, len(self.port.system_frames(Command.LIST_FILES)))
+
+
+    def test_ttl(self):
+        self.cache.ttl_s = 0
+
+        self.cache.exists('../prjs/p/a.rbf')
+        self.cache.exists('../prjs/p/a.rbf')
+
+        self.assertEqual(2, len(self.port.system_frames(Command.LIST_FILES)))
+
+
+    def test_system_commands_invalidate(self):
+        self.assertIsNone(self.cache.stat('../prjs/p/s/new.txt'))
+
+        system_command.download_file(self.brick, '../prjs/p/s/new.txt',
+                                                        bytearray('1234'))
+        self.assertEqual(4, self.cache.stat('../prjs/p/s/new.txt')[1])
+
+        system_command.delete_path(self.brick, '../prjs/p/s/new.txt')
+        self.assertIsNone(self.cache.stat('../prjs/p/s/new.txt'))
+
+        system_command.create_dir(self.brick, '../prjs/p/t')
+        self.assertTrue(self.cache.isdir('../prjs/p/t'))
+
+
+class InvalidateTest(unittest.TestCase):
+
+
+    def setUp(self):
+        self.cache = fs_cache.FileSystemCache(None)
+
+
+    def test_relative(self):
+        self._fill('.', 'a', 'a/b', 'a/b/c', 'ab', '..', '../prjs')
+
+        self.cache.invalidate('a/b')
+
+        # The path, everything below it, and its parents.
+        self.assertEqual(['..', '../prjs', 'ab'], self._keys())
+
+
+    def test_default_directory(self):
+        self._fill('.', 'a', 'a/b', '..', '../prjs', '/media')
+
+        self.cache.invalidate('.')
+
+        # Paths that climb out of the default directory aren't below it.
+        self.assertEqual(['..', '../prjs', '/media'], self._keys())
+
+
+    def test_absolute(self):
+        self._fill('/', '/media', '/media/card', '/media/card/x', '/mediax',
+                                                                        'a')
+
+        self.cache.invalidate('/media/card')
+
+        self.assertEqual(['/mediax', 'a'], self._keys())
+
+        self.cache.invalidate('/')
+
+        self.assertEqual(['a'], self._keys())
+
+
+    def test_several_paths(self):
+        self._fill('.', '..', '../prjs', '../prjs/a', '../prjs/b', 'x', 'y')
+
+        self.cache.invalidate('../prjs/a', 'x')
+
+        self.assertEqual(['../prjs/b', 'y'], self._keys())
+
+
+    def _fill(self, *keys):
+        for key in keys:
+            self.cache._entries[key] = (0, (), ())
+
+
+    def _keys(self):
+        return sorted(self.cache._entries)
+
+
+if ('__main__' == __name__):
+    unittest.main()
@@ -0,0 +1,146 @@
+"""Tests sharing a brick between clients through a Gateway."""
+
+
+import os
+import shutil
+import struct
+import tempfile
+import threading
+import time
+import unittest
+
+import support
+
+from ev3 import direct_command
+from ev3 import gateway
+
+
+class GatewayTest(unittest.TestCase):
+
+
+    address = ('127.0.0.1', 0)
+
+
+    def setUp(self):
+        self.brick, self.port = support.connect()
+        self.gateway = gateway.Gateway(self.brick, self.address)
+
+        self.thread = threading.Thread(target=self.gateway.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+        self.remotes = []
+
+
+    def tearDown(self):
+        for remote in self.remotes:
+            remote.close()
+
+        self.gateway.shutdown()
+        self.thread.join(5)
+
+
+    def connect(self):
+        remote = gateway.RemoteEV3(self.gateway.address)
+        remote.open()
+        self.remotes.append(remote)
+        return remote
+
+
+    def test_direct_command(self):
+        self.port.direct_replies.append(bytearray(struct.pack('<f', 7.5)))
+
+        self.assertEqual((7.5,), self.connect().ui_read_get_vbatt())
+
+
+    def test_message_counters_are_restored(self):
+        msg = bytearray([direct_command.CommandType.DIRECT_COMMAND_REPLY, 0,
+                                                                        0])
+
+        remotes = [self.connect(), self.connect()]
+        replies = []
+
+        def send(remote, message_counter):
+            replies.append(remote.send_message_for_reply(msg,
+                                                            message_counter))
+
+        threads = [threading.Thread(target=send, args=(r, 0x1234))
+                                                            for r in remotes]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join(5)
+
+        # The replies only reach the clients if their counters match.
+        self.assertEqual(2, len(replies))
+
+        # Both clients used the same counter but the brick saw two.
+        counters = set(f[0] | (f[1] << 8) for f in self.port.direct_frames())
+        self.assertEqual(2, len(counters))
+
+
+    def test_system_command(self):
+        remote = self.connect()
+
+        remote.download_file('../prjs/a', bytearray('abc'))
+
+        self.assertEqual('abc', self.port.files['../prjs/a'])
+
+
+    def test_unsolicited_messages_reach_every_client(self):
+        remotes = [self.connect(), self.connect()]
+        received = [[], []]
+
+        for remote, msgs in zip(remotes, received):
+            remote.add_rx_handler(msgs.append)
+
+        # Clients are accepted in order so once a third client has been
+        # answered the first two are registered.
+        self.connect().ui_read_get_vbatt()
+
+        msg = bytearray([direct_command.CommandType.DIRECT_COMMAND_NO_REPLY,
+                                                                        1])
+        with self.brick.lock:
+            self.port.push_unsolicited(msg)
+
+        deadline = (time.time() + 5)
+        while ((not received[0] or not received[1]) and
+                                                    time.time() < deadline):
+            for remote in remotes:
+                remote.poll()
+            time.sleep(0.01)
+
+        self.assertEqual([[msg], [msg]], received)
+
+
+class UnixGatewayTest(GatewayTest):
+
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.address = os.path.join(self.tmp_dir, 'ev3.sock')
+
+        GatewayTest.setUp(self)
+
+
+    def tearDown(self):
+        GatewayTest.tearDown(self)
+
+        # The socket file is removed on shutdown.
+        self.assertFalse(os.path.exists(self.address))
+
+        shutil.rmtree(self.tmp_dir)
+
+
+class ParseAddressTest(unittest.TestCase):
+
+
+    def test_parse_address(self):
+        self.assertEqual(('localhost', 50400),
+                                gateway._parse_address('localhost:50400'))
+        self.assertEqual('/tmp/ev3.sock',
+                                gateway._parse_address('/tmp/ev3.sock'))
+
+
+if ('__main__' == __name__):
+    unittest.main()
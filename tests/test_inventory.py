@@ -0,0 +1,168 @@
+"""Tests tracking the connected devices with a DeviceInventory."""
+
+
+import threading
+import unittest
+
+import support
+
+from ev3 import direct_command
+from ev3 import inventory
+
+
+DeviceType = direct_command.DeviceType
+InputPort = direct_command.InputPort
+
+MASTER = direct_command.USB_CHAIN_LAYER_MASTER
+
+PORT_1 = (MASTER, InputPort.PORT_1)
+PORT_A = (MASTER, InputPort.PORT_A)
+
+
+def device_list(device_types, changed=False):
+    """Returns the reply to input_device_list for the given dict of
+    (LAYER, PORT) tuples to DeviceTypes.
+
+    """
+    reply = bytearray([DeviceType.PORT_EMPTY] * 32)
+
+    for key, device_type in device_types.items():
+        reply[inventory._list_index(key)] = device_type
+
+    return (reply + bytearray([int(changed)]))
+
+
+def scan(*ports):
+    """Returns the reply to a scan of the given (DEVICE_TYPE, MODE, NAME)
+    tuples.
+
+    """
+    reply = bytearray()
+
+    for device_type, mode, name in ports:
+        reply += bytearray([device_type, mode])
+        reply += name.ljust(direct_command.MAX_NAME_STR_LEN, '\0')
+
+    return reply
+
+
+class DeviceInventoryTest(unittest.TestCase):
+
+
+    def setUp(self):
+        self.brick, self.port = support.connect()
+        self.devices = inventory.DeviceInventory(self.brick,
+                                                    check_interval_s=None)
+
+        self.port.direct_replies.extend([
+                device_list({PORT_1: DeviceType.EV3_TOUCH,
+                                PORT_A: DeviceType.EV3_GYROSCOPE}),
+                scan((DeviceType.EV3_TOUCH, 0, 'TOUCH'),
+                        (DeviceType.EV3_GYROSCOPE, 1, 'GYRO'))])
+
+
+    def sent(self):
+        return len(self.port.direct_frames())
+
+
+    def test_first_lookup_scans(self):
+        self.assertEqual(inventory.PortInfo(MASTER, InputPort.PORT_1,
+                                    DeviceType.EV3_TOUCH, 0, 'TOUCH'),
+                                                        self.devices[PORT_1])
+        self.assertEqual('GYRO', self.devices[PORT_A].name)
+
+        empty = self.devices[(MASTER, InputPort.PORT_2)]
+        self.assertEqual(DeviceType.PORT_EMPTY, empty.device_type)
+        self.assertIsNone(empty.mode)
+
+        # The device list and one scan.
+        self.assertEqual(2, self.sent())
+
+        self.assertEqual([self.devices[PORT_A]],
+                                    self.devices.find(DeviceType.EV3_GYROSCOPE))
+        self.assertEqual(2, self.sent())
+
+
+    def test_keys_and_cached_never_send(self):
+        self.assertEqual(8, len(self.devices))
+        self.assertIn(PORT_1, self.devices)
+        self.assertNotIn((1, InputPort.PORT_1), self.devices)
+        self.assertIsNone(self.devices.cached(PORT_1))
+
+        self.assertEqual(0, self.sent())
+
+        self.devices.check()
+        self.assertEqual('TOUCH', self.devices.cached(PORT_1).name)
+        self.assertIsNone(self.devices.cached((1, InputPort.PORT_1)))
+
+
+    def test_check_without_changes(self):
+        self.devices.check()
+
+        self.port.direct_replies.append(device_list({
+                                        PORT_1: DeviceType.EV3_TOUCH,
+                                        PORT_A: DeviceType.EV3_GYROSCOPE}))
+
+        self.assertEqual([], self.devices.check())
+        self.assertEqual(3, self.sent())
+
+
+    def test_check_with_changes(self):
+        self.devices.check()
+        self.brick.input_device_get_name(InputPort.PORT_1)
+
+        self.port.direct_replies.extend([
+                                device_list({PORT_A: DeviceType.EV3_GYROSCOPE},
+                                                                        True),
+                                scan((DeviceType.EV3_GYROSCOPE, 1, 'GYRO'))])
+
+        self.assertEqual([PORT_1], self.devices.check())
+        self.assertEqual(DeviceType.PORT_EMPTY,
+                                        self.devices.cached(PORT_1).device_type)
+
+        # The cached names were invalidated.
+        sent = self.sent()
+        self.brick.input_device_get_name(InputPort.PORT_1)
+        self.assertEqual((sent + 1), self.sent())
+
+
+    def test_rescan(self):
+        self.devices.check()
+
+        self.port.direct_replies.extend([
+                device_list({PORT_1: DeviceType.EV3_TOUCH,
+                                PORT_A: DeviceType.EV3_GYROSCOPE}),
+                scan((DeviceType.EV3_TOUCH, 0, 'TOUCH'),
+                        (DeviceType.EV3_GYROSCOPE, 2, 'GYRO'))])
+
+        # The mode change isn't in the device list.
+        self.assertEqual([PORT_A], self.devices.rescan())
+        self.assertEqual(2, self.devices[PORT_A].mode)
+
+
+    def test_threads_share_a_scan(self):
+        self.brick, self.port = support.connect(rtt_s=0.01)
+        self.port.direct_replies.append(device_list({}))
+
+        devices = inventory.DeviceInventory(self.brick)
+
+        threads = [threading.Thread(target=devices.__getitem__,
+                                                    args=(PORT_1,))
+                                                            for i in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join(5)
+
+        # Only the device list is read because every port is empty.
+        self.assertEqual(1, self.sent())
+
+
+    def test_invalid_layer(self):
+        with self.assertRaises(inventory.InventoryError):
+            inventory.DeviceInventory(self.brick,
+                                    (direct_command.MAX_CHAIN_LAYERS,))
+
+
+if ('__main__' == __name__):
+    unittest.main()
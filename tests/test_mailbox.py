@@ -0,0 +1,121 @@
+"""Tests the mailbox channel."""
+
+
+import struct
+import unittest
+
+import support
+
+from ev3 import direct_command
+from ev3 import mailbox
+from ev3 import system_command
+
+
+Command = system_command.Command
+
+
+def _mailbox_msg(name_str, payload):
+    """Returns a mailbox write in the form that the brick sends it."""
+    name_str += '\0'
+
+    return (bytearray([system_command.CommandType.SYSTEM_COMMAND_NO_REPLY,
+                                Command.WRITEMAILBOX, len(name_str)]) +
+                    name_str + struct.pack('<H', len(payload)) + payload)
+
+
+class EncodingTest(unittest.TestCase):
+
+
+    def test_round_trip(self):
+        for value, encoding in (('follow', mailbox.Encoding.TEXT),
+                                (12.5, mailbox.Encoding.NUMBER),
+                                (True, mailbox.Encoding.LOGIC),
+                                (False, mailbox.Encoding.LOGIC)):
+            self.assertEqual(value, mailbox.decode(mailbox.encode(value,
+                                                    encoding), encoding))
+
+
+    def test_formats(self):
+        self.assertEqual(bytearray('ab\0'),
+                            mailbox.encode('ab', mailbox.Encoding.TEXT))
+        self.assertEqual(bytearray(struct.pack('<f', 2.0)),
+                            mailbox.encode(2, mailbox.Encoding.NUMBER))
+        self.assertEqual(bytearray([1]),
+                            mailbox.encode(5, mailbox.Encoding.LOGIC))
+
+        with self.assertRaises(mailbox.MailboxError):
+            mailbox.encode(1, 'nope')
+
+
+class MailboxChannelTest(unittest.TestCase):
+
+
+    def setUp(self):
+        self.brick, self.port = support.connect()
+        self.channel = mailbox.MailboxChannel(self.brick)
+
+        self.writes = []
+        write = self.port.write
+
+        def counted_write(data):
+            self.writes.append(data)
+            return write(data)
+
+        self.port.write = counted_write
+
+
+    def tearDown(self):
+        self.channel.close()
+
+
+    def test_writes_are_coalesced(self):
+        self.channel.write_number('speed', 50)
+        self.channel.write_text('mode', 'follow')
+        self.channel.write_number('speed', 60)
+
+        self.assertEqual([], self.writes)
+
+        self.channel.flush()
+
+        self.assertEqual(1, len(self.writes))
+
+        # The second write to 'speed' replaced the first (and went to the
+        # back of the queue).
+        frames = self.port.system_frames(Command.WRITEMAILBOX)
+        self.assertEqual(2, len(frames))
+        self.assertIn(bytearray('follow\0'), frames[0])
+        self.assertIn(bytearray(struct.pack('<f', 60.0)), frames[1])
+
+
+    def test_large_writes_are_split(self):
+        for i in range(4):
+            self.channel.write_raw(('box%d' % i), bytearray(400))
+
+        self.channel.flush()
+
+        self.assertEqual(2, len(self.writes))
+        self.assertEqual(4, len(self.port.system_frames(Command.WRITEMAILBOX)))
+
+
+    def test_read(self):
+        self.port.push_unsolicited(_mailbox_msg('distance',
+                                                    struct.pack('<f', 12.5)))
+
+        # The message arrives ahead of a reply and is handed to the channel.
+        cmd = direct_command.DirectCommand()
+        cmd.add_ui_read_get_vbatt()
+        cmd.send(self.brick)
+
+        self.port.push_unsolicited(_mailbox_msg('msg', 'hello\0'))
+
+        self.assertEqual(12.5, self.channel.read_number('distance'))
+        self.assertEqual('hello', self.channel.read_text('msg'))
+
+
+    def test_read_timeout(self):
+        with self.assertRaises(mailbox.MailboxError):
+            self.channel.read_text('msg', timeout_s=0.02)
+
+
+if ('__main__' == __name__):
+    unittest.main()
@@ -0,0 +1,208 @@
+"""Tests the message framing and the value encoding helpers."""
+
+
+import struct
+import unittest
+
+import support
+
+from ev3 import direct_command
+from ev3 import message
+from ev3 import system_command
+
+
+class EncodingTest(unittest.TestCase):
+
+
+    def test_append(self):
+        byte_list = bytearray()
+
+        message.append_u8(byte_list, 0x1FF)
+        message.append_u16(byte_list, 0x10203)
+        message.append_u32(byte_list, 0x01020304)
+        message.append_float(byte_list, 1.5)
+        message.append_str(byte_list, 'ab')
+        message.append_str(byte_list, 'c\0')
+
+        self.assertEqual(bytearray('\xFF\x03\x02\x04\x03\x02\x01') +
+                                struct.pack('<f', 1.5) + 'ab\0c\0', byte_list)
+
+
+    def test_parse_any_byte_sequence(self):
+        data = (struct.pack('<HIf', 0x0102, 0x03040506, 2.5) + 'abc\0de')
+
+        for byte_seq in (data, bytearray(data), list(bytearray(data)),
+                                                            memoryview(data)):
+            self.assertEqual(0x0102, message.parse_u16(byte_seq, 0))
+            self.assertEqual(0x03040506, message.parse_u32(byte_seq, 2))
+            self.assertEqual(2.5, message.parse_float(byte_seq, 6))
+            self.assertEqual('abc\0de', message.parse_str(byte_seq, 10))
+            self.assertEqual('ab', message.parse_str(byte_seq, 10, 2))
+            self.assertEqual('abc', message.parse_null_terminated_str(
+                                                            byte_seq, 10, 6))
+            self.assertEqual('ab', message.parse_null_terminated_str(
+                                                            byte_seq, 10, 2))
+
+
+    def test_frame_message(self):
+        msg = bytearray([direct_command.CommandType.DIRECT_COMMAND_REPLY, 1])
+
+        expected = bytearray([4, 0, 0x34, 0x12]) + msg
+
+        for byte_seq in (msg, bytes(msg), list(msg), memoryview(msg)):
+            self.assertEqual(expected, message.frame_message(byte_seq,
+                                                                0x11234))
+
+
+    def test_message_types(self):
+        for msg_type, expects_reply in (
+                (system_command.CommandType.SYSTEM_COMMAND_REPLY, True),
+                (system_command.CommandType.SYSTEM_COMMAND_NO_REPLY, False),
+                (direct_command.CommandType.DIRECT_COMMAND_REPLY, True),
+                (direct_command.CommandType.DIRECT_COMMAND_NO_REPLY, False)):
+            for msg in (bytearray([msg_type, 0]), chr(msg_type),
+                                        [msg_type], memoryview(chr(msg_type))):
+                self.assertEqual(expects_reply,
+                                            message.msg_expects_reply(msg))
+                self.assertTrue(message.msg_is_unsolicited(msg))
+
+        reply = bytearray([direct_command.ReplyType.DIRECT_REPLY])
+        self.assertFalse(message.msg_expects_reply(reply))
+        self.assertFalse(message.msg_is_unsolicited(reply))
+
+
+    def test_write_messages(self):
+        brick, port = support.connect()
+
+        no_reply = direct_command.CommandType.DIRECT_COMMAND_NO_REPLY
+        msgs = [bytearray([no_reply, 0, 0, i]) for i in range(3)]
+        message.write_messages(port, msgs)
+
+        self.assertEqual(msgs, [f[2:] for f in port.frames])
+
+        msgs.append(bytearray([
+                        direct_command.CommandType.DIRECT_COMMAND_REPLY]))
+        with self.assertRaises(message.MessageError):
+            message.write_messages(port, msgs)
+
+
+class _Port(object):
+    """A port that returns the bytes that it was created with and counts the
+    reads.
+
+    """
+
+
+    def __init__(self, data, has_in_waiting=True):
+        self.data = bytearray(data)
+        self.reads = 0
+
+        if (not has_in_waiting):
+            self.inWaiting = None
+
+
+    def read(self, num_bytes):
+        self.reads += 1
+
+        data = bytes(self.data[:num_bytes])
+        del self.data[:num_bytes]
+
+        return data
+
+
+    def inWaiting(self):
+        return len(self.data)
+
+
+class _ReadintoPort(_Port):
+
+
+    def readinto(self, buf):
+        data = self.read(len(buf))
+        buf[:len(data)] = data
+        return len(data)
+
+
+def _frames(count):
+    return ''.join(bytes(message.frame_message(bytearray([3, i, i]), i))
+                                                        for i in range(count))
+
+
+class FrameReaderTest(unittest.TestCase):
+
+
+    def test_waiting_frames_are_read_at_once(self):
+        for port_class in (_Port, _ReadintoPort):
+            port = port_class(_frames(5))
+            reader = message.FrameReader(port)
+
+            messages = [reader.read_message() for i in range(5)]
+
+            self.assertEqual([(i, bytearray([3, i, i])) for i in range(5)],
+                                                                    messages)
+            self.assertEqual(1, port.reads)
+            self.assertEqual(0, reader.buffered())
+
+
+    def test_without_in_waiting(self):
+        port = _Port(_frames(2), False)
+        reader = message.FrameReader(port)
+
+        self.assertEqual([(0, bytearray([3, 0, 0])),
+                            (1, bytearray([3, 1, 1]))],
+                            [message.read_message(port, reader),
+                                                    reader.read_message()])
+
+        # The header and the rest of each frame are read separately.
+        self.assertEqual(4, port.reads)
+
+        # The header and the rest of each frame are read separately.
+        self.assertEqual(4, port.reads)
+
+
+    def test_buffer_is_reused(self):
+        for port_class in (_Port, _ReadintoPort):
+            port = port_class(_frames(5) * 20)
+            reader = message.FrameReader(port)
+
+            # Forces the unparsed bytes to be moved to the front.
+            reader._buf = bytearray(17)
+            reader._view = memoryview(reader._buf)
+
+            counters = [reader.read_message()[0] for i in range(100)]
+
+            self.assertEqual((range(5) * 20), counters)
+
+
+    def test_errors(self):
+        reader = message.FrameReader(_Port(_frames(1)[:-1]))
+
+        with self.assertRaises(message.MessageError):
+            reader.read_message()
+
+        reader = message.FrameReader(_Port('\x01\x00\x00'))
+
+        with self.assertRaises(message.MessageError):
+            reader.read_message()
+
+
+    def test_read_reply_dispatches_unsolicited(self):
+        # i.e. a mailbox write from a program that is running on the brick.
+        mailbox = bytearray([
+                system_command.CommandType.SYSTEM_COMMAND_NO_REPLY,
+                system_command.Command.WRITEMAILBOX])
+        reply = bytearray([direct_command.ReplyType.DIRECT_REPLY, 7])
+
+        port = _ReadintoPort(bytes(message.frame_message(mailbox, 0)) +
+                                    bytes(message.frame_message(reply, 9)))
+
+        received = []
+        message_counter, msg = message.read_reply(port, received.append,
+                                                message.FrameReader(port))
+
+        self.assertEqual((9, reply), (message_counter, msg))
+        self.assertEqual([mailbox], received)
+
+
+if ('__main__' == __name__):
+    unittest.main()
@@ -0,0 +1,117 @@
+"""Tests answering read-only queries from the QueryCache."""
+
+
+import unittest
+
+import support
+
+from ev3 import direct_command
+from ev3 import query_cache
+
+
+InputPort = direct_command.InputPort
+
+
+class QueryCacheTest(unittest.TestCase):
+
+
+    def setUp(self):
+        self.brick, self.port = support.connect()
+
+
+    def sent(self):
+        return len(self.port.direct_frames())
+
+
+    def test_replies_are_reused(self):
+        self.port.direct_replies.append(bytearray('V1.09H'.ljust(64, '\0')))
+
+        for i in range(3):
+            self.assertEqual(('V1.09H',), self.brick.ui_read_get_fw_vers())
+
+        self.assertEqual(1, self.sent())
+
+
+    def test_args_are_part_of_the_key(self):
+        self.brick.input_device_get_name(InputPort.PORT_1)
+        self.brick.input_device_get_name(InputPort.PORT_2)
+        self.brick.input_device_get_name(InputPort.PORT_1)
+
+        self.assertEqual(2, self.sent())
+
+
+    def test_ttl(self):
+        self.brick.query_cache.set_ttl('input_device_get_name', 0.0)
+
+        self.brick.input_device_get_name(InputPort.PORT_1)
+        self.brick.input_device_get_name(InputPort.PORT_1)
+
+        self.assertEqual(2, self.sent())
+        self.assertEqual(0.0, self.brick.query_cache.get_ttl(
+                                                    'input_device_get_name'))
+
+
+    def test_invalidate(self):
+        cache = self.brick.query_cache
+
+        self.brick.input_device_get_name(InputPort.PORT_1)
+        self.brick.input_device_get_name(InputPort.PORT_2)
+
+        cache.invalidate('input_device_get_name', InputPort.PORT_1)
+        self.brick.input_device_get_name(InputPort.PORT_2)
+        self.assertEqual(2, self.sent())
+
+        self.brick.input_device_get_name(InputPort.PORT_1)
+        self.assertEqual(3, self.sent())
+
+        cache.invalidate('input_device_get_name')
+        self.brick.input_device_get_name(InputPort.PORT_2)
+        self.assertEqual(4, self.sent())
+
+
+    def test_shortcuts_invalidate_queries(self):
+        self.brick.com_get_brickname()
+        self.brick.com_set_brickname('ev3')
+        self.brick.com_get_brickname()
+
+        self.assertEqual(3, self.sent())
+
+
+    def test_only_read_only_queries(self):
+        cache = self.brick.query_cache
+
+        with self.assertRaises(query_cache.QueryCacheError):
+            cache.set_ttl('output_stop', 1.0)
+
+        with self.assertRaises(query_cache.QueryCacheError):
+            query_cache.QueryCache(self.brick, {'com_set_brickname': 1.0})
+
+        with self.assertRaises(query_cache.QueryCacheError):
+            cache.get_ttl('ui_read_get_vbatt')
+
+        # Queries that aren't cached by default can be.
+        cache.set_ttl('ui_read_get_vbatt', None)
+        self.brick.ui_read_get_vbatt()
+        self.brick.ui_read_get_vbatt()
+
+        self.assertEqual(1, self.sent())
+
+
+    def test_close_clears_the_caches(self):
+        self.brick.ui_read_get_fw_vers()
+        self.brick.download_file('../prjs/a', bytearray('abc'))
+        self.brick.fs_cache.list_files('../prjs')
+
+        self.brick.close()
+
+        self.assertEqual({}, self.brick.query_cache._entries)
+        self.assertEqual({}, self.brick.fs_cache._entries)
+
+        self.brick._port = self.port
+        self.brick.ui_read_get_fw_vers()
+
+        self.assertEqual(2, self.sent())
+
+
+if ('__main__' == __name__):
+    unittest.main()
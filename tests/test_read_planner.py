@@ -0,0 +1,100 @@
+"""Tests planning and sending sensor reads with a ReadPlanner."""
+
+
+import struct
+import unittest
+
+import support
+
+from ev3 import direct_command
+from ev3 import inventory
+from ev3 import read_planner
+
+
+Read = read_planner.Read
+
+PORT = direct_command.InputPort.PORT_3
+OTHER_PORT = direct_command.InputPort.PORT_4
+
+MASTER = direct_command.USB_CHAIN_LAYER_MASTER
+
+
+class ReadPlannerTest(unittest.TestCase):
+
+
+    def setUp(self):
+        self.brick, self.port = support.connect()
+        self.planner = read_planner.ReadPlanner(self.brick)
+
+
+    def test_modes_are_grouped(self):
+        plan = self.planner.plan([Read(PORT, 0), Read(PORT, 2), Read(PORT, 0),
+                                                        Read(OTHER_PORT, 1)])
+
+        self.assertEqual([0, 2, 1, 3], plan.order)
+        self.assertEqual([(0, None, 0), (1, 0, 2), (3, None, 1)],
+                            [(s.index, s.from_mode, s.to_mode)
+                                                    for s in plan.switches])
+        self.assertAlmostEqual((3 * read_planner.DEFAULT_SWITCH_COST_S),
+                                                                plan.cost_s())
+
+
+    def test_current_mode_goes_first(self):
+        self.planner.set_mode(PORT, 2)
+
+        plan = self.planner.plan([Read(PORT, 0), Read(PORT, 2),
+                                            Read(PORT, read_planner.KEEP_MODE)])
+
+        self.assertEqual([2, 1, 0], plan.order)
+        self.assertEqual([(0, 2, 0)], [(s.index, s.from_mode, s.to_mode)
+                                                    for s in plan.switches])
+
+        self.planner.set_mode(PORT, None)
+        self.assertIsNone(self.planner.mode(PORT))
+
+
+    def test_read(self):
+        self.planner.set_mode(PORT, 0)
+
+        # The read in mode 0 goes first; the switch to mode 2 is timed.
+        self.port.direct_replies.append(bytearray(struct.pack('<fifi',
+                                                    1.5, 1000, 2.5, 41000)))
+
+        values = self.planner.read([Read(PORT, 2), Read(PORT, 0)])
+
+        self.assertEqual([2.5, 1.5], values)
+        self.assertEqual(2, self.planner.mode(PORT))
+        self.assertEqual([1, 0], self.planner.last_plan.order)
+        self.assertEqual({(MASTER, PORT, 0, 2): 0.04},
+                                                self.planner.switch_costs())
+
+        # The measurement replaces the estimate.
+        self.planner.set_mode(PORT, 0)
+        self.assertEqual(0.04, self.planner.plan([Read(PORT, 2)]).cost_s())
+
+
+    def test_unknown_modes_are_not_timed(self):
+        self.planner.read([Read(PORT, 2)])
+
+        self.assertEqual({}, self.planner.switch_costs())
+        self.assertEqual(2, self.planner.mode(PORT))
+
+
+    def test_planning_never_sends(self):
+        devices = inventory.DeviceInventory(self.brick)
+        planner = read_planner.ReadPlanner(self.brick, devices)
+
+        planner.plan([Read(PORT, 2)])
+        self.assertEqual([], self.port.frames)
+
+        # Modes from the inventory's last scan are used.
+        devices._ports = {(MASTER, PORT): inventory.PortInfo(MASTER, PORT,
+                                direct_command.DeviceType.EV3_COLOR, 2, 'C')}
+
+        self.assertEqual(2, planner.mode(PORT))
+        self.assertEqual([], planner.plan([Read(PORT, 2)]).switches)
+        self.assertEqual([], self.port.frames)
+
+
+if ('__main__' == __name__):
+    unittest.main()
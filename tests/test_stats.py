@@ -0,0 +1,149 @@
+"""Tests the message counters and latency histograms."""
+
+
+import gc
+import json
+import threading
+import unittest
+
+import support
+
+from ev3 import direct_command
+from ev3 import stats
+
+
+KEY = ('system_command', 'LIST_FILES')
+
+
+class StatsTest(unittest.TestCase):
+
+
+    def setUp(self):
+        self.stats = stats.Stats((0.01, 0.1))
+
+
+    def test_record(self):
+        self.stats.record(KEY, 0.005, 10, 20, 2)
+        self.stats.record(KEY, 0.05, 10)
+        self.stats.record(KEY, 1.0)
+        self.stats.record(KEY)
+
+        counters = self.stats.snapshot()[KEY]
+
+        self.assertEqual(4, counters['count'])
+        self.assertEqual(20, counters['tx_bytes'])
+        self.assertEqual(20, counters['rx_bytes'])
+        self.assertEqual(2, counters['pad_bytes'])
+        self.assertEqual(3, counters['latency_count'])
+        self.assertAlmostEqual(1.055, counters['latency_sum_s'])
+        self.assertEqual([(0.01, 1), (0.1, 1), (float('inf'), 1)],
+                                                counters['latency_buckets'])
+
+
+    def test_threads_that_exit_are_kept(self):
+        def record():
+            self.stats.record(KEY, 0.005)
+
+        for i in range(3):
+            t = threading.Thread(target=record)
+            t.start()
+            t.join()
+
+        del t
+        gc.collect()
+
+        self.stats.record(KEY, 0.005)
+
+        self.assertEqual(4, self.stats.snapshot()[KEY]['count'])
+
+        # The shards of the exited threads were folded into one.
+        self.assertEqual(1, len(self.stats._shards))
+
+
+    def test_reset(self):
+        self.stats.record(KEY, 0.005)
+        self.stats.reset()
+
+        self.assertEqual({}, self.stats.snapshot())
+
+        self.stats.record(KEY, 0.005)
+
+        self.assertEqual(1, self.stats.snapshot()[KEY]['count'])
+
+
+    def test_to_json(self):
+        self.stats.record(KEY, 0.005, 10)
+
+        counters = json.loads(self.stats.to_json())['system_command'][
+                                                                'LIST_FILES']
+
+        self.assertEqual(1, counters['count'])
+        self.assertEqual([['0.01', 1], ['0.1', 0], ['+Inf', 0]],
+                                                counters['latency_buckets'])
+
+
+    def test_to_prometheus(self):
+        self.stats.record(KEY, 0.005, 10)
+        self.stats.record(KEY, 0.05, 10)
+
+        lines = self.stats.to_prometheus().splitlines()
+        labels = 'kind="system_command",name="LIST_FILES"'
+
+        self.assertIn('ev3_messages_total{%s} 2' % labels, lines)
+        self.assertIn('ev3_tx_bytes_total{%s} 20' % labels, lines)
+
+        # The buckets are cumulative.
+        self.assertIn('ev3_latency_seconds_bucket{%s,le="0.01"} 1' % labels,
+                                                                        lines)
+        self.assertIn('ev3_latency_seconds_bucket{%s,le="0.1"} 2' % labels,
+                                                                        lines)
+        self.assertIn('ev3_latency_seconds_bucket{%s,le="+Inf"} 2' % labels,
+                                                                        lines)
+        self.assertIn('ev3_latency_seconds_count{%s} 2' % labels, lines)
+
+
+class BrickStatsTest(unittest.TestCase):
+
+
+    def setUp(self):
+        self.brick, self.port = support.connect()
+        self.brick.stats = stats.Stats()
+
+
+    def test_opcode_latency_matches_the_message(self):
+        self.brick.ui_read_get_vbatt()
+
+        snapshot = self.brick.stats.snapshot()
+
+        msg = snapshot[('direct_command', 'DIRECT_COMMAND_REPLY')]
+        opcode = snapshot[('opcode', 'UI_READ')]
+
+        self.assertEqual(1, opcode['count'])
+        self.assertEqual(msg['latency_sum_s'], opcode['latency_sum_s'])
+        self.assertEqual(msg['tx_bytes'], opcode['tx_bytes'])
+        self.assertEqual(msg['rx_bytes'], opcode['rx_bytes'])
+
+
+    def test_no_reply_has_no_latency(self):
+        self.brick.output_stop(direct_command.OutputPort.ALL,
+                                            direct_command.StopType.BRAKE)
+
+        opcode = self.brick.stats.snapshot()[('opcode', 'OUTPUT_STOP')]
+
+        self.assertEqual(1, opcode['count'])
+        self.assertEqual(0, opcode['latency_count'])
+
+
+    def test_system_commands(self):
+        self.brick.download_file('../prjs/a', bytearray('abc'))
+
+        snapshot = self.brick.stats.snapshot()
+
+        self.assertEqual(1, snapshot[('system_command',
+                                                'BEGIN_DOWNLOAD')]['count'])
+        self.assertEqual(1, snapshot[('system_command',
+                                            'CONTINUE_DOWNLOAD')]['count'])
+
+
+if ('__main__' == __name__):
+    unittest.main()
@@ -0,0 +1,98 @@
+"""Tests the differential directory sync in system_command."""
+
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import support
+
+from ev3 import system_command
+
+
+SyncAction = system_command.SyncAction
+
+_BRICK_PATH = '../prjs/proj'
+
+
+class SyncDirTest(unittest.TestCase):
+
+
+    def setUp(self):
+        self.local_dir = tempfile.mkdtemp()
+
+        self._write('main.rbf', 'main')
+        self._write(os.path.join('sounds', 'beep.rsf'), 'beep')
+        self._write(os.path.join('.hidden', 'state'), 'state')
+
+        self.brick, self.port = support.connect()
+
+
+    def tearDown(self):
+        shutil.rmtree(self.local_dir)
+
+
+    def test_creates_everything_on_an_empty_brick(self):
+        actions = system_command.sync_dir(self.brick, self.local_dir,
+                                                                _BRICK_PATH)
+
+        self.assertEqual([(SyncAction.CREATE_DIR, _BRICK_PATH),
+                            (SyncAction.CREATE_DIR, '../prjs/proj/.hidden'),
+                            (SyncAction.CREATE_DIR, '../prjs/proj/sounds'),
+                            (SyncAction.DOWNLOAD, '../prjs/proj/.hidden/state'),
+                            (SyncAction.DOWNLOAD, '../prjs/proj/main.rbf'),
+                            (SyncAction.DOWNLOAD,
+                                        '../prjs/proj/sounds/beep.rsf')],
+                                                                    actions)
+        self.assertEqual('beep',
+                            self.port.files['../prjs/proj/sounds/beep.rsf'])
+
+
+    def test_second_sync_does_nothing(self):
+        system_command.sync_dir(self.brick, self.local_dir, _BRICK_PATH)
+
+        # Hidden directories are walked on both sides.
+        self.assertEqual([], system_command.sync_dir(self.brick,
+                                            self.local_dir, _BRICK_PATH))
+
+
+    def test_only_changes_are_sent(self):
+        system_command.sync_dir(self.brick, self.local_dir, _BRICK_PATH)
+
+        self._write('main.rbf', 'changed')
+        os.remove(os.path.join(self.local_dir, 'sounds', 'beep.rsf'))
+        os.rmdir(os.path.join(self.local_dir, 'sounds'))
+
+        actions = system_command.sync_dir(self.brick, self.local_dir,
+                                                                _BRICK_PATH)
+
+        self.assertEqual([(SyncAction.DOWNLOAD, '../prjs/proj/main.rbf'),
+                            (SyncAction.DELETE, '../prjs/proj/sounds/beep.rsf'),
+                            (SyncAction.DELETE, '../prjs/proj/sounds')],
+                                                                    actions)
+        self.assertEqual('changed', self.port.files['../prjs/proj/main.rbf'])
+        self.assertNotIn('../prjs/proj/sounds', self.port.dirs)
+
+
+    def test_dry_run_changes_nothing(self):
+        actions = system_command.sync_dir(self.brick, self.local_dir,
+                                                    _BRICK_PATH, dry_run=True)
+
+        self.assertTrue(actions)
+        self.assertNotIn(_BRICK_PATH, self.port.dirs)
+        self.assertEqual({}, self.port.files)
+
+
+    def _write(self, rel_path, data):
+        path = os.path.join(self.local_dir, rel_path)
+
+        if (not os.path.isdir(os.path.dirname(path))):
+            os.makedirs(os.path.dirname(path))
+
+        with open(path, 'wb') as out_file:
+            out_file.write(data)
+
+
+if ('__main__' == __name__):
+    unittest.main()
@@ -0,0 +1,100 @@
+"""Tests the lazy package imports and the lookup tables."""
+
+
+import os
+import subprocess
+import sys
+import unittest
+
+import support
+
+from ev3 import direct_command
+from ev3 import system_command
+from ev3 import tables
+
+
+_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+
+class LazyPackageTest(unittest.TestCase):
+
+
+    def run_script(self, *lines):
+        # A fresh interpreter so that no submodules have been imported yet.
+        return subprocess.call([sys.executable, '-c', '\n'.join(lines)],
+                                                                    cwd=_ROOT)
+
+
+    def test_submodules_are_imported_when_used(self):
+        self.assertEqual(0, self.run_script(
+                    'import sys',
+                    'import ev3',
+                    'assert "ev3.fleet" not in sys.modules',
+                    'assert "fleet" in dir(ev3)',
+                    'assert ev3.fleet is sys.modules["ev3.fleet"]',
+                    'assert "ev3.gateway" not in sys.modules'))
+
+
+    def test_import_star(self):
+        self.assertEqual(0, self.run_script(
+                    'from ev3 import *',
+                    'assert transfer.upload and read_planner.ReadPlanner'))
+
+
+    def test_unknown_name(self):
+        self.assertEqual(0, self.run_script(
+                    'import ev3',
+                    'try:',
+                    '    ev3.nope',
+                    'except AttributeError:',
+                    '    pass',
+                    'else:',
+                    '    raise SystemExit(1)'))
+
+
+class TableTest(unittest.TestCase):
+
+
+    def test_lookups(self):
+        self.assertEqual('UI_READ', tables.OPCODES.name(
+                                            direct_command.Opcode.UI_READ))
+        self.assertEqual(direct_command.Opcode.UI_READ,
+                                                tables.OPCODES['UI_READ'])
+        self.assertEqual('GET_VBATT', tables.SUBCODES[
+                                direct_command.Opcode.UI_READ].name(
+                                direct_command.UIReadSubcode.GET_VBATT))
+        self.assertEqual('END_OF_FILE', tables.RETURN_CODES.name(
+                                        system_command.ReturnCode.END_OF_FILE))
+        self.assertEqual('?', tables.OPCODES.name(-1, '?'))
+
+
+    def test_shared_values(self):
+        class Constants(object):
+            B = 1
+            A = 1
+            _PRIVATE = 2
+
+        table = tables.Table(Constants)
+
+        self.assertEqual('A', table.name(1))
+        self.assertEqual(['A', 'B'], sorted(table))
+        self.assertIsNone(table.name(2))
+
+
+    def test_tables_are_read_only(self):
+        with self.assertRaises(TypeError):
+            tables.OPCODES['UI_READ'] = 0
+
+        with self.assertRaises(TypeError):
+            tables.SUBCODES[0] = None
+
+
+    def test_facade_names(self):
+        self.assertIn('download_file', tables.SYSTEM_COMMAND_NAMES)
+        self.assertNotIn('_list_files', tables.SYSTEM_COMMAND_NAMES)
+
+        self.assertIn('ui_read_get_vbatt', tables.DIRECT_COMMAND_NAMES)
+
+
+if ('__main__' == __name__):
+    unittest.main()
@@ -0,0 +1,117 @@
+"""Tests recording and replaying traces."""
+
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import support
+
+from ev3 import direct_command
+from ev3 import message
+from ev3 import trace
+
+
+Direction = trace.Direction
+
+
+class TraceTest(unittest.TestCase):
+
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path_str = os.path.join(self.tmp_dir, 'session.ev3trace')
+
+
+    def tearDown(self):
+        message.set_trace_writer(None)
+        shutil.rmtree(self.tmp_dir)
+
+
+    def record_session(self):
+        brick, port = support.connect()
+
+        with trace.TraceWriter(self.path_str):
+            brick.download_file('../prjs/a', bytearray('abc'))
+            brick.output_stop(direct_command.OutputPort.ALL,
+                                            direct_command.StopType.BRAKE)
+
+        return port
+
+
+    def test_frames_are_recorded(self):
+        port = self.record_session()
+
+        records = list(trace.read_trace(self.path_str))
+
+        tx = [r[3] for r in records if Direction.TX == r[1]]
+        rx = [r[3] for r in records if Direction.RX == r[1]]
+
+        # The port's frames start with the message counter.
+        self.assertEqual([f[2:] for f in port.frames], tx)
+        self.assertEqual(2, len(rx))
+
+        timestamps = [r[0] for r in records]
+        self.assertEqual(sorted(timestamps), timestamps)
+
+
+    def test_replay(self):
+        self.record_session()
+
+        brick, port = support.connect()
+        results = trace.replay(brick, self.path_str, realtime=False)
+
+        self.assertEqual('abc', port.files['../prjs/a'])
+        self.assertEqual(3, len(results))
+
+        # The download's replies are kept and the stop didn't expect one.
+        self.assertIsNotNone(results[0][2])
+        self.assertIsNone(results[-1][2])
+
+
+    def test_appending_keeps_one_magic(self):
+        self.record_session()
+        count = len(list(trace.read_trace(self.path_str)))
+
+        self.record_session()
+
+        self.assertEqual((2 * count), len(list(trace.read_trace(
+                                                            self.path_str))))
+
+
+    def test_stop_only_removes_itself(self):
+        writer = trace.TraceWriter(self.path_str)
+        other = trace.TraceWriter(os.path.join(self.tmp_dir, 'other'))
+
+        other.start()
+        writer.stop()
+
+        self.assertIs(other, message._trace_writer)
+
+        writer.close()
+        other.close()
+
+        self.assertIsNone(message._trace_writer)
+
+
+    def test_not_a_trace(self):
+        with open(self.path_str, 'wb') as out_file:
+            out_file.write('not a trace')
+
+        with self.assertRaises(trace.TraceError):
+            list(trace.read_trace(self.path_str))
+
+
+    def test_truncated_record(self):
+        self.record_session()
+
+        with open(self.path_str, 'r+b') as out_file:
+            out_file.truncate(os.path.getsize(self.path_str) - 1)
+
+        with self.assertRaises(trace.TraceError):
+            list(trace.read_trace(self.path_str))
+
+
+if ('__main__' == __name__):
+    unittest.main()
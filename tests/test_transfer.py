@@ -0,0 +1,223 @@
+"""Tests the compressed transfers in the transfer module."""
+
+
+import io
+import os
+import posixpath
+import shutil
+import tarfile
+import tempfile
+import unittest
+
+import support
+
+from ev3 import direct_command
+from ev3 import transfer
+
+
+Subcode = direct_command.FilenameSubcode
+
+
+class PackingBrick(support.ScriptedBrick):
+    """A ScriptedBrick that runs DirectCommands that only hold FILENAME
+    EXIST, PACK, and UNPACK.
+
+    """
+
+
+    def __init__(self):
+        support.ScriptedBrick.__init__(self)
+
+        # Set to False to make FILENAME UNPACK do nothing.
+        self.unpacks = True
+
+
+    def _handle_frame(self, frame):
+        if (direct_command.CommandType.DIRECT_COMMAND_REPLY != frame[2] or
+                            direct_command.Opcode.FILENAME != frame[5]):
+            return support.ScriptedBrick._handle_frame(self, frame)
+
+        self.frames.append(bytearray(frame))
+
+        exists = 0
+        i = 5
+
+        while (i < len(frame)):
+            subcode = frame[i + 1]
+            end = frame.index('\0', (i + 3))
+            path_str = posixpath.normpath(str(frame[(i + 3):end]))
+            i = (end + 1)
+
+            if (Subcode.EXIST == subcode):
+                exists = int(path_str in self.files or path_str in self.dirs)
+
+                # The global variable that the result is stored in.
+                i += 2
+            elif (Subcode.PACK == subcode):
+                self.files[transfer._archive_path(path_str)] = self._pack(
+                                                                    path_str)
+            elif (Subcode.UNPACK == subcode and self.unpacks):
+                self._unpack(path_str)
+
+        self._reply((frame[0] | (frame[1] << 8)), len(frame),
+                    bytearray([direct_command.ReplyType.DIRECT_REPLY, exists]))
+
+
+    def _pack(self, path_str):
+        buf = io.BytesIO()
+
+        with tarfile.open(fileobj=buf, mode='w:gz') as tar:
+            for key in sorted(list(self.dirs) + list(self.files)):
+                if (key != path_str and not key.startswith(path_str + '/')):
+                    continue
+
+                info = tarfile.TarInfo(posixpath.basename(path_str) +
+                                                        key[len(path_str):])
+
+                if (key in self.files):
+                    info.size = len(self.files[key])
+                    tar.addfile(info, io.BytesIO(self.files[key]))
+                else:
+                    info.type = tarfile.DIRTYPE
+                    tar.addfile(info)
+
+        return buf.getvalue()
+
+
+    def _unpack(self, path_str):
+        archive = self.files[transfer._archive_path(path_str)]
+        parent = posixpath.dirname(path_str)
+
+        with tarfile.open(fileobj=io.BytesIO(archive), mode='r:gz') as tar:
+            for member in tar:
+                key = posixpath.join(parent, member.name)
+
+                if (member.isdir()):
+                    self.dirs.add(key)
+                else:
+                    self.files[key] = tar.extractfile(member).read()
+
+
+class TransferTest(unittest.TestCase):
+
+
+    def setUp(self):
+        self.local_dir = tempfile.mkdtemp()
+
+        self.brick = support.connect()[0]
+        self.port = self.brick._port = PackingBrick()
+
+        self.port.dirs.update(['../prjs/logs', '../prjs/logs/sub'])
+        self.port.files['../prjs/logs/a.rdf'] = ('1,2,3\n' * 3000)
+        self.port.files['../prjs/logs/sub/b.rdf'] = 'xyz'
+
+        self.policy = transfer.TransferPolicy()
+
+
+    def tearDown(self):
+        shutil.rmtree(self.local_dir)
+
+
+    def test_compressed_upload(self):
+        save_path = os.path.join(self.local_dir, 'logs')
+
+        transfer.upload(self.brick, '../prjs/logs', save_path,
+                                        compress=True, policy=self.policy)
+
+        self._assert_local_copy(save_path)
+
+        # The archive is deleted from the brick.
+        self.assertNotIn('../prjs/logs.raf', self.port.files)
+
+
+    def test_plain_upload(self):
+        save_path = os.path.join(self.local_dir, 'logs')
+
+        transfer.upload(self.brick, '../prjs/logs', save_path,
+                                        compress=False, policy=self.policy)
+
+        self._assert_local_copy(save_path)
+
+
+    def test_compressed_download(self):
+        save_path = os.path.join(self.local_dir, 'logs')
+        transfer.upload(self.brick, '../prjs/logs', save_path,
+                                        compress=False, policy=self.policy)
+
+        transfer.download(self.brick, '../prjs/copy', save_path,
+                                        compress=True, policy=self.policy)
+
+        self.assertEqual(self.port.files['../prjs/logs/a.rdf'],
+                                        self.port.files['../prjs/copy/a.rdf'])
+        self.assertEqual('xyz', self.port.files['../prjs/copy/sub/b.rdf'])
+        self.assertNotIn('../prjs/copy.raf', self.port.files)
+
+
+    def test_failed_unpack_over_existing_folder(self):
+        save_path = os.path.join(self.local_dir, 'logs')
+        transfer.upload(self.brick, '../prjs/logs', save_path,
+                                        compress=False, policy=self.policy)
+
+        with open(os.path.join(save_path, 'a.rdf'), 'wb') as out_file:
+            out_file.write('changed' * 1000)
+
+        # The folder already exists so FILENAME EXIST alone would pass.
+        self.port.unpacks = False
+
+        with self.assertRaises(transfer.TransferError):
+            transfer.download(self.brick, '../prjs/logs', save_path,
+                                        compress=True, policy=self.policy)
+
+        self.assertNotIn('../prjs/logs.raf', self.port.files)
+
+
+    def test_policy(self):
+        self.assertFalse(self.policy.should_compress(100))
+        self.assertTrue(self.policy.should_compress(1000000))
+
+        # An archive that is barely smaller isn't worth packing.
+        self.assertFalse(self.policy.should_compress(10000, 9900))
+
+
+    def _assert_local_copy(self, save_path):
+        with open(os.path.join(save_path, 'a.rdf'), 'rb') as read_file:
+            self.assertEqual(self.port.files['../prjs/logs/a.rdf'],
+                                                            read_file.read())
+
+        with open(os.path.join(save_path, 'sub', 'b.rdf'), 'rb') as read_file:
+            self.assertEqual('xyz', read_file.read())
+
+
+class MemberPathTest(unittest.TestCase):
+
+
+    def test_accepts_members_below_the_root(self):
+        base_path = os.path.abspath('out')
+
+        self.assertEqual(base_path, self._member_path('root'))
+        self.assertEqual(os.path.join(base_path, 'a', 'b'),
+                                            self._member_path('root/a/./b'))
+
+
+    def test_rejects_escaping_members(self):
+        for name in ('root/../../x', '/root/x', 'rootx/a', 'root/a/../../x',
+                                                                '..', 'x'):
+            with self.assertRaises(transfer.TransferError):
+                self._member_path(name)
+
+
+    def test_rejects_links(self):
+        for member_type in (tarfile.SYMTYPE, tarfile.LNKTYPE):
+            with self.assertRaises(transfer.TransferError):
+                self._member_path('root/link', member_type)
+
+
+    def _member_path(self, name, member_type=tarfile.REGTYPE):
+        member = tarfile.TarInfo(name)
+        member.type = member_type
+
+        return transfer._member_path(member, 'root', 'out')
+
+
+if ('__main__' == __name__):
+    unittest.main()
@@ -0,0 +1,76 @@
+"""Tests the windowed CONTINUE_DOWNLOAD pipeline in system_command."""
+
+
+import unittest
+
+import support
+
+from ev3 import system_command
+
+
+Command = system_command.Command
+
+_DATA = bytearray((i * 7) & 0xFF for i in range(10000))
+
+_PATH = '../prjs/data.bin'
+
+
+class WindowedDownloadTest(unittest.TestCase):
+
+
+    def test_lock_step(self):
+        brick, port = support.connect()
+
+        system_command.download_file(brick, _PATH, _DATA, window_size=1)
+
+        self.assertEqual(bytes(_DATA), port.files[_PATH])
+
+
+    def test_windowed(self):
+        brick, port = support.connect()
+
+        system_command.download_file(brick, _PATH, _DATA, window_size=4)
+
+        self.assertEqual(bytes(_DATA), port.files[_PATH])
+
+        chunks = port.system_frames(Command.CONTINUE_DOWNLOAD)
+        self.assertEqual(len(range(0, len(_DATA),
+                                    system_command.MAX_TX_BYTES)), len(chunks))
+
+        # Each chunk in the window has its own message counter.
+        counters = [(f[0] | (f[1] << 8)) for f in chunks]
+        self.assertEqual(len(counters), len(set(counters)))
+
+
+    def test_single_chunk(self):
+        brick, port = support.connect()
+
+        system_command.download_file(brick, _PATH, _DATA[:100], window_size=4)
+
+        self.assertEqual(bytes(_DATA[:100]), port.files[_PATH])
+
+
+    def test_failed_tail_of_window_is_resent(self):
+        brick, port = support.connect()
+
+        # The window is refilled as each reply arrives so chunks 5 and 6 are
+        # in flight when chunk 3 fails. None of the chunks after it are
+        # written so the transfer continues in lock-step from chunk 3.
+        port.failing_chunks = set([3, 4, 5, 6])
+
+        system_command.download_file(brick, _PATH, _DATA, window_size=4)
+
+        self.assertEqual(bytes(_DATA), port.files[_PATH])
+
+
+    def test_failed_chunk_before_later_chunks_raises(self):
+        brick, port = support.connect()
+
+        port.failing_chunks = set([2])
+
+        with self.assertRaises(system_command.SystemCommandError):
+            system_command.download_file(brick, _PATH, _DATA, window_size=4)
+
+
+if ('__main__' == __name__):
+    unittest.main()